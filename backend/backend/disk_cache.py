@@ -0,0 +1,117 @@
+"""
+Size bounded cache on the local disk, the least recently used entries are evicted first.\\
+Every entry is one file named by the hash of its key. Reading an entry updates the
+modification time of its file, which is the order of the eviction.
+The directory can be shared by several processes.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from functools import lru_cache
+
+
+class DiskLRUCache:
+    """
+    Args:
+        directory (str): folder of the cache files, created when the first entry is stored
+        max_size (int): max number of bytes of all entries
+        low_watermark (float, optional): an eviction removes entries until this fraction
+            of max_size is left, so not every new entry needs an eviction. Defaults to 0.9.
+    """
+
+    def __init__(self, directory: str, max_size: int, low_watermark: float = 0.9):
+        self.directory = directory
+        self.max_size = max_size
+        self.low_watermark = low_watermark
+        self._lock = threading.Lock()
+        # estimated size of the entries, None until the directory was scanned
+        self._size: int | None = None
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest())
+
+    def get(self, key: str) -> bytes | None:
+        """Content of the entry, None if it isn't cached"""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+            now = time.time_ns()
+            os.utime(path, ns=(now, now))
+        except FileNotFoundError:
+            # not cached or evicted by another process
+            return None
+        return data
+
+    def set(self, key: str, data: bytes):
+        """Stores an entry and evicts the least recently used entries if the cache is full"""
+        if len(data) > self.max_size:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        # written to a temporary file first, so readers never see half written entries
+        with tempfile.NamedTemporaryFile(
+            dir=self.directory, suffix=".tmp", delete=False
+        ) as file:
+            file.write(data)
+        os.replace(file.name, self._path(key))
+
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            else:
+                self._size += len(data)
+            if self._size > self.max_size:
+                self._evict()
+
+    def clear(self):
+        with self._lock:
+            for _, _, path in self._entries():
+                _remove(path)
+            self._size = 0
+
+    def _entries(self) -> list[tuple[int, int, str]]:
+        """(modification time, size, path) of all entries"""
+        entries = []
+        try:
+            with os.scandir(self.directory) as directory:
+                for entry in directory:
+                    if entry.name.endswith(".tmp"):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def _evict(self):
+        """Removes the least recently used entries until the low watermark is reached.
+        The size is recomputed from the directory, which includes entries of other processes.
+        """
+        entries = sorted(self._entries())
+        size = sum(size for _, size, _ in entries)
+        target = self.max_size * self.low_watermark
+        for _, entry_size, path in entries:
+            if size <= target:
+                break
+            _remove(path)
+            size -= entry_size
+        self._size = size
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+@lru_cache
+def get_cache(directory: str, max_size: int) -> DiskLRUCache:
+    """One cache object per directory and process, so the size estimate is shared"""
+    return DiskLRUCache(directory, max_size)
@@ -0,0 +1,254 @@
+"""
+Conversion of sensor_msgs/msg/Image messages to 8 bit frames for opencv.\\
+There is one converter per ROS image encoding in CONVERTERS. The converters work on
+views of the message data that respect the row step (padded rows) and the byte order,
+the data is only copied where opencv has to create a new image (e.g. color conversions).
+16 bit images are reduced to their high byte by a view with an offset of one byte
+instead of a division, depth images are drawn with a colormap.
+`benchmark` measures a converter, see `cli.py benchmark-encodings`.
+"""
+
+import time
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Any, Callable
+import cv2
+import numpy as np
+
+# depth in meters drawn with the brightest color of the colormap, larger depths are clipped
+DEPTH_MAX = 10.0
+
+# padding of the rows of the sample images, so the benchmarks include the strides
+SAMPLE_ROW_PADDING = 32
+
+# colormap of depth images, invalid depths (0 or NaN) are black
+_DEPTH_COLORS = cv2.applyColorMap(
+    np.arange(256, dtype=np.uint8).reshape(256, 1), cv2.COLORMAP_TURBO
+)
+_DEPTH_COLORS[0] = 0
+
+
+@dataclass(frozen=True)
+class Converter:
+    convert: Callable[[Any], np.ndarray]
+    # bytes per pixel of the encoding
+    pixel_size: int
+
+
+CONVERTERS: dict[str, Converter] = {}
+
+
+def converter(*encodings: str, pixel_size: int):
+    """Registers the decorated function as converter of the encodings"""
+
+    def register(convert: Callable[[Any], np.ndarray]):
+        for encoding in encodings:
+            CONVERTERS[encoding] = Converter(convert, pixel_size)
+        return convert
+
+    return register
+
+
+def to_frame(msg) -> np.ndarray:
+    """
+    Converts a sensor_msgs/msg/Image to a frame for opencv
+
+    Args:
+        msg: the deserialized message
+
+    Raises:
+        ValueError: if the encoding is not supported or the data is too short
+
+    Returns:
+        np.ndarray: 8 bit BGR (height, width, 3) or grayscale (height, width),
+            possibly a view of the message data
+    """
+    converter = CONVERTERS.get(msg.encoding)
+    if converter is None:
+        raise ValueError(f"Unsupported image encoding: {msg.encoding}")
+    return converter.convert(msg)
+
+
+def _view(msg, dtype: str, channels: int) -> np.ndarray:
+    """Array of shape (height, width[, channels]) on the message data without copying.
+    The rows are `step` bytes apart, the elements of a pixel `itemsize` bytes."""
+    dtype = np.dtype(dtype)
+    if dtype.itemsize > 1:
+        dtype = dtype.newbyteorder(">" if msg.is_bigendian else "<")
+    data = np.frombuffer(msg.data, dtype=np.uint8)
+    pixel_size = channels * dtype.itemsize
+    if msg.height and (
+        msg.step < msg.width * pixel_size
+        or len(data) < msg.step * (msg.height - 1) + msg.width * pixel_size
+    ):
+        raise ValueError(
+            f"{msg.encoding} image of {msg.width}x{msg.height} doesn't fit into "
+            f"{len(data)} bytes with step {msg.step}"
+        )
+    shape = (msg.height, msg.width, channels)
+    strides = (msg.step, pixel_size, dtype.itemsize)
+    if channels == 1:
+        shape, strides = shape[:2], strides[:2]
+    return np.ndarray(shape, dtype, buffer=data, strides=strides)
+
+
+def high_byte(words: np.ndarray) -> np.ndarray:
+    """The high bytes of a 16 bit array as 8 bit view, every second byte of the data.
+    Used for all 16 bit images, so videos and previews map them the same way."""
+    # the high byte comes first in big endian data
+    offset = 0 if words.dtype.str[0] == ">" else 1
+    return words.view(np.uint8)[..., offset::2]
+
+
+def _high_byte(msg, channels: int) -> np.ndarray:
+    """The high bytes of a 16 bit image message as 8 bit view"""
+    return high_byte(_view(msg, "u2", channels))
+
+
+def _native(array: np.ndarray) -> np.ndarray:
+    """opencv only reads data in the byte order of the machine"""
+    if array.dtype.isnative:
+        return array
+    return array.astype(array.dtype.newbyteorder("="))
+
+
+def colorize_depth(depth: np.ndarray, scale: float) -> np.ndarray:
+    """Draws a depth image with a colormap, the depth times scale is the color index"""
+    # saturating conversion to 8 bit in one pass, NaN becomes 0
+    return cv2.applyColorMap(
+        cv2.convertScaleAbs(_native(depth), alpha=scale), _DEPTH_COLORS
+    )
+
+
+@converter("mono8", "8UC1", pixel_size=1)
+def _mono8(msg) -> np.ndarray:
+    return _view(msg, "u1", 1)
+
+
+@converter("bgr8", "8UC3", pixel_size=3)
+def _bgr8(msg) -> np.ndarray:
+    return _view(msg, "u1", 3)
+
+
+@converter("rgb8", pixel_size=3)
+def _rgb8(msg) -> np.ndarray:
+    return cv2.cvtColor(_view(msg, "u1", 3), cv2.COLOR_RGB2BGR)
+
+
+@converter("bgra8", "8UC4", pixel_size=4)
+def _bgra8(msg) -> np.ndarray:
+    return cv2.cvtColor(_view(msg, "u1", 4), cv2.COLOR_BGRA2BGR)
+
+
+@converter("rgba8", pixel_size=4)
+def _rgba8(msg) -> np.ndarray:
+    return cv2.cvtColor(_view(msg, "u1", 4), cv2.COLOR_RGBA2BGR)
+
+
+@converter("mono16", pixel_size=2)
+def _mono16(msg) -> np.ndarray:
+    return _high_byte(msg, 1)
+
+
+@converter("bgr16", "16UC3", pixel_size=6)
+def _bgr16(msg) -> np.ndarray:
+    return _high_byte(msg, 3)
+
+
+@converter("rgb16", pixel_size=6)
+def _rgb16(msg) -> np.ndarray:
+    return cv2.cvtColor(_high_byte(msg, 3), cv2.COLOR_RGB2BGR)
+
+
+@converter("bgra16", "16UC4", pixel_size=8)
+def _bgra16(msg) -> np.ndarray:
+    return cv2.cvtColor(_high_byte(msg, 4), cv2.COLOR_BGRA2BGR)
+
+
+@converter("rgba16", pixel_size=8)
+def _rgba16(msg) -> np.ndarray:
+    return cv2.cvtColor(_high_byte(msg, 4), cv2.COLOR_RGBA2BGR)
+
+
+@converter("16UC1", pixel_size=2)
+def _depth_millimeters(msg) -> np.ndarray:
+    # depth images of ROS drivers in millimeters
+    return colorize_depth(_view(msg, "u2", 1), 255 / (DEPTH_MAX * 1000))
+
+
+@converter("32FC1", pixel_size=4)
+def _depth_meters(msg) -> np.ndarray:
+    return colorize_depth(_view(msg, "f4", 1), 255 / DEPTH_MAX)
+
+
+# opencv names the bayer patterns by the second row, the ROS encodings by the first
+_BAYER_CODES = {
+    "rggb": cv2.COLOR_BayerBG2BGR,
+    "bggr": cv2.COLOR_BayerRG2BGR,
+    "gbrg": cv2.COLOR_BayerGR2BGR,
+    "grbg": cv2.COLOR_BayerGB2BGR,
+}
+
+
+def _bayer8(code: int):
+    return lambda msg: cv2.cvtColor(_view(msg, "u1", 1), code)
+
+
+def _bayer16(code: int):
+    return lambda msg: cv2.cvtColor(_high_byte(msg, 1), code)
+
+
+for _pattern, _code in _BAYER_CODES.items():
+    converter(f"bayer_{_pattern}8", pixel_size=1)(_bayer8(_code))
+    converter(f"bayer_{_pattern}16", pixel_size=2)(_bayer16(_code))
+
+
+@converter("yuv422", "uyvy", pixel_size=2)
+def _uyvy(msg) -> np.ndarray:
+    return cv2.cvtColor(_view(msg, "u1", 2), cv2.COLOR_YUV2BGR_UYVY)
+
+
+@converter("yuv422_yuy2", "yuyv", pixel_size=2)
+def _yuyv(msg) -> np.ndarray:
+    return cv2.cvtColor(_view(msg, "u1", 2), cv2.COLOR_YUV2BGR_YUY2)
+
+
+def sample_image(encoding: str, width: int = 1920, height: int = 1080):
+    """Message of an encoding with random pixels and padded rows"""
+    step = width * CONVERTERS[encoding].pixel_size + SAMPLE_ROW_PADDING
+    data = np.random.default_rng(0).integers(0, 256, step * height, dtype=np.uint8)
+    return SimpleNamespace(
+        encoding=encoding,
+        width=width,
+        height=height,
+        step=step,
+        is_bigendian=0,
+        data=data,
+    )
+
+
+def benchmark(
+    encoding: str, width: int = 1920, height: int = 1080, repeat: int = 20
+) -> float:
+    """
+    Measures the converter of an encoding
+
+    Args:
+        encoding (str): one of CONVERTERS
+        width (int, optional): width of the sample image. Defaults to 1920.
+        height (int, optional): height of the sample image. Defaults to 1080.
+        repeat (int, optional): number of conversions. Defaults to 20.
+
+    Returns:
+        float: the fastest conversion in seconds
+    """
+    msg = sample_image(encoding, width, height)
+    convert = CONVERTERS[encoding].convert
+    fastest = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        frame = convert(msg)
+        # views are only read by the encoder, this includes reading them
+        np.ascontiguousarray(frame)
+        fastest = min(fastest, time.perf_counter() - start)
+    return fastest
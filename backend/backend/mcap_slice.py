@@ -0,0 +1,98 @@
+"""
+Time window slices of MCAP files.\\
+The chunk indexes in the summary of the file select the chunks overlapping the window
+(and containing the requested topics), only these chunks are read. The messages are
+written to a new MCAP file that is streamed while it is written, one chunk at a time.
+"""
+
+from typing import IO, Iterator
+from mcap.reader import SeekingReader, make_reader
+from mcap.writer import Writer
+
+
+class _OutputBuffer:
+    """Write only stream collecting the output of the writer until it is sent"""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.position = 0
+
+    def write(self, data: bytes) -> int:
+        self.data += data
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = bytes(self.data)
+        self.data.clear()
+        return data
+
+
+def slice_mcap(
+    source: IO[bytes], start: int, end: int, topics: list[str] | None = None
+) -> Iterator[bytes]:
+    """
+    Copies the messages of a time window into a new MCAP file.\\
+    The header and summary of the source are read immediately, so invalid files
+    raise before the first byte is sent.
+
+    Args:
+        source (IO[bytes]): seekable MCAP file, closed after the last byte is sent
+        start (int): first log time to include in nanoseconds
+        end (int): last log time to include in nanoseconds
+        topics (list[str] | None, optional): only include these topics.
+            Defaults to None (all topics).
+
+    Raises:
+        McapError: if the source is not a valid MCAP file
+
+    Returns:
+        Iterator[bytes]: the new MCAP file in parts
+    """
+    reader = make_reader(source)
+    header = reader.get_header()
+    if isinstance(reader, SeekingReader):
+        reader.get_summary()
+    return _write_slice(source, reader, header, start, end, topics)
+
+
+def _write_slice(source, reader, header, start, end, topics) -> Iterator[bytes]:
+    output = _OutputBuffer()
+    writer = Writer(output)
+    writer.start(profile=header.profile, library=header.library)
+    schema_ids: dict[int, int] = {}
+    channel_ids: dict[int, int] = {}
+    try:
+        # end of iter_messages is exclusive
+        for schema, channel, message in reader.iter_messages(topics, start, end + 1):
+            if channel.id not in channel_ids:
+                schema_id = 0
+                if schema is not None:
+                    if schema.id not in schema_ids:
+                        schema_ids[schema.id] = writer.register_schema(
+                            schema.name, schema.encoding, schema.data
+                        )
+                    schema_id = schema_ids[schema.id]
+                channel_ids[channel.id] = writer.register_channel(
+                    channel.topic, channel.message_encoding, schema_id, channel.metadata
+                )
+            writer.add_message(
+                channel_ids[channel.id],
+                message.log_time,
+                message.data,
+                message.publish_time,
+                message.sequence,
+            )
+            # the writer writes whole chunks
+            if output.data:
+                yield output.take()
+        writer.finish()
+        yield output.take()
+    finally:
+        source.close()
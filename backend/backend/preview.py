@@ -0,0 +1,258 @@
+"""
+Preview frames of the image topics (raw and compressed) of a mcap file at a timestamp.\\
+The message nearest to the timestamp is found with the chunk indexes of the file,
+only the chunks before and after the timestamp are read. The frames are downscaled,
+encoded as JPEG or WebP and kept in a size bounded cache on the disk.
+"""
+
+import base64
+import json
+from functools import lru_cache
+from typing import IO, Callable
+import cv2
+import numpy as np
+from django.conf import settings
+from mcap.reader import make_reader
+from mcap.records import Message, Schema
+from rosbags.typesys import (
+    Stores,
+    TypesysError,
+    get_types_from_idl,
+    get_types_from_msg,
+    get_typestore,
+)
+from rosbags.typesys.store import Typestore
+from . import image_encodings
+from .disk_cache import get_cache
+
+IMAGE_TYPE = "sensor_msgs/msg/Image"
+COMPRESSED_IMAGE_TYPE = "sensor_msgs/msg/CompressedImage"
+IMAGE_TYPES = (IMAGE_TYPE, COMPRESSED_IMAGE_TYPE)
+
+# file extension, content type and quality flag of the supported formats
+FORMATS = {
+    "jpeg": (".jpg", "image/jpeg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", "image/webp", cv2.IMWRITE_WEBP_QUALITY),
+}
+QUALITY = 80
+
+# used if the file has no message definitions
+typestore = get_typestore(Stores.ROS2_FOXY)
+
+# separates the definitions of the dependencies in a ros2idl schema
+IDL_SEPARATOR = "=" * 80 + "\n"
+
+
+class PreviewError(ValueError):
+    pass
+
+
+def image_topics(reader) -> dict[str, str]:
+    """Topics of the file with the message type sensor_msgs/msg/Image or CompressedImage,
+    sorted by name, with their message type"""
+    summary = reader.get_summary()
+    if summary is None:
+        return {}
+    schemas = {id: schema.name for id, schema in summary.schemas.items()}
+    topics = {
+        channel.topic: schemas.get(channel.schema_id)
+        for channel in summary.channels.values()
+    }
+    return {
+        topic: msgtype
+        for topic, msgtype in sorted(topics.items())
+        if msgtype in IMAGE_TYPES
+    }
+
+
+def nearest_message(reader, topic: str, timestamp: int) -> Message | None:
+    """
+    The message of a topic with the log time nearest to the timestamp.\\
+    Reads only the chunks with the last message before and the first message after the timestamp.
+    """
+    before = next(
+        reader.iter_messages([topic], end_time=timestamp + 1, reverse=True), None
+    )
+    after = next(reader.iter_messages([topic], start_time=timestamp), None)
+    messages = [item[2] for item in (before, after) if item is not None]
+    return min(
+        messages, key=lambda message: abs(message.log_time - timestamp), default=None
+    )
+
+
+def frame_from_image(msg) -> np.ndarray:
+    """Converts a sensor_msgs/msg/Image to an 8 bit BGR or grayscale array for opencv"""
+    try:
+        return image_encodings.to_frame(msg)
+    except ValueError as e:
+        raise PreviewError(str(e)) from e
+
+
+def is_jpeg(msg) -> bool:
+    """If a sensor_msgs/msg/CompressedImage contains a JPEG image"""
+    return "jpeg" in msg.format.lower() or "jpg" in msg.format.lower()
+
+
+def frame_from_compressed(msg) -> np.ndarray:
+    """Decodes a sensor_msgs/msg/CompressedImage (JPEG or PNG) to an 8 bit BGR or
+    grayscale array for opencv. opencv releases the GIL while decoding, so this
+    can run in threads."""
+    data = np.frombuffer(msg.data, dtype=np.uint8)
+    if "compresseddepth" in msg.format.lower():
+        # compressed depth images start with a 12 byte header before the png
+        data = data[12:]
+    frame = cv2.imdecode(data, cv2.IMREAD_UNCHANGED)
+    if frame is None:
+        raise PreviewError(f"Could not decode image with format '{msg.format}'")
+    if frame.dtype == np.uint16:
+        # reduce to 8 bit like the 16 bit encodings of raw images
+        frame = image_encodings.high_byte(frame)
+    if frame.ndim == 3 and frame.shape[2] == 4:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+    return frame
+
+
+@lru_cache(maxsize=64)
+def _typestore_of_definition(encoding: str, name: str, data: bytes) -> Typestore:
+    definition = data.decode()
+    if encoding == "ros2msg":
+        types = get_types_from_msg(definition, name)
+    elif definition.startswith(f"{IDL_SEPARATOR}IDL: "):
+        types = {}
+        for idl in definition.split(IDL_SEPARATOR)[1:]:
+            types.update(get_types_from_idl(idl.split("\n", 1)[1]))
+    else:
+        types = get_types_from_idl(definition)
+    store = get_typestore(Stores.EMPTY)
+    store.register(types)
+    return store
+
+
+def schema_typestore(schema: Schema | None) -> Typestore:
+    """
+    Typestore with the message definitions of a schema of the file,
+    parsed like AnyReader does.\
+    The Foxy typestore if the schema has no definitions.
+    """
+    if schema is None or not schema.data:
+        return typestore
+    if schema.encoding not in ("ros2msg", "ros2idl", "omgidl"):
+        raise PreviewError(f"Unsupported schema encoding {schema.encoding}")
+    try:
+        return _typestore_of_definition(schema.encoding, schema.name, schema.data)
+    except TypesysError as e:
+        raise PreviewError(f"Invalid message definition of {schema.name}: {e}")
+
+
+def downscale(frame: np.ndarray, max_size: int) -> np.ndarray:
+    """Shrinks the frame to at most max_size pixels on the longer side"""
+    height, width = frame.shape[:2]
+    scale = max_size / max(height, width)
+    if scale >= 1:
+        return frame
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+
+def encode_frame(frame: np.ndarray, image_format: str) -> bytes:
+    extension, _, quality_flag = FORMATS[image_format]
+    success, encoded = cv2.imencode(extension, frame, [quality_flag, QUALITY])
+    if not success:
+        raise PreviewError(f"Could not encode frame as {image_format}")
+    return encoded.tobytes()
+
+
+def _render_frame(
+    reader, topic: str, msgtype: str, timestamp: int, image_format: str, max_size: int
+):
+    message = nearest_message(reader, topic, timestamp)
+    if message is None:
+        return None
+    summary = reader.get_summary()
+    channel = summary.channels[message.channel_id]
+    store = schema_typestore(summary.schemas.get(channel.schema_id))
+    msg = store.deserialize_cdr(message.data, msgtype)
+    if msgtype == COMPRESSED_IMAGE_TYPE:
+        frame = frame_from_compressed(msg)
+    else:
+        frame = frame_from_image(msg)
+    frame = downscale(frame, max_size)
+    return {
+        "topic": topic,
+        "timestamp": message.log_time,
+        "width": frame.shape[1],
+        "height": frame.shape[0],
+        "content_type": FORMATS[image_format][1],
+        "data": base64.b64encode(encode_frame(frame, image_format)).decode(),
+    }
+
+
+def get_frames(
+    open_source: Callable[[], IO[bytes]],
+    version: str,
+    topics: list[str] | None,
+    timestamp: int,
+    image_format: str = "jpeg",
+    max_size: int = 320,
+) -> list[dict]:
+    """
+    Preview frames of image topics at a timestamp, cached on the disk
+
+    Args:
+        open_source (Callable[[], IO[bytes]]): opens the seekable mcap file, only called
+            if a frame is not cached
+        version (str): identifies the file and its version in the cache keys
+        topics (list[str] | None): image or compressed image topics,
+            None for all of them
+        timestamp (int): log time in nanoseconds
+        image_format (str, optional): one of FORMATS. Defaults to "jpeg".
+        max_size (int, optional): max width and height of the frames. Defaults to 320.
+
+    Raises:
+        PreviewError: if a topic is not an image topic of the file
+        McapError: if the file is not a valid mcap file
+
+    Returns:
+        list[dict]: one frame per topic with messages, with the log time of the message,
+            the size, the content type and the image as base64
+    """
+    cache = get_cache(settings.PREVIEW_CACHE_DIR, settings.PREVIEW_CACHE_MAX_SIZE)
+    source = None
+    reader = None
+
+    def get_reader():
+        nonlocal source, reader
+        if reader is None:
+            source = open_source()
+            reader = make_reader(source)
+        return reader
+
+    try:
+        if topics is None:
+            key = f"preview:{version}:topics"
+            cached = cache.get(key)
+            if cached is not None:
+                topics = json.loads(cached)
+            else:
+                topics = list(image_topics(get_reader()))
+                cache.set(key, json.dumps(topics).encode())
+        frames = []
+        for topic in topics:
+            key = f"preview:{version}:{topic}:{timestamp}:{image_format}:{max_size}"
+            cached = cache.get(key)
+            if cached is not None:
+                frame = json.loads(cached)
+            else:
+                msgtype = image_topics(get_reader()).get(topic)
+                if msgtype is None:
+                    raise PreviewError(f"Not an image topic: {topic}")
+                frame = _render_frame(
+                    get_reader(), topic, msgtype, timestamp, image_format, max_size
+                )
+                cache.set(key, json.dumps(frame).encode())
+            if frame is not None:
+                frames.append(frame)
+        return frames
+    finally:
+        if source is not None:
+            source.close()
@@ -0,0 +1,209 @@
+"""
+Ranged reads of files in S3 for range downloads.\\
+Every requested range is fetched with one ranged `GetObject` and streamed in chunks,
+instead of downloading the whole object into a temporary file first.
+The parts of a multipart range are requested concurrently, at most
+`S3_RANGE_CONCURRENCY` ahead of the part that is currently sent.
+`open_ranged` provides a seekable file that only fetches the parts that are read.
+"""
+
+import io
+import threading
+import weakref
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
+from typing import Iterable, Iterator
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import Storage
+from storages.backends.s3 import S3Storage
+
+# min size of the ranged requests of open_ranged
+READ_BUFFER_SIZE = 1024 * 1024
+
+_clients = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def is_s3_storage(storage: Storage) -> bool:
+    return isinstance(storage, S3Storage)
+
+
+def get_client(storage: S3Storage):
+    """
+    One boto3 client per storage and process.\\
+    The storage creates a new client for every thread, this one is shared by all
+    threads, so its connection pool is reused across requests.
+    """
+    with _lock:
+        client = _clients.get(storage)
+        if client is None:
+            client = storage.connection.meta.client
+            _clients[storage] = client
+        return client
+
+
+def reset_connections(storage: Storage):
+    """
+    Drops the connections of a storage inherited from the parent process after a fork,
+    so the processes don't share the sockets of one connection pool.\
+    The storage creates new connections when they are used next.
+    """
+    if is_s3_storage(storage):
+        with _lock:
+            _clients.pop(storage, None)
+        # the state without the connections, as used for pickling
+        storage.__setstate__(storage.__getstate__())
+
+
+def _get_range(client, bucket: str, key: str, r: range):
+    """Starts a ranged GetObject, the body is read later"""
+    return client.get_object(
+        Bucket=bucket, Key=key, Range=f"bytes={r.start}-{r.stop - 1}"
+    )["Body"]
+
+
+def _iter_body(body, chunk_size: int) -> Iterator[bytes]:
+    try:
+        yield from body.iter_chunks(chunk_size)
+    finally:
+        body.close()
+
+
+def iter_range(
+    storage: S3Storage, key: str, r: range, chunk_size: int = File.DEFAULT_CHUNK_SIZE
+) -> Iterator[bytes]:
+    """
+    Streams one byte range of an object
+
+    Args:
+        storage (S3Storage): storage containing the object
+        key (str): key of the object in the bucket
+        r (range): the requested range
+        chunk_size (int, optional): size of the yielded chunks.
+            Defaults to File.DEFAULT_CHUNK_SIZE.
+
+    Yields:
+        the bytes of the range in chunks
+    """
+    body = _get_range(get_client(storage), storage.bucket_name, key, r)
+    yield from _iter_body(body, chunk_size)
+
+
+def iter_ranges(
+    storage: S3Storage,
+    key: str,
+    ranges: list[range],
+    chunk_size: int = File.DEFAULT_CHUNK_SIZE,
+) -> Iterator[Iterable[bytes]]:
+    """
+    Streams multiple byte ranges of an object.\\
+    The requests of the next ranges are sent in background threads while the current
+    range is streamed, only the bodies of the started requests are held open.
+
+    Args:
+        storage (S3Storage): storage containing the object
+        key (str): key of the object in the bucket
+        ranges (list[range]): the requested ranges
+        chunk_size (int, optional): size of the yielded chunks.
+            Defaults to File.DEFAULT_CHUNK_SIZE.
+
+    Yields:
+        one iterator over the chunks of every range, in the order of the ranges.
+        Each iterator has to be consumed before the next one is requested.
+    """
+    client = get_client(storage)
+    concurrency = max(1, settings.S3_RANGE_CONCURRENCY)
+    pending = iter(ranges)
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    requests: deque[Future] = deque()
+
+    def request_next(count: int):
+        for r in islice(pending, count):
+            requests.append(
+                executor.submit(_get_range, client, storage.bucket_name, key, r)
+            )
+
+    try:
+        request_next(concurrency)
+        while requests:
+            body = requests.popleft().result()
+            request_next(1)
+            yield _iter_body(body, chunk_size)
+            body.close()
+    finally:
+        # e.g. the client disconnected, close the bodies that were not sent
+        executor.shutdown(wait=True, cancel_futures=True)
+        for request in requests:
+            if not request.cancelled() and request.exception() is None:
+                request.result().close()
+
+
+class RangeReader(io.RawIOBase):
+    """Seekable read only file of an S3 object, every read is one ranged GetObject"""
+
+    def __init__(self, storage: S3Storage, key: str, size: int):
+        self.client = get_client(storage)
+        self.bucket = storage.bucket_name
+        self.key = key
+        self.size = size
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        match whence:
+            case io.SEEK_SET:
+                position = offset
+            case io.SEEK_CUR:
+                position = self.position + offset
+            case io.SEEK_END:
+                position = self.size + offset
+            case _:
+                raise ValueError(f"Invalid whence: {whence}")
+        if position < 0:
+            raise ValueError(f"Negative seek position: {position}")
+        self.position = position
+        return position
+
+    def readinto(self, buffer) -> int:
+        stop = min(self.position + len(buffer), self.size)
+        if stop <= self.position:
+            return 0
+        body = _get_range(
+            self.client, self.bucket, self.key, range(self.position, stop)
+        )
+        try:
+            data = body.read()
+        finally:
+            body.close()
+        buffer[: len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+def open_ranged(
+    storage: S3Storage, key: str, size: int, buffer_size: int = READ_BUFFER_SIZE
+) -> io.BufferedReader:
+    """
+    Opens an object for random access without downloading it
+
+    Args:
+        storage (S3Storage): storage containing the object
+        key (str): key of the object in the bucket
+        size (int): size of the object
+        buffer_size (int, optional): min number of bytes fetched by one request.
+            Defaults to READ_BUFFER_SIZE.
+
+    Returns:
+        io.BufferedReader: seekable file, reads are sent as ranged GetObject requests
+    """
+    return io.BufferedReader(RangeReader(storage, key, size), buffer_size=buffer_size)
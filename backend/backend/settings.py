@@ -73,6 +73,7 @@ INSTALLED_APPS = [
     "django.contrib.staticfiles",
     "rest_framework",
     "restapi",
+    "search_index",
     "corsheaders",
     "dj_rest_auth",
     "storages",
@@ -128,6 +129,17 @@ WSGI_APPLICATION = "backend.wsgi.application"
 DATABASES = {"default": env.db()}
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# see https://django-environ.readthedocs.io/en/latest/types.html#environ-env-cache-url
+# locmem is per process, use a shared backend (file, database, ...) with multiple workers
+
+CACHES = {"default": env.cache("CACHE_URL", default="locmemcache://")}
+
+# seconds a REST API response stays in the cache
+RESTAPI_CACHE_TIMEOUT = env("RESTAPI_CACHE_TIMEOUT", int, default=300)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -179,6 +191,25 @@ REST_AUTH = {
 
 MEDIA_URL = f"{env('DOMAIN', default='http://localhost:8000')}/file/download/"
 
+# How downloads of local files are sent:
+# "python" (read in chunks by django), "sendfile" (os.sendfile of the WSGI server
+# for whole files and single ranges), "x-accel-redirect" (nginx)
+# or "x-sendfile" (apache, lighttpd)
+DOWNLOAD_SERVING = env("DOWNLOAD_SERVING", default="python")
+# internal nginx location of the media folder for "x-accel-redirect"
+DOWNLOAD_ACCEL_PREFIX = env("DOWNLOAD_ACCEL_PREFIX", default="/protected-media/")
+
+# Max number of ranges in one range request after merging overlapping and close ranges.
+# Requests with more ranges get the whole file
+DOWNLOAD_MAX_RANGES = env("DOWNLOAD_MAX_RANGES", int, default=200)
+
+# Max number of parallel ranged GetObject requests for one multipart range download
+# from S3. Should not exceed max_pool_connections of the S3 client (default 10)
+S3_RANGE_CONCURRENCY = env("S3_RANGE_CONCURRENCY", int, default=4)
+
+# Validity of the signed tokens in the download urls (seconds)
+DOWNLOAD_TOKEN_MAX_AGE = env("DOWNLOAD_TOKEN_MAX_AGE", int, default=SESSION_COOKIE_AGE)
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.1/howto/static-files/
 
@@ -188,8 +219,18 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 
 TEMP_FOLDER = env("TEMP_FOLDER", default="tmp")
 
+# disk cache of the frame previews, least recently used frames are evicted first
+PREVIEW_CACHE_DIR = env("PREVIEW_CACHE_DIR", default=str(Path(TEMP_FOLDER) / "preview"))
+PREVIEW_CACHE_MAX_SIZE = env("PREVIEW_CACHE_MAX_SIZE", int, default=256 * 1024 * 1024)
+
 STORE_VIDEO_LOCALLY = env("STORE_VIDEO_LOCALLY", bool, default=False)
 
+# worker processes generating videos in parallel and their memory budget in bytes (0 = no limit)
+VIDEO_WORKERS = env("VIDEO_WORKERS", int, default=1)
+VIDEO_MAX_MEMORY = env("VIDEO_MAX_MEMORY", int, default=0)
+# mux JPEG images of compressed image topics as MJPEG without decoding them
+VIDEO_JPEG_PASSTHROUGH = env("VIDEO_JPEG_PASSTHROUGH", bool, default=False)
+
 if STORE_VIDEO_LOCALLY:
     VIDEO_ROOT = "media"
 
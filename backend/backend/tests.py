@@ -1,14 +1,36 @@
-from django.test import TestCase
+from botocore.response import StreamingBody
+from botocore.stub import Stubber
+from django.test import TestCase, override_settings
+import backend.preview
+import backend.s3
 import backend.views
-from backend.views import _chunk_generator
+from backend import image_encodings
+from backend.disk_cache import DiskLRUCache
+from backend.mcap_slice import slice_mcap
+from backend.views import _chunk_generator, _normalize_ranges
 from django.urls import reverse
 from django.contrib.auth.models import User
 from django.contrib.sessions.models import Session
 from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
 from django.core.files.storage.memory import InMemoryStorage
 from django.http import FileResponse, StreamingHttpResponse
+from mcap.reader import make_reader
+from mcap.writer import Writer as McapWriter
+from restapi.download_tokens import create_token
+from storages.backends.s3 import S3Storage
 from restapi.models import File, Mission
+from datetime import datetime, timezone
+from types import SimpleNamespace
 from unittest.mock import patch
+import base64
+import cv2
+import io
+import os
+import numpy as np
+import random
+import tempfile
+import threading
 
 
 # user without password for tests
@@ -99,12 +121,13 @@ class FileDownloadTest(TestCase):
         )
         self.assertEqual(b"".join(response.streaming_content), file_content[5:])
 
+    @patch("backend.views.RANGE_MERGE_GAP", 0)
     def test_multi_range_download(self):
         response: StreamingHttpResponse = self.client.get(
             reverse("download", kwargs={"file_path": self.file.name})
             + f"?sessionid={Session.objects.first().session_key}",
             headers={
-                "range": "bytes=6-,4-9",
+                "range": "bytes=5-,0-3",
             },
         )
         body = list(response.streaming_content)
@@ -131,11 +154,933 @@ class FileDownloadTest(TestCase):
         self.assertEqual(len(contents[0]), 1)
         self.assertEqual(len(contents[1]), 2)
 
+        # ranges are sorted
         file = self.file.open()
-        file.seek(6)
-        self.assertEqual(contents[0][0], file.read())
-        file.seek(4)
+        self.assertEqual(contents[0][0], file.read(4))
+        file.seek(5)
         # second range should be split in two parts because of chunk_size=5
         self.assertEqual(contents[1][0], file.read(5))
         self.assertEqual(contents[1][1], file.read(1))
         file.close()
+
+    def get_range(self, range_header: str):
+        return self.client.get(
+            reverse("download", kwargs={"file_path": self.file.name})
+            + f"?sessionid={Session.objects.first().session_key}",
+            headers={"range": range_header},
+        )
+
+    def test_overlapping_ranges_are_merged(self):
+        # merged into one range, sent as single range
+        for range_header in ["bytes=6-,4-9", "bytes=0-2,1-3,0-1", "bytes=0-1,3-4"]:
+            with self.subTest(range_header=range_header):
+                response = self.get_range(range_header)
+                self.assertEqual(response.status_code, 206)
+                self.assertNotIn("multipart", response["Content-Type"])
+
+        response = self.get_range("bytes=6-,4-9")
+        self.assertEqual(response["Content-Range"], "bytes 4-10/11")
+        self.assertEqual(b"".join(response.streaming_content), b"5678901")
+
+    @override_settings(DOWNLOAD_MAX_RANGES=2)
+    @patch("backend.views.RANGE_MERGE_GAP", 0)
+    def test_too_many_ranges_send_whole_file(self):
+        self.assertEqual(self.get_range("bytes=0-0,2-2").status_code, 206)
+        response = self.get_range("bytes=0-0,2-2,4-4")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), b"12345678901")
+
+    def test_ranges_outside_of_file(self):
+        # shortened to the file
+        response = self.get_range("bytes=5-100")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 5-10/11")
+        response = self.get_range("bytes=-100")
+        self.assertEqual(response["Content-Range"], "bytes 0-10/11")
+
+        # unsatisfiable ranges are left out
+        response = self.get_range("bytes=20-30,0-1")
+        self.assertEqual(response["Content-Range"], "bytes 0-1/11")
+        for range_header in ["bytes=11-", "bytes=20-30", "bytes=-0"]:
+            with self.subTest(range_header=range_header):
+                response = self.get_range(range_header)
+                self.assertEqual(response.status_code, 416)
+                self.assertEqual(response["Content-Range"], "bytes */11")
+
+    def test_malformed_ranges(self):
+        for range_header in [
+            "items=0-1",
+            "bytes=",
+            "bytes=-",
+            "bytes=5-2",
+            "bytes=1-2-3",
+            "bytes=a-b",
+            "bytes=0-1,x",
+        ]:
+            with self.subTest(range_header=range_header):
+                self.assertEqual(self.get_range(range_header).status_code, 400)
+
+        # empty list elements and spaces around the ranges are allowed
+        response = self.get_range("bytes= 0-1, ,2-3")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 0-3/11")
+
+    def test_normalize_ranges(self):
+        self.assertEqual(
+            _normalize_ranges([range(50, 60), range(0, 10), range(5, 20)], gap=0),
+            [range(0, 20), range(50, 60)],
+        )
+        self.assertEqual(
+            _normalize_ranges([range(0, 10), range(10, 20)], gap=0), [range(0, 20)]
+        )
+        self.assertEqual(
+            _normalize_ranges([range(0, 10), range(15, 20)], gap=5), [range(0, 20)]
+        )
+        self.assertEqual(
+            _normalize_ranges([range(0, 10), range(16, 20)], gap=5),
+            [range(0, 10), range(16, 20)],
+        )
+        self.assertEqual(
+            _normalize_ranges([range(0, 100), range(10, 20)]), [range(0, 100)]
+        )
+
+    def test_download_with_token(self):
+        url = reverse("download", kwargs={"file_path": self.file.name})
+        token = create_token(self.file.name)
+        self.client.logout()
+
+        # checked without any database query
+        with self.assertNumQueries(0):
+            response = self.client.get(url + f"?token={token}")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("public", response["Cache-Control"])
+
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                url + f"?token={token}", headers={"range": "bytes=0-5"}
+            )
+        self.assertEqual(response.status_code, 206)
+
+    def test_invalid_tokens(self):
+        url = reverse("download", kwargs={"file_path": self.file.name})
+        other_path = create_token("path/to/other.test")
+        expires, _, signature = create_token(self.file.name).partition(".")
+        for token in [
+            other_path,
+            f"{int(expires) + 1}.{signature}",
+            f"{expires}.{signature[:-1]}",
+            "invalid",
+        ]:
+            with self.subTest(token=token):
+                response = self.client.get(url + f"?token={token}")
+                self.assertEqual(response.status_code, 403)
+
+    def test_expired_token(self):
+        url = reverse("download", kwargs={"file_path": self.file.name})
+        token = create_token(self.file.name)
+        with patch("restapi.download_tokens.time.time", return_value=1e11):
+            response = self.client.get(url + f"?token={token}")
+        self.assertEqual(response.status_code, 403)
+
+    def test_invalid_token_falls_back_to_session(self):
+        response = self.client.get(
+            reverse("download", kwargs={"file_path": self.file.name})
+            + f"?token=invalid&sessionid={Session.objects.first().session_key}"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Cache-Control", response)
+
+
+class ConditionalDownloadTest(TestCase):
+    def setUp(self):
+        self._default_storage = backend.views.storage
+        test_storage = InMemoryStorage()
+        backend.views.storage = test_storage
+        test_storage.save("path/to/file.mcap", ContentFile(b"12345678901"))
+        test_storage.save("path/to/video.mp4", ContentFile(b"video"))
+
+    def tearDown(self):
+        backend.views.storage = self._default_storage
+
+    def get(self, file_path: str = "path/to/file.mcap", view="download", **headers):
+        url = reverse(view, kwargs={"file_path": file_path})
+        return self.client.get(
+            url + f"?token={create_token(file_path)}", headers=headers
+        )
+
+    def test_validators(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response["ETag"], r'^"[0-9a-f]{32}"$')
+        self.assertIn("GMT", response["Last-Modified"])
+
+        # the same file has the same ETag, a changed file a new one
+        self.assertEqual(self.get()["ETag"], response["ETag"])
+        backend.views.storage.delete("path/to/file.mcap")
+        backend.views.storage.save("path/to/file.mcap", ContentFile(b"changed"))
+        self.assertNotEqual(self.get()["ETag"], response["ETag"])
+
+    def test_if_none_match(self):
+        etag = self.get()["ETag"]
+        for view in ["download", "stream"]:
+            with self.subTest(view=view):
+                response = self.get(view=view, if_none_match=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b"")
+                self.assertEqual(response["ETag"], etag)
+                self.assertIn("public", response["Cache-Control"])
+
+        response = self.get(if_none_match='"other"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_if_modified_since(self):
+        last_modified = self.get()["Last-Modified"]
+        response = self.get(if_modified_since=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.get(if_modified_since="Mon, 01 Jan 2001 00:00:00 GMT")
+        self.assertEqual(response.status_code, 200)
+
+    def test_if_match(self):
+        response = self.get(if_match='"other"')
+        self.assertEqual(response.status_code, 412)
+
+    def test_if_range(self):
+        response = self.get()
+        etag, last_modified = response["ETag"], response["Last-Modified"]
+
+        for if_range in [etag, last_modified]:
+            with self.subTest(if_range=if_range):
+                response = self.get(range="bytes=2-4", if_range=if_range)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(b"".join(response.streaming_content), b"345")
+
+        # outdated or weak validators send the whole file
+        for if_range in ['"other"', f"W/{etag}", "Mon, 01 Jan 2001 00:00:00 GMT"]:
+            with self.subTest(if_range=if_range):
+                response = self.get(range="bytes=2-4", if_range=if_range)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(b"".join(response.streaming_content), b"12345678901")
+
+    def test_videos_are_revalidated(self):
+        # generate-videos --overwrite replaces videos under the same url
+        response = self.get("path/to/video.mp4", view="stream")
+        self.assertNotIn("immutable", response["Cache-Control"])
+        self.assertEqual(response["ETag"], self.get("path/to/video.mp4")["ETag"])
+
+
+class DownloadServingTest(TestCase):
+    def setUp(self):
+        self._default_storage = backend.views.storage
+        self.tempdir = tempfile.TemporaryDirectory()
+        test_storage = FileSystemStorage(self.tempdir.name)
+        backend.views.storage = test_storage
+        test_storage.save("path/to/file.mcap", ContentFile(b"12345678901"))
+        self.url = reverse("download", kwargs={"file_path": "path/to/file.mcap"})
+        self.token = create_token("path/to/file.mcap")
+
+    def tearDown(self):
+        backend.views.storage = self._default_storage
+        self.tempdir.cleanup()
+
+    def get(self, range_header: str = None):
+        headers = {"range": range_header} if range_header else {}
+        return self.client.get(self.url + f"?token={self.token}", headers=headers)
+
+    @override_settings(DOWNLOAD_SERVING="x-accel-redirect")
+    def test_x_accel_redirect(self):
+        response = self.get("bytes=2-4")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response["X-Accel-Redirect"], "/protected-media/path/to/file.mcap"
+        )
+        self.assertEqual(response.content, b"")
+        self.assertIn("public", response["Cache-Control"])
+
+        # ranges are still validated by django
+        self.assertEqual(self.get("bytes=11-20").status_code, 416)
+        self.assertEqual(self.get("items=0-1").status_code, 400)
+
+    @override_settings(DOWNLOAD_SERVING="x-accel-redirect", DOWNLOAD_MAX_RANGES=2)
+    @patch("backend.views.RANGE_MERGE_GAP", 0)
+    def test_x_accel_redirect_whole_file_with_range_header(self):
+        # the web server would apply the range header, so django sends the whole file
+        response = self.get("bytes=0-0,2-2,4-4")
+        self.assertNotIn("X-Accel-Redirect", response)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), b"12345678901")
+
+        response = self.client.get(
+            self.url + f"?token={self.token}",
+            headers={"range": "bytes=2-4", "if-range": '"outdated"'},
+        )
+        self.assertNotIn("X-Accel-Redirect", response)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), b"12345678901")
+
+    @override_settings(DOWNLOAD_SERVING="x-sendfile")
+    def test_x_sendfile(self):
+        response = self.get()
+        self.assertEqual(
+            response["X-Sendfile"],
+            os.path.join(self.tempdir.name, "path/to/file.mcap"),
+        )
+
+    @override_settings(DOWNLOAD_SERVING="sendfile")
+    @patch("backend.views.RANGE_MERGE_GAP", 0)
+    def test_sendfile_single_range(self):
+        response = self.get("bytes=2-4")
+        self.assertEqual(response.status_code, 206)
+        self.assertIsInstance(response, FileResponse)
+        self.assertEqual(response["Content-Length"], "3")
+        self.assertEqual(response["Content-Range"], "bytes 2-4/11")
+        self.assertEqual(b"".join(response.streaming_content), b"345")
+
+        # multiple ranges are still sent by django
+        response = self.get("bytes=0-1,4-5")
+        self.assertNotIsInstance(response, FileResponse)
+        self.assertEqual(response.status_code, 206)
+
+    @override_settings(DOWNLOAD_SERVING="x-accel-redirect")
+    def test_storage_without_path_is_sent_by_django(self):
+        backend.views.storage = InMemoryStorage()
+        backend.views.storage.save("path/to/file.mcap", ContentFile(b"123"))
+        response = self.get()
+        self.assertNotIn("X-Accel-Redirect", response)
+        self.assertEqual(b"".join(response.streaming_content), b"123")
+
+
+class FakeS3Client:
+    """Stand-in for the boto3 client, answers ranged GetObject requests from memory"""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.requests = []
+        self.threads = set()
+        self.bodies = []
+
+    def get_object(self, Bucket: str, Key: str, Range: str):
+        self.requests.append((Bucket, Key, Range))
+        self.threads.add(threading.current_thread())
+        start, end = Range.removeprefix("bytes=").split("-")
+        content = self.data[int(start) : int(end) + 1]
+        body = StreamingBody(io.BytesIO(content), len(content))
+        self.bodies.append(body)
+        return {"Body": body}
+
+
+class S3RangeDownloadTest(TestCase):
+    def setUp(self):
+        self._default_storage = backend.views.storage
+        self.storage = S3Storage(
+            bucket_name="test", access_key="x", secret_key="x", region_name="eu-west-1"
+        )
+        backend.views.storage = self.storage
+        self.data = b"0123456789abcdefghij"
+
+        # the file is opened with a HEAD request of the storage itself
+        self.stubber = Stubber(self.storage.connection.meta.client)
+        self.stubber.add_response(
+            "head_object",
+            {
+                "ContentLength": len(self.data),
+                "ETag": '"9a0364b9e99bb480dd25e1f0284c8555"',
+                "LastModified": datetime(2025, 1, 30, tzinfo=timezone.utc),
+            },
+            {"Bucket": "test", "Key": "path/to/file.mcap"},
+        )
+        self.stubber.activate()
+
+        self.s3_client = FakeS3Client(self.data)
+        self._client_patcher = patch(
+            "backend.s3.get_client", return_value=self.s3_client
+        )
+        self._client_patcher.start()
+        self.url = reverse("download", kwargs={"file_path": "path/to/file.mcap"})
+        self.url += f"?token={create_token('path/to/file.mcap')}"
+
+    def tearDown(self):
+        backend.views.storage = self._default_storage
+        self.stubber.deactivate()
+        self._client_patcher.stop()
+
+    def test_single_range(self):
+        response = self.client.get(self.url, headers={"range": "bytes=2-5"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 2-5/20")
+        self.assertEqual(b"".join(response.streaming_content), b"2345")
+        self.assertEqual(
+            self.s3_client.requests, [("test", "path/to/file.mcap", "bytes=2-5")]
+        )
+        self.assertTrue(self.s3_client.bodies[0]._raw_stream.closed)
+        self.stubber.assert_no_pending_responses()
+
+    def test_reset_connections(self):
+        connection = self.storage.connection
+        backend.s3._clients[self.storage] = connection.meta.client
+        backend.s3.reset_connections(self.storage)
+        self.assertNotIn(self.storage, backend.s3._clients)
+        self.assertIsNot(self.storage.connection, connection)
+        self.assertEqual(self.storage.bucket_name, "test")
+
+    @patch("backend.views.RANGE_MERGE_GAP", 0)
+    def test_multi_range(self):
+        response = self.client.get(self.url, headers={"range": "bytes=10-12,0-1,-2"})
+        self.assertEqual(response.status_code, 206)
+        body = b"".join(response.streaming_content)
+        self.assertEqual(len(body), int(response["Content-Length"]))
+        for content, r in [(b"01", "0-1"), (b"abc", "10-12"), (b"ij", "18-19")]:
+            self.assertIn(f"Content-Range: bytes {r}/20\r\n".encode() + content, body)
+        self.assertCountEqual(
+            [request[2] for request in self.s3_client.requests],
+            ["bytes=0-1", "bytes=10-12", "bytes=18-19"],
+        )
+        # the requests are sent from background threads
+        self.assertNotIn(threading.current_thread(), self.s3_client.threads)
+        self.assertTrue(all(b._raw_stream.closed for b in self.s3_client.bodies))
+
+    def test_overlapping_ranges_are_fetched_once(self):
+        response = self.client.get(self.url, headers={"range": "bytes=5-14,0-9,3-4"})
+        self.assertEqual(b"".join(response.streaming_content), self.data[:15])
+        self.assertEqual(
+            self.s3_client.requests, [("test", "path/to/file.mcap", "bytes=0-14")]
+        )
+
+    @override_settings(S3_RANGE_CONCURRENCY=2)
+    def test_requests_ahead_are_limited(self):
+        ranges = [range(i, i + 2) for i in range(0, 20, 4)]
+        contents = backend.s3.iter_ranges(self.storage, "file", ranges)
+        self.assertEqual(b"".join(next(contents)), b"01")
+        # at most the first range, the one in flight and the one started after it
+        self.assertLessEqual(len(self.s3_client.requests), 3)
+        self.assertEqual(
+            [b"".join(content) for content in contents], [b"45", b"89", b"cd", b"gh"]
+        )
+        self.assertEqual(len(self.s3_client.requests), 5)
+
+    @override_settings(S3_RANGE_CONCURRENCY=2)
+    def test_closing_early_closes_bodies(self):
+        ranges = [range(i, i + 2) for i in range(0, 20, 4)]
+        contents = backend.s3.iter_ranges(self.storage, "file", ranges)
+        self.assertEqual(b"".join(next(contents)), b"01")
+        contents.close()
+        self.assertLessEqual(len(self.s3_client.requests), 3)
+        self.assertTrue(all(b._raw_stream.closed for b in self.s3_client.bodies))
+
+    def test_validators_from_object_metadata(self):
+        response = self.client.get(
+            self.url, headers={"if_none_match": '"9a0364b9e99bb480dd25e1f0284c8555"'}
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["Last-Modified"], "Thu, 30 Jan 2025 00:00:00 GMT")
+        self.assertEqual(self.s3_client.requests, [])
+
+
+def create_mcap(seconds: int = 100, chunk_size: int = 1024) -> bytes:
+    """MCAP with the topics /a and /b and one message per topic and second"""
+    output = io.BytesIO()
+    writer = McapWriter(output, chunk_size=chunk_size)
+    writer.start(profile="ros2", library="test")
+    schema_id = writer.register_schema("std_msgs/msg/String", "ros2msg", b"string data")
+    channels = {
+        topic: writer.register_channel(topic, "cdr", schema_id)
+        for topic in ["/a", "/b"]
+    }
+    for second in range(seconds):
+        for topic, channel_id in channels.items():
+            writer.add_message(
+                channel_id,
+                log_time=second * 10**9,
+                # random bytes, so the chunks can't be compressed
+                data=f"{topic} {second} ".encode() + random.randbytes(1000),
+                publish_time=second * 10**9,
+            )
+    writer.finish()
+    return output.getvalue()
+
+
+class CountingBytesIO(io.BytesIO):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+def read_messages(data: bytes) -> list[tuple[str, int]]:
+    reader = make_reader(io.BytesIO(data))
+    return [
+        (channel.topic, message.log_time // 10**9)
+        for _, channel, message in reader.iter_messages()
+    ]
+
+
+class McapSliceTest(TestCase):
+    def setUp(self):
+        self._default_storage = backend.views.storage
+        backend.views.storage = InMemoryStorage()
+        self.data = create_mcap()
+        backend.views.storage.save("path/to/file.mcap", ContentFile(self.data))
+        backend.views.storage.save("path/to/file.txt", ContentFile(b"no mcap"))
+
+    def tearDown(self):
+        backend.views.storage = self._default_storage
+
+    def get(self, file_path: str = "path/to/file.mcap", **params):
+        url = reverse("slice", kwargs={"file_path": file_path})
+        params["token"] = create_token(file_path)
+        return self.client.get(url, params)
+
+    def test_slice(self):
+        response = self.get(start=10 * 10**9, end=12 * 10**9)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response["Content-Disposition"],
+            f'attachement; filename="file_{10 * 10**9}_{12 * 10**9}.mcap"',
+        )
+        data = b"".join(response.streaming_content)
+        self.assertLess(len(data), len(self.data))
+        self.assertEqual(
+            read_messages(data),
+            [("/a", 10), ("/b", 10), ("/a", 11), ("/b", 11), ("/a", 12), ("/b", 12)],
+        )
+        header = make_reader(io.BytesIO(data)).get_header()
+        self.assertEqual(header.profile, "ros2")
+
+    def test_topics(self):
+        response = self.get(start=0, end=2 * 10**9, topics="/b")
+        data = b"".join(response.streaming_content)
+        self.assertEqual(read_messages(data), [("/b", 0), ("/b", 1), ("/b", 2)])
+
+        # empty window is still a valid mcap file
+        response = self.get(start=0, end=2 * 10**9, topics="/unknown")
+        self.assertEqual(read_messages(b"".join(response.streaming_content)), [])
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.get(start=0).status_code, 400)
+        self.assertEqual(self.get(start="a", end=1).status_code, 400)
+        self.assertEqual(self.get(start=2, end=1).status_code, 400)
+        self.assertEqual(self.get("path/to/file.txt", start=0, end=1).status_code, 400)
+        self.assertEqual(
+            self.get("path/to/other.mcap", start=0, end=1).status_code, 404
+        )
+
+        url = reverse("slice", kwargs={"file_path": "path/to/file.mcap"})
+        self.assertEqual(self.client.get(url, {"start": 0, "end": 1}).status_code, 403)
+
+    def test_only_overlapping_chunks_are_read(self):
+        source = CountingBytesIO(self.data)
+        data = b"".join(slice_mcap(source, 50 * 10**9, 51 * 10**9))
+        self.assertEqual(
+            read_messages(data), [("/a", 50), ("/b", 50), ("/a", 51), ("/b", 51)]
+        )
+        self.assertLess(source.bytes_read, len(self.data) / 5)
+        self.assertTrue(source.closed)
+
+    def test_slice_from_s3(self):
+        storage = S3Storage(bucket_name="test", region_name="eu-west-1")
+        s3_client = FakeS3Client(self.data)
+        with patch("backend.s3.get_client", return_value=s3_client):
+            source = backend.s3.open_ranged(
+                storage, "file.mcap", len(self.data), buffer_size=1024
+            )
+            data = b"".join(slice_mcap(source, 50 * 10**9, 51 * 10**9, ["/a"]))
+        self.assertEqual(read_messages(data), [("/a", 50), ("/a", 51)])
+        fetched = 0
+        for _, _, r in s3_client.requests:
+            first, last = r.removeprefix("bytes=").split("-")
+            fetched += int(last) - int(first) + 1
+        self.assertLess(fetched, len(self.data) / 2)
+
+
+def create_image_mcap(width: int = 64, height: int = 48, compressed=False) -> bytes:
+    """MCAP with the image topics /cam_a (rgb8) and /cam_b (mono16), one message per second
+    and the non image topic /text. The red channel of /cam_a is the second.
+    compressed adds the CompressedImage topic /cam_c with the frames of /cam_a as JPEG."""
+    typestore = backend.preview.typestore
+    Image = typestore.types["sensor_msgs/msg/Image"]
+    Header = typestore.types["std_msgs/msg/Header"]
+    Time = typestore.types["builtin_interfaces/msg/Time"]
+    output = io.BytesIO()
+    writer = McapWriter(output, chunk_size=4096)
+    writer.start(profile="ros2", library="test")
+    image_schema = writer.register_schema("sensor_msgs/msg/Image", "ros2msg", b"")
+    text_schema = writer.register_schema("std_msgs/msg/String", "ros2msg", b"")
+    cam_a = writer.register_channel("/cam_a", "cdr", image_schema)
+    cam_b = writer.register_channel("/cam_b", "cdr", image_schema)
+    text = writer.register_channel("/text", "cdr", text_schema)
+    CompressedImage = typestore.types["sensor_msgs/msg/CompressedImage"]
+    if compressed:
+        compressed_schema = writer.register_schema(
+            "sensor_msgs/msg/CompressedImage", "ros2msg", b""
+        )
+        cam_c = writer.register_channel("/cam_c", "cdr", compressed_schema)
+    for second in range(10):
+        header = Header(stamp=Time(sec=second, nanosec=0), frame_id="camera")
+        rgb = np.zeros((height, width, 3), dtype=np.uint8)
+        rgb[:, :, 0] = second
+        mono = np.full((height, width), second * 256, dtype="<u2")
+        for channel_id, encoding, pixels in [
+            (cam_a, "rgb8", rgb),
+            (cam_b, "mono16", mono),
+        ]:
+            msg = Image(
+                header=header,
+                height=height,
+                width=width,
+                encoding=encoding,
+                is_bigendian=0,
+                step=pixels.strides[0],
+                data=pixels.reshape(-1).view(np.uint8),
+            )
+            writer.add_message(
+                channel_id,
+                log_time=second * 10**9,
+                data=bytes(typestore.serialize_cdr(msg, "sensor_msgs/msg/Image")),
+                publish_time=second * 10**9,
+            )
+        if compressed:
+            _, jpeg = cv2.imencode(".jpg", cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR))
+            msg = CompressedImage(header=header, format="jpeg", data=jpeg.reshape(-1))
+            writer.add_message(
+                cam_c,
+                log_time=second * 10**9,
+                data=bytes(
+                    typestore.serialize_cdr(msg, "sensor_msgs/msg/CompressedImage")
+                ),
+                publish_time=second * 10**9,
+            )
+        writer.add_message(text, second * 10**9, b"text", second * 10**9)
+    writer.finish()
+    return output.getvalue()
+
+
+class FramePreviewTest(TestCase):
+    def setUp(self):
+        self._default_storage = backend.views.storage
+        backend.views.storage = InMemoryStorage()
+        self.data = create_image_mcap()
+        backend.views.storage.save("path/to/file.mcap", ContentFile(self.data))
+        backend.views.storage.save("path/to/file.txt", ContentFile(b"no mcap"))
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.settings = override_settings(PREVIEW_CACHE_DIR=self.cache_dir.name)
+        self.settings.enable()
+
+    def tearDown(self):
+        backend.views.storage = self._default_storage
+        self.settings.disable()
+        self.cache_dir.cleanup()
+
+    def get(self, file_path: str = "path/to/file.mcap", **params):
+        url = reverse("preview", kwargs={"file_path": file_path})
+        params["token"] = create_token(file_path)
+        return self.client.get(url, params)
+
+    def decode(self, frame: dict) -> np.ndarray:
+        data = np.frombuffer(base64.b64decode(frame["data"]), dtype=np.uint8)
+        return cv2.imdecode(data, cv2.IMREAD_UNCHANGED)
+
+    def test_nearest_frames(self):
+        response = self.get(t=int(3.4 * 10**9))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("max-age", response["Cache-Control"])
+        content = response.json()
+        self.assertEqual(content["timestamp"], int(3.4 * 10**9))
+        frames = content["frames"]
+        self.assertEqual([frame["topic"] for frame in frames], ["/cam_a", "/cam_b"])
+        for frame in frames:
+            self.assertEqual(frame["timestamp"], 3 * 10**9)
+            self.assertEqual(frame["content_type"], "image/jpeg")
+            self.assertEqual((frame["width"], frame["height"]), (64, 48))
+        # red in BGR
+        self.assertAlmostEqual(int(self.decode(frames[0])[0, 0, 2]), 3, delta=2)
+        self.assertAlmostEqual(int(self.decode(frames[1])[0, 0]), 3, delta=2)
+
+        frames = self.get(t=int(3.6 * 10**9), topics="/cam_b").json()["frames"]
+        self.assertEqual([frame["timestamp"] for frame in frames], [4 * 10**9])
+
+        # after the last message
+        frames = self.get(t=100 * 10**9, topics="/cam_a").json()["frames"]
+        self.assertEqual([frame["timestamp"] for frame in frames], [9 * 10**9])
+
+    def test_downscale_and_format(self):
+        response = self.get(t=0, topics="/cam_a", max_size=32, format="webp")
+        frame = response.json()["frames"][0]
+        self.assertEqual((frame["width"], frame["height"]), (32, 24))
+        self.assertEqual(frame["content_type"], "image/webp")
+        self.assertEqual(self.decode(frame).shape[:2], (24, 32))
+
+    def test_cached(self):
+        first = self.get(t=5 * 10**9).json()
+        # the topics and one frame per topic
+        self.assertEqual(len(os.listdir(self.cache_dir.name)), 3)
+
+        with patch("backend.preview.make_reader") as make_reader:
+            self.assertEqual(self.get(t=5 * 10**9).json(), first)
+        make_reader.assert_not_called()
+
+        # another version of the file is not taken from the cache
+        frames = backend.preview.get_frames(
+            lambda: io.BytesIO(self.data), "other", ["/cam_a"], 5 * 10**9
+        )
+        self.assertEqual(frames, first["frames"][:1])
+        self.assertEqual(len(os.listdir(self.cache_dir.name)), 4)
+
+    def test_compressed_image(self):
+        backend.views.storage.save(
+            "path/to/compressed.mcap", ContentFile(create_image_mcap(compressed=True))
+        )
+        frames = self.get("path/to/compressed.mcap", t=7 * 10**9).json()["frames"]
+        self.assertEqual(
+            [frame["topic"] for frame in frames], ["/cam_a", "/cam_b", "/cam_c"]
+        )
+        self.assertEqual(frames[2]["timestamp"], 7 * 10**9)
+        self.assertEqual((frames[2]["width"], frames[2]["height"]), (64, 48))
+        self.assertAlmostEqual(int(self.decode(frames[2])[0, 0, 2]), 7, delta=3)
+
+    def test_message_definitions_of_the_file(self):
+        # an Image type that differs from the one of the Foxy typestore
+        separator = "=" * 80
+        definition = f"""uint32 version
+std_msgs/Header header
+uint32 height
+uint32 width
+string encoding
+uint8 is_bigendian
+uint32 step
+uint8[] data
+{separator}
+MSG: std_msgs/Header
+builtin_interfaces/Time stamp
+string frame_id
+{separator}
+MSG: builtin_interfaces/Time
+int32 sec
+uint32 nanosec
+"""
+        store = backend.preview.schema_typestore(
+            SimpleNamespace(
+                encoding="ros2msg",
+                name="sensor_msgs/msg/Image",
+                data=definition.encode(),
+            )
+        )
+        Image = store.types["sensor_msgs/msg/Image"]
+        Header = store.types["std_msgs/msg/Header"]
+        Time = store.types["builtin_interfaces/msg/Time"]
+        pixels = np.full((6, 8), 200, dtype=np.uint8)
+        msg = Image(
+            version=2,
+            header=Header(stamp=Time(sec=0, nanosec=0), frame_id="camera"),
+            height=6,
+            width=8,
+            encoding="mono8",
+            is_bigendian=0,
+            step=8,
+            data=pixels.reshape(-1),
+        )
+        output = io.BytesIO()
+        writer = McapWriter(output)
+        writer.start(profile="ros2", library="test")
+        schema = writer.register_schema(
+            "sensor_msgs/msg/Image", "ros2msg", definition.encode()
+        )
+        channel = writer.register_channel("/cam", "cdr", schema)
+        data = bytes(store.serialize_cdr(msg, "sensor_msgs/msg/Image"))
+        writer.add_message(channel, log_time=0, data=data, publish_time=0)
+        writer.finish()
+
+        frames = backend.preview.get_frames(
+            lambda: io.BytesIO(output.getvalue()), "defined", None, 0
+        )
+        self.assertEqual((frames[0]["width"], frames[0]["height"]), (8, 6))
+        self.assertAlmostEqual(int(self.decode(frames[0])[0, 0]), 200, delta=2)
+
+        with self.assertRaises(backend.preview.PreviewError):
+            backend.preview.schema_typestore(
+                SimpleNamespace(
+                    encoding="ros2msg", name="sensor_msgs/msg/Image", data=b"invalid"
+                )
+            )
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.get().status_code, 400)
+        self.assertEqual(self.get(t="a").status_code, 400)
+        self.assertEqual(self.get(t=0, max_size=1).status_code, 400)
+        self.assertEqual(self.get(t=0, format="gif").status_code, 400)
+        self.assertEqual(self.get(t=0, topics="/text").status_code, 400)
+        self.assertEqual(self.get(t=0, topics="/unknown").status_code, 400)
+        self.assertEqual(self.get("path/to/file.txt", t=0).status_code, 400)
+        self.assertEqual(self.get("path/to/other.mcap", t=0).status_code, 404)
+
+        url = reverse("preview", kwargs={"file_path": "path/to/file.mcap"})
+        self.assertEqual(self.client.get(url, {"t": 0}).status_code, 403)
+
+
+def image_message(pixels: np.ndarray, encoding: str, padding: int = 0, bigendian=False):
+    """Image message with the pixels and padding bytes at the end of every row"""
+    height, width = pixels.shape[:2]
+    rows = pixels.reshape(height, -1).view(np.uint8)
+    data = np.zeros((height, rows.shape[1] + padding), dtype=np.uint8)
+    data[:, : rows.shape[1]] = rows
+    return SimpleNamespace(
+        encoding=encoding,
+        width=width,
+        height=height,
+        step=data.shape[1],
+        is_bigendian=int(bigendian),
+        data=data.reshape(-1),
+    )
+
+
+class ImageEncodingsTest(TestCase):
+    def test_channel_order(self):
+        pixels = np.zeros((4, 6, 3), dtype=np.uint8)
+        pixels[:, :, 0] = 200
+        bgr = image_encodings.to_frame(image_message(pixels, "bgr8", padding=5))
+        self.assertEqual(bgr.shape, (4, 6, 3))
+        self.assertEqual(bgr[0, 0].tolist(), [200, 0, 0])
+        # a view of the message data
+        self.assertFalse(bgr.flags.owndata)
+        rgb = image_encodings.to_frame(image_message(pixels, "rgb8", padding=5))
+        self.assertEqual(rgb[3, 5].tolist(), [0, 0, 200])
+        rgba = np.zeros((4, 6, 4), dtype=np.uint8)
+        rgba[:, :, 0] = 200
+        self.assertEqual(
+            image_encodings.to_frame(image_message(rgba, "rgba8"))[0, 0].tolist(),
+            [0, 0, 200],
+        )
+
+    def test_padded_rows(self):
+        pixels = np.arange(4 * 6, dtype=np.uint8).reshape(4, 6)
+        frame = image_encodings.to_frame(image_message(pixels, "mono8", padding=10))
+        np.testing.assert_array_equal(frame, pixels)
+        # padding in the last row is optional
+        msg = image_message(pixels, "mono8", padding=10)
+        msg.data = msg.data[:-10]
+        np.testing.assert_array_equal(image_encodings.to_frame(msg), pixels)
+        msg.data = msg.data[:-1]
+        with self.assertRaises(ValueError):
+            image_encodings.to_frame(msg)
+
+    def test_16_bit(self):
+        pixels = np.array([[0x1234, 0xFF00, 0x00FF]], dtype="<u2")
+        frame = image_encodings.to_frame(image_message(pixels, "mono16", padding=2))
+        self.assertEqual(frame.tolist(), [[0x12, 0xFF, 0x00]])
+        big = image_message(pixels.astype(">u2"), "mono16", bigendian=True)
+        self.assertEqual(image_encodings.to_frame(big).tolist(), [[0x12, 0xFF, 0x00]])
+        rgb = np.zeros((2, 2, 3), dtype="<u2")
+        rgb[:, :, 0] = 0xAB00
+        frame = image_encodings.to_frame(image_message(rgb, "rgb16"))
+        self.assertEqual(frame[1, 1].tolist(), [0, 0, 0xAB])
+
+    def test_16_bit_compressed(self):
+        # 16 bit PNGs map to 8 bit like the 16 bit encodings of raw images
+        pixels = np.array([[0x1234, 0xFF00, 0x00FF]], dtype=np.uint16)
+        png = cv2.imencode(".png", pixels)[1].tobytes()
+        frame = backend.preview.frame_from_compressed(
+            SimpleNamespace(format="png", data=png)
+        )
+        self.assertEqual(frame.dtype, np.uint8)
+        self.assertEqual(frame.tolist(), [[0x12, 0xFF, 0x00]])
+        np.testing.assert_array_equal(
+            frame,
+            image_encodings.to_frame(image_message(pixels.astype("<u2"), "mono16")),
+        )
+
+    def test_bayer(self):
+        # red image in a RGGB pattern
+        pixels = np.zeros((8, 8), dtype=np.uint8)
+        pixels[0::2, 0::2] = 255
+        frame = image_encodings.to_frame(image_message(pixels, "bayer_rggb8"))
+        self.assertEqual(frame.shape, (8, 8, 3))
+        self.assertEqual(frame[4, 4].tolist(), [0, 0, 255])
+        frame = image_encodings.to_frame(
+            image_message(pixels.astype("<u2") << 8, "bayer_rggb16")
+        )
+        self.assertEqual(frame[4, 4].tolist(), [0, 0, 255])
+        # the same pattern is blue in BGGR
+        frame = image_encodings.to_frame(image_message(pixels, "bayer_bggr8"))
+        self.assertEqual(frame[4, 4].tolist(), [255, 0, 0])
+
+    def test_depth(self):
+        depth = np.array([[0, 5000, 20000]], dtype="<u2")
+        frame = image_encodings.to_frame(image_message(depth, "16UC1"))
+        self.assertEqual(frame.shape, (1, 3, 3))
+        # invalid depth is black, depths beyond DEPTH_MAX have the last color
+        self.assertEqual(frame[0, 0].tolist(), [0, 0, 0])
+        self.assertNotEqual(frame[0, 1].tolist(), [0, 0, 0])
+        self.assertNotEqual(frame[0, 1].tolist(), frame[0, 2].tolist())
+        meters = np.array([[np.nan, 5.0, 20.0]], dtype="<f4")
+        np.testing.assert_array_equal(
+            image_encodings.to_frame(image_message(meters, "32FC1")), frame
+        )
+
+    def test_yuv(self):
+        # gray in UYVY and YUYV
+        uyvy = np.full((2, 4, 2), 128, dtype=np.uint8)
+        frame = image_encodings.to_frame(image_message(uyvy, "yuv422"))
+        self.assertEqual(frame.shape, (2, 4, 3))
+        for value in frame.reshape(-1):
+            self.assertAlmostEqual(int(value), 128, delta=2)
+        yuyv = image_encodings.to_frame(image_message(uyvy, "yuv422_yuy2"))
+        np.testing.assert_array_equal(yuyv, frame)
+
+    def test_unsupported_encoding(self):
+        pixels = np.zeros((2, 2), dtype=np.uint8)
+        with self.assertRaises(ValueError):
+            image_encodings.to_frame(image_message(pixels, "64FC1"))
+        with self.assertRaises(backend.preview.PreviewError):
+            backend.preview.frame_from_image(image_message(pixels, "64FC1"))
+
+    def test_benchmark(self):
+        # every encoding converts a full HD frame fast enough for video generation
+        for encoding in image_encodings.CONVERTERS:
+            with self.subTest(encoding=encoding):
+                self.assertLess(image_encodings.benchmark(encoding, repeat=3), 0.1)
+
+
+class DiskLRUCacheTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = DiskLRUCache(self.directory.name, max_size=100, low_watermark=0.5)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def set_used(self, key: str, seconds: int):
+        path = self.cache._path(key)
+        os.utime(path, (seconds, seconds))
+
+    def test_get_and_set(self):
+        self.assertIsNone(self.cache.get("a"))
+        self.cache.set("a", b"content")
+        self.assertEqual(self.cache.get("a"), b"content")
+        self.cache.set("a", b"new")
+        self.assertEqual(self.cache.get("a"), b"new")
+        # larger than the cache
+        self.cache.set("b", bytes(101))
+        self.assertIsNone(self.cache.get("b"))
+
+    def test_least_recently_used_are_evicted(self):
+        for second, key in enumerate("abcd"):
+            self.cache.set(key, bytes(20))
+            self.set_used(key, second)
+        # reading a updates its modification time
+        self.cache.get("a")
+        self.cache.set("e", bytes(30))
+        # b, c and d are evicted until at most 50 bytes are left
+        self.assertIsNotNone(self.cache.get("a"))
+        self.assertIsNone(self.cache.get("b"))
+        self.assertIsNone(self.cache.get("c"))
+        self.assertIsNotNone(self.cache.get("e"))
+        self.assertIsNone(self.cache.get("d"))
+
+    def test_clear(self):
+        self.cache.set("a", b"content")
+        self.cache.clear()
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(os.listdir(self.directory.name), [])
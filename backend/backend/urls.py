@@ -17,11 +17,13 @@ Including another URLconf
 
 from django.contrib import admin
 from django.urls import path, include
-from .views import download, stream
+from .views import download, download_slice, frame_preview, stream
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("restapi/", include("restapi.urls")),
     path("file/download/<path:file_path>", download, name="download"),
     path("file/stream/<path:file_path>", stream, name="stream"),
+    path("file/slice/<path:file_path>", download_slice, name="slice"),
+    path("file/preview/<path:file_path>", frame_preview, name="preview"),
 ]
@@ -1,15 +1,32 @@
-from typing import Iterable
-from django.http import StreamingHttpResponse, HttpResponse, HttpRequest, FileResponse
+from typing import Iterable, Iterator
+from django.http import (
+    StreamingHttpResponse,
+    HttpResponse,
+    HttpRequest,
+    FileResponse,
+    JsonResponse,
+)
 from django.core.files import File
-from django.core.files.storage import default_storage as storage
+from django.core.files.storage import Storage, default_storage as storage
 from django.contrib.sessions.models import Session
 from django.contrib.auth.models import User
 from django.core.exceptions import PermissionDenied
 from django.conf import settings
-from restapi.models import Topic
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from restapi.download_tokens import check_token
+from restapi.models import VIDEO_EXTENSIONS, Topic
+from backend import preview, s3
+from backend.mcap_slice import slice_mcap
+from mcap.exceptions import McapError
+from urllib.parse import quote
+import hashlib
+import mimetypes
 import os
 import random
+import re
 import string
+import struct
 
 
 def authenticate(sessionid: str):
@@ -40,120 +57,305 @@ def authenticate(sessionid: str):
     return user
 
 
+def check_access(request: HttpRequest, file_path: str) -> int | None:
+    """
+    Checks the signed token of the url without the database.
+    Falls back to the sessionid if there is no valid token.
+
+    Args:
+        request (HttpRequest): request containing token or sessionid as url parameter
+        file_path (str): The requested file, the token has to be issued for this path
+
+    Raises:
+        PermissionDenied: when neither the token nor the session is valid
+
+    Returns:
+        int | None: seconds until the token expires, None if the session was used
+    """
+    token = request.GET.get("token")
+    if token:
+        remaining = check_token(token, file_path)
+        if remaining is not None:
+            return remaining
+
+    try:
+        sessionid = request.GET["sessionid"]
+    except KeyError:
+        raise PermissionDenied
+    _ = authenticate(sessionid)
+    return None
+
+
 def download(request: HttpRequest, file_path: str):
     """
     View that handles downloads. Can handle complete file, single-part and multi-part range requests.
 
     Args:
-        request (HttpRequest): http request optionally containing a range header and sessionid as url parameter
+        request (HttpRequest): http request optionally containing a range header and a token or sessionid as url parameter
         file_path (str): The requested file
 
     Returns:
         403 Response: if session not found or user not authenticated
         404 Response: if file not found
-        200 Response: if whole file requested. Contains the whole file as bytes
+        304 Response: if the file was not modified since the version the client has cached
+        412 Response: if a precondition of If-Match or If-Unmodified-Since failed
+        200 Response: if whole file requested. Contains the whole file as bytes.
+            Also if the range request is conditional (If-Range) and the file was modified
         201 Response: if range requested. A single-part range contains the requested byte range as body.
             A multi part range has a MimeType multipart body which consists of multiple parts with their own headers.\\
             The bodies of these parts are the requested byte ranges
     """
-    # try to find user by sessionid
+    token_max_age = None
     if not settings.DEBUG:
-        try:
-            sessionid = request.GET["sessionid"]
-        except Exception:
-            raise PermissionDenied
-        _ = authenticate(sessionid)
+        token_max_age = check_access(request, file_path)
 
     # open file
+    file_storage = storage
     try:
-        file = storage.open(file_path)
+        file = file_storage.open(file_path)
     except (FileNotFoundError, IsADirectoryError):
-        if file_path.endswith("mp4"):
+        if file_path.endswith(VIDEO_EXTENSIONS):
             # try to find video in other storage
-            video_storage = Topic.video.field.storage
+            file_storage = Topic.video.field.storage
             try:
-                file = video_storage.open(file_path)
+                file = file_storage.open(file_path)
             except (FileNotFoundError, IsADirectoryError):
                 return HttpResponse(f"File not found: {file_path}", status=404)
         else:
             return HttpResponse(f"File not found: {file_path}", status=404)
 
-    if "range" in request.headers:
-        return _range_download(request, file)
+    etag, last_modified = _file_validators(file, file_storage, file_path)
+    response = get_conditional_response(request, etag, last_modified)
+    if response is not None:
+        file.close()
 
-    response = FileResponse(file)
-    response["Content-Disposition"] = (
-        f'attachement; filename="{os.path.basename(file.name)}"'
+    ranged = "range" in request.headers and _if_range_passes(
+        request, etag, last_modified
     )
-    response["Accept-Ranges"] = "bytes"
-    response["Content-Length"] = file.size
+    if response is None and settings.DOWNLOAD_SERVING in (
+        "x-accel-redirect",
+        "x-sendfile",
+    ):
+        response = _offloaded_download(request, file, file_storage, file_path, ranged)
+    if response is None and ranged:
+        response = _range_download(request, file, file_storage)
+    if response is None:
+        response = FileResponse(file)
+        response["Content-Disposition"] = (
+            f'attachement; filename="{os.path.basename(file.name)}"'
+        )
+        response["Accept-Ranges"] = "bytes"
+        response["Content-Length"] = file.size
+
+    if response.status_code in (200, 206, 304):
+        if etag:
+            response["ETag"] = etag
+        if last_modified is not None:
+            response["Last-Modified"] = http_date(last_modified)
+        if token_max_age is not None:
+            # the url itself grants access, so browsers and proxies can cache it
+            response["Cache-Control"] = f"public, max-age={token_max_age}"
     return response
 
 
+def _file_validators(
+    file: File, file_storage: Storage, name: str
+) -> tuple[str | None, int | None]:
+    """Strong ETag and modification time of a file, taken from the storage metadata.\\
+    Files in S3 use the ETag and Last-Modified of the object, which are already known from opening it.
+    Other files get an ETag derived from path, size and modification time.
+
+    Args:
+        file (File): The opened file
+        file_storage (Storage): The storage the file was opened from
+        name (str): The name of the file in the storage
+
+    Returns:
+        tuple[str | None, int | None]: quoted ETag and modification time as timestamp,
+            None if the storage doesn't provide them
+    """
+    if s3.is_s3_storage(file_storage):
+        modified = file.obj.last_modified
+        etag = file.obj.e_tag
+    else:
+        try:
+            modified = file_storage.get_modified_time(name)
+        except (NotImplementedError, OSError):
+            return None, None
+        version = f"{name}:{file.size}:{modified.timestamp()}"
+        etag = f'"{hashlib.sha256(version.encode()).hexdigest()[:32]}"'
+    return etag, (int(modified.timestamp()) if modified else None)
+
+
+def _if_range_passes(
+    request: HttpRequest, etag: str | None, last_modified: int | None
+) -> bool:
+    """Checks the If-Range header. The range is only sent if the client has the current version,
+    otherwise the whole file is sent.
+
+    Args:
+        request (HttpRequest): The original request with the range header
+        etag (str | None): ETag of the file
+        last_modified (int | None): modification time of the file as timestamp
+
+    Returns:
+        bool: True if there is no If-Range header or it matches the file
+    """
+    if_range = request.headers.get("if-range")
+    if if_range is None:
+        return True
+    if if_range.startswith('"'):
+        # strong comparison, weak ETags never match
+        return if_range == etag
+    date = parse_http_date_safe(if_range)
+    return date is not None and date == last_modified
+
+
+# ranges closer than this are sent as one part,
+# the bytes in between are about as much as the headers of another part
+RANGE_MERGE_GAP = 80
+
+_RANGE_SPEC = re.compile(r"(\d*)-(\d*)")
+
+
 def _extract_ranges(range_header: str, file_size: int):
     """Parses the range header and converts the ranges to python ranges
-    Note: ranges in header are inclusive while python ranges are not inclusive on the upper bound
+    Note: ranges in header are inclusive while python ranges are not inclusive on the upper bound.\\
+    Ranges ending after the end of the file are shortened to the file,
+    ranges starting after the end of the file can't be satisfied and are left out.
 
     Args:
-        range_header (str): content of range header as string
+        range_header (str): content of range header as string, without the unit
         file_size (int): the maximum file size
 
+    Raises:
+        ValueError: if a range is malformed
+
     Returns:
-        list[range]: List of the extracted ranges
+        list[range]: List of the extracted ranges that overlap the file
     """
-    ranges = range_header.split(",")
+    specs = [spec.strip() for spec in range_header.split(",")]
+    # empty list elements are allowed, but not an empty list
+    specs = [spec for spec in specs if spec]
+    if not specs:
+        raise ValueError("No range")
+
     new_ranges = []
-    for r in ranges:
-        r = r.split("-")
-        if r[0] and r[1]:
-            r = range(int(r[0]), int(r[1]) + 1)
-        elif r[0]:
-            r = range(int(r[0]), file_size)
-        elif r[1]:
-            r = range(file_size - int(r[1]), file_size)
-        new_ranges.append(r)
+    for spec in specs:
+        match = _RANGE_SPEC.fullmatch(spec)
+        if not match or not any(match.groups()):
+            raise ValueError(f"Invalid range: {spec}")
+        first, last = match.groups()
+        if first:
+            if last and int(last) < int(first):
+                raise ValueError(f"Invalid range: {spec}")
+            stop = min(int(last) + 1, file_size) if last else file_size
+            r = range(int(first), stop)
+        else:
+            # suffix range: the last bytes of the file
+            r = range(max(file_size - int(last), 0), file_size)
+        if r:
+            new_ranges.append(r)
     return new_ranges
 
 
-def _range_download(request: HttpRequest, file: File):
-    """Handles downloads if a range is requested
+def _normalize_ranges(ranges: list[range], gap: int | None = None):
+    """Sorts the ranges and merges ranges that overlap or are at most gap bytes apart,
+    so every byte of the file is read at most once.
+
+    Args:
+        ranges (list[range]): ranges in the order of the request
+        gap (int, optional): max number of bytes between merged ranges. Defaults to RANGE_MERGE_GAP.
+
+    Returns:
+        list[range]: sorted ranges that don't overlap
+    """
+    if gap is None:
+        gap = RANGE_MERGE_GAP
+    merged: list[range] = []
+    for r in sorted(ranges, key=lambda r: r.start):
+        if merged and r.start <= merged[-1].stop + gap:
+            merged[-1] = range(merged[-1].start, max(merged[-1].stop, r.stop))
+        else:
+            merged.append(r)
+    return merged
+
+
+def _requested_ranges(request: HttpRequest, file_size: int):
+    """Parses, validates and normalizes the range header
 
     Args:
         request (HttpRequest): The original request with the range header
-        file (File): The requested file
+        file_size (int): size of the requested file
 
     Returns:
-        201 Response: The requested byte ranges. Either as single range or multipart response with multiple ranges.
+        list[range]: the requested ranges, sorted and merged
+        None: if there are more than DOWNLOAD_MAX_RANGES ranges after merging,
+            the whole file is sent instead
+        400 or 416 Response: if the range header is invalid or no range is in the file
     """
-    if "bytes" in request.headers["range"]:
-        range_header: str = (
-            request.headers["range"].replace("bytes=", "").replace(" ", "")
-        )
-    else:
+    unit, _, range_header = request.headers["range"].partition("=")
+    if unit.strip() != "bytes":
         return HttpResponse(status=400)
 
-    ranges: list[range] = _extract_ranges(range_header, file.size)
+    try:
+        ranges: list[range] = _extract_ranges(range_header, file_size)
+    except ValueError:
+        return HttpResponse(status=400)
 
     if not ranges:
-        return HttpResponse(status=400)
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{file_size}"
+        return response
 
-    for r in ranges:
-        if r.start < 0 or r.stop > file.size:
-            return HttpResponse(status=416)
+    ranges = _normalize_ranges(ranges)
+    if len(ranges) > settings.DOWNLOAD_MAX_RANGES:
+        return None
+    return ranges
+
+
+def _range_download(request: HttpRequest, file: File, file_storage: Storage):
+    """Handles downloads if a range is requested.\\
+    Files in S3 are read with one ranged request per range instead of through the file.
+
+    Args:
+        request (HttpRequest): The original request with the range header
+        file (File): The requested file
+        file_storage (Storage): The storage the file was opened from
+
+    Returns:
+        201 Response: The requested byte ranges. Either as single range or multipart response with multiple ranges.
+        400 or 416 Response: if the range header is invalid or no range is in the file
+        None: if too many ranges are requested and the whole file should be sent
+    """
+    ranges = _requested_ranges(request, file.size)
+    if ranges is None or isinstance(ranges, HttpResponse):
+        return ranges
+
+    from_s3 = s3.is_s3_storage(file_storage)
 
     if len(ranges) > 1:
-        return _multipart_range_download(ranges, file)
+        contents = None
+        if from_s3:
+            contents = s3.iter_ranges(file_storage, file.obj.key, ranges)
+        return _multipart_range_download(ranges, file, contents)
 
     # continue with single part range
 
     requested_range = ranges[0]
 
+    if settings.DOWNLOAD_SERVING == "sendfile" and _has_fileno(file):
+        return _sendfile_range_download(file, requested_range)
+
     range_size = len(requested_range)
 
-    response = StreamingHttpResponse(
-        streaming_content=_chunk_generator(file, requested_range, close=True),
-        status=206,
-    )
+    if from_s3:
+        content = s3.iter_range(file_storage, file.obj.key, requested_range)
+        file.close()
+    else:
+        content = _chunk_generator(file, requested_range, close=True)
+
+    response = StreamingHttpResponse(streaming_content=content, status=206)
 
     response["content-type"] = "Content-Type: application/octet-stream"
     response["content-length"] = range_size
@@ -164,7 +366,121 @@ def _range_download(request: HttpRequest, file: File):
     return response
 
 
-def _multipart_range_download(ranges: list[range], file: File):
+def _has_fileno(file: File) -> bool:
+    """True if the file is a file of the operating system, which can be sent with sendfile"""
+    try:
+        file.fileno()
+    except (AttributeError, OSError, ValueError):
+        # io.UnsupportedOperation is an OSError and ValueError
+        return False
+    return True
+
+
+class _FileRange:
+    """File like object that reads only one byte range of a file.\
+    The WSGI server sends it with os.sendfile (wsgi.file_wrapper), starting at the current
+    position of the file descriptor and sending Content-Length bytes.
+    Other servers read it in blocks like any file.
+    """
+
+    def __init__(self, file: File, r: range):
+        self.file = file
+        self.name = file.name
+        self.remaining = len(r)
+        file.seek(r.start)
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self) -> int:
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def _sendfile_range_download(file: File, r: range):
+    """Single range response that the WSGI server can send without copying through python
+
+    Args:
+        file (File): The requested file
+        r (range): The requested range
+
+    Returns:
+        206 Response: The requested byte range
+    """
+    response = FileResponse(_FileRange(file, r), status=206)
+    response["Content-Type"] = "application/octet-stream"
+    response["Content-Length"] = len(r)
+    response["Content-Range"] = f"bytes {r.start}-{r.stop - 1}/{file.size}"
+    response["Accept-Ranges"] = "bytes"
+    return response
+
+
+def _offloaded_download(
+    request: HttpRequest, file: File, file_storage: Storage, name: str, ranged: bool
+):
+    """Hands the transfer of a local file over to the web server in front of django
+    with the X-Accel-Redirect (nginx) or X-Sendfile (apache, lighttpd) header.\
+    The web server also serves the requested ranges, django only validates them.
+    The web server applies the range header of the request no matter what django
+    decided, so requests with a range header that get the whole file (If-Range doesn't
+    match or more than DOWNLOAD_MAX_RANGES ranges) are not handed over.
+
+    Args:
+        request (HttpRequest): The original request, optionally with a range header
+        file (File): The requested file
+        file_storage (Storage): The storage the file was opened from
+        name (str): The name of the file in the storage
+        ranged (bool): Whether the requested ranges are sent, False if If-Range doesn't match
+
+    Returns:
+        200 Response: empty response with the header for the web server
+        400 or 416 Response: if the range header is invalid
+        None: if the file is not stored in the local filesystem
+            or the whole file is sent for a request with a range header
+    """
+    try:
+        path = file_storage.path(name)
+    except NotImplementedError:
+        return None
+    if not os.path.isfile(path):
+        # e.g. in memory storage
+        return None
+    if "range" in request.headers:
+        if not ranged:
+            return None
+        ranges = _requested_ranges(request, file.size)
+        if ranges is None:
+            return None
+        if isinstance(ranges, HttpResponse):
+            file.close()
+            return ranges
+    file.close()
+
+    response = HttpResponse(
+        content_type=mimetypes.guess_type(name)[0] or "application/octet-stream"
+    )
+    if settings.DOWNLOAD_SERVING == "x-accel-redirect":
+        response["X-Accel-Redirect"] = settings.DOWNLOAD_ACCEL_PREFIX + quote(name)
+    else:
+        response["X-Sendfile"] = path
+    response["Content-Disposition"] = (
+        f'attachement; filename="{os.path.basename(name)}"'
+    )
+    response["Accept-Ranges"] = "bytes"
+    return response
+
+
+def _multipart_range_download(
+    ranges: list[range],
+    file: File,
+    contents: Iterator[Iterable[bytes]] | None = None,
+):
     """Handles multipart range requests\\
     The response consists of multiple parts which each having their own headers and bodies.\\
     The parts are separated by a boundary that is declared in the main headers.\\
@@ -173,6 +489,8 @@ def _multipart_range_download(ranges: list[range], file: File):
     Args:
         ranges (list[range]): requested ranges
         file (File): requested file
+        contents (Iterator[Iterable[bytes]], optional): yields the content of each range in order.
+            Defaults to reading the ranges from the file.
 
     Returns:
         201 Response: The mutlipart response with the different byte ranges.
@@ -188,6 +506,9 @@ def _multipart_range_download(ranges: list[range], file: File):
         random.choices(string.ascii_lowercase + string.digits, k=13)
     )
 
+    if contents is None:
+        contents = (_chunk_generator(file, r) for r in ranges)
+
     for r in ranges:
         # add header for multipart body
         body.append(
@@ -199,15 +520,15 @@ def _multipart_range_download(ranges: list[range], file: File):
         )
         content_length += sum([len(c) for c in body[-1]])
 
-        # add content
-        body.append(_chunk_generator(file, r))
+        # add content, only taken from contents when it is sent
+        body.append(_next_content(contents))
 
     # add indicator for end
     body.append([f"\r\n--{boundary}--\r\n"])
     content_length += sum([len(c) for c in body[-1]])
 
     response = StreamingHttpResponse(
-        streaming_content=_body_generator(file, body, boundary), status=206
+        streaming_content=_body_generator(file, body, boundary, contents), status=206
     )
 
     # set required headers
@@ -251,7 +572,17 @@ def _chunk_generator(
             file.close()
 
 
-def _body_generator(file: File, body: list[Iterable[bytes]], boundary: str):
+def _next_content(contents: Iterator[Iterable[bytes]]):
+    """Yields the chunks of the next range of contents"""
+    yield from next(contents)
+
+
+def _body_generator(
+    file: File,
+    body: list[Iterable[bytes]],
+    boundary: str,
+    contents: Iterator[Iterable[bytes]] | None = None,
+):
     """Takes the body of the multipart range response as a list of iterators and acts like a single iterator,\\
     so that this can be passed to the StreamingHttpResponse.\\
     Closes the file when the last boundary is reached.    
@@ -260,15 +591,21 @@ def _body_generator(file: File, body: list[Iterable[bytes]], boundary: str):
         file (File): The opened file to close it at the end.
         body (list[Iterable[bytes]]): The body as list of iterators.
         boundary (str): The boundary separating the multipart bodies. To check when the end is reached.
+        contents (Iterator[Iterable[bytes]], optional): The contents of the ranges, closed at the end
+            or when the response is closed early.
 
     Yields:
         The body parts either line by line (header) or in byte blocks.
     """
-    for chunks in body:
-        for chunk in chunks:
-            if chunk == f"\r\n--{boundary}--\r\n":
-                file.close()
-            yield chunk
+    try:
+        for chunks in body:
+            for chunk in chunks:
+                if chunk == f"\r\n--{boundary}--\r\n":
+                    file.close()
+                yield chunk
+    finally:
+        if contents is not None:
+            contents.close()
 
 
 def stream(request: HttpRequest, file_path: str):
@@ -277,3 +614,142 @@ def stream(request: HttpRequest, file_path: str):
         del response["Content-Disposition"]
     response["X-Frame-Options"] = ""
     return response
+
+
+def download_slice(request: HttpRequest, file_path: str):
+    """
+    View that streams the messages of a time window of a mcap file as a new, smaller mcap file.\\
+    Only the chunks of the file overlapping the window are read, files in S3 are read with ranged requests.
+
+    Args:
+        request (HttpRequest): http request with the url parameters start and end (log time in nanoseconds, inclusive),
+            optionally topics (comma separated) and a token or sessionid
+        file_path (str): The requested mcap file
+
+    Returns:
+        400 Response: if start or end are missing or invalid, or the file is not a mcap file
+        403 Response: if neither token nor session are valid
+        404 Response: if file not found
+        200 Response: the new mcap file
+    """
+    token_max_age = None
+    if not settings.DEBUG:
+        token_max_age = check_access(request, file_path)
+
+    try:
+        start = int(request.GET["start"])
+        end = int(request.GET["end"])
+    except (KeyError, ValueError):
+        return HttpResponse(
+            "start and end are required as timestamps in nanoseconds", status=400
+        )
+    if end < start:
+        return HttpResponse("end has to be after start", status=400)
+    topics = [topic for topic in request.GET.get("topics", "").split(",") if topic]
+
+    try:
+        file = storage.open(file_path)
+    except (FileNotFoundError, IsADirectoryError):
+        return HttpResponse(f"File not found: {file_path}", status=404)
+
+    source = _open_seekable(storage, file)
+    try:
+        content = slice_mcap(source, start, end, topics or None)
+    except (McapError, struct.error):
+        source.close()
+        return HttpResponse(f"Not a valid mcap file: {file_path}", status=400)
+
+    response = StreamingHttpResponse(
+        streaming_content=content, content_type="application/octet-stream"
+    )
+    name, _ = os.path.splitext(os.path.basename(file_path))
+    response["Content-Disposition"] = (
+        f'attachement; filename="{name}_{start}_{end}.mcap"'
+    )
+    if token_max_age is not None:
+        response["Cache-Control"] = f"public, max-age={token_max_age}"
+    return response
+
+
+def _open_seekable(file_storage: Storage, file: File):
+    """Seekable file for random access, files in S3 are read with ranged requests instead of downloaded
+
+    Args:
+        file_storage (Storage): The storage the file was opened from
+        file (File): The opened file, closed if it is replaced
+
+    Returns:
+        the file or a seekable reader of the S3 object
+    """
+    if s3.is_s3_storage(file_storage):
+        source = s3.open_ranged(file_storage, file.obj.key, file.size)
+        file.close()
+        return source
+    return file
+
+
+def frame_preview(request: HttpRequest, file_path: str):
+    """
+    View that returns downscaled frames of the image topics of a mcap file at a timestamp.\\
+    The frames are cached on the disk, see backend.preview.
+
+    Args:
+        request (HttpRequest): http request with the url parameters t (log time in nanoseconds),
+            optionally topics (comma separated, default all image topics), format (jpeg or webp),
+            max_size (max width and height in pixels) and a token or sessionid
+        file_path (str): The requested mcap file
+
+    Returns:
+        400 Response: if a parameter is invalid, a topic is not an image topic or the file is not a mcap file
+        403 Response: if neither token nor session are valid
+        404 Response: if file not found
+        200 Response: json with the timestamp and a list of frames with topic, timestamp of the message,
+            width, height, content_type and the image as base64 in data
+    """
+    token_max_age = None
+    if not settings.DEBUG:
+        token_max_age = check_access(request, file_path)
+
+    try:
+        timestamp = int(request.GET["t"])
+        max_size = int(request.GET.get("max_size", 320))
+    except (KeyError, ValueError):
+        return HttpResponse(
+            "t is required as timestamp in nanoseconds, max_size has to be an integer",
+            status=400,
+        )
+    if not 16 <= max_size <= 4096:
+        return HttpResponse("max_size has to be between 16 and 4096", status=400)
+    image_format = request.GET.get("format", "jpeg")
+    if image_format not in preview.FORMATS:
+        return HttpResponse(
+            f"format has to be one of {', '.join(preview.FORMATS)}", status=400
+        )
+    topics = [topic for topic in request.GET.get("topics", "").split(",") if topic]
+
+    try:
+        file = storage.open(file_path)
+    except (FileNotFoundError, IsADirectoryError):
+        return HttpResponse(f"File not found: {file_path}", status=404)
+    etag, _ = _file_validators(file, storage, file_path)
+
+    try:
+        frames = preview.get_frames(
+            lambda: _open_seekable(storage, file),
+            f"{file_path}:{etag}",
+            topics or None,
+            timestamp,
+            image_format,
+            max_size,
+        )
+    except preview.PreviewError as e:
+        return HttpResponse(str(e), status=400)
+    except (McapError, struct.error):
+        return HttpResponse(f"Not a valid mcap file: {file_path}", status=400)
+    finally:
+        file.close()
+
+    response = JsonResponse({"timestamp": timestamp, "frames": frames})
+    if token_max_age is not None:
+        response["Cache-Control"] = f"public, max-age={token_max_age}"
+    return response
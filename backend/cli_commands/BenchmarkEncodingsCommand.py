@@ -0,0 +1,59 @@
+from .Command import Command
+from backend.image_encodings import CONVERTERS, benchmark
+
+
+class BenchmarkEncodingsCommand(Command):
+    name = "benchmark-encodings"
+
+    def parser_setup(self, subparser):
+        parser = subparser.add_parser(
+            self.name,
+            help="Measure the conversion of the ROS image encodings to video frames",
+        )
+        parser.add_argument(
+            "--encoding",
+            nargs="+",
+            choices=sorted(CONVERTERS),
+            help="Encodings to measure (default all)",
+        )
+        parser.add_argument(
+            "--width", type=int, default=1920, help="Width of the frames"
+        )
+        parser.add_argument(
+            "--height", type=int, default=1080, help="Height of the frames"
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=20, help="Conversions per encoding"
+        )
+
+    def command(self, args):
+        benchmark_encodings(args.encoding, args.width, args.height, args.repeat)
+
+
+def benchmark_encodings(
+    encodings: list[str] | None = None,
+    width: int = 1920,
+    height: int = 1080,
+    repeat: int = 20,
+):
+    """
+    Prints the fastest conversion of every encoding as table, with the frames per second
+    that one core can convert
+
+    Args:
+        encodings (list[str] | None, optional): the encodings. Defaults to all encodings.
+        width (int, optional): width of the frames. Defaults to 1920.
+        height (int, optional): height of the frames. Defaults to 1080.
+        repeat (int, optional): conversions per encoding. Defaults to 20.
+    """
+    results = []
+    for encoding in encodings or sorted(CONVERTERS):
+        seconds = benchmark(encoding, width, height, repeat)
+        results.append(
+            {
+                "encoding": encoding,
+                "µs per frame": round(seconds * 1_000_000) if seconds else "-",
+                "frames per second": round(1 / seconds) if seconds else "-",
+            }
+        )
+    BenchmarkEncodingsCommand.print_table(results)
@@ -0,0 +1,68 @@
+import logging
+import os
+from .Command import Command
+from restapi import export
+from restapi.models import Mission
+
+
+class ExportCommand(Command):
+    name = "export"
+
+    def parser_setup(self, subparser):
+        parser = subparser.add_parser(
+            self.name, help="Write a whole mission folder into one zip or tar archive"
+        )
+        parser.add_argument("id", type=int, help="Select mission by id")
+        parser.add_argument(
+            "--output",
+            help="Path of the archive (default: <date>_<name>.<archive> in the working directory)",
+        )
+        parser.add_argument(
+            "--archive",
+            choices=export.ARCHIVE_FORMATS,
+            default="zip",
+            help="Archive format (default zip)",
+        )
+        parser.add_argument(
+            "--videos", action="store_true", help="Include the videos of the topics"
+        )
+
+    def command(self, args):
+        export_mission(args.id, args.output, args.archive, args.videos)
+
+
+def export_mission(
+    mission_id: int,
+    output: str | None = None,
+    archive_format: str = "zip",
+    videos: bool = False,
+) -> str | None:
+    """
+    Write a mission folder into an archive, without temporary files
+
+    Args:
+        mission_id (int): id of the mission
+        output (str | None, optional): path of the archive.
+            Defaults to <date>_<name>.<archive_format> in the working directory.
+        archive_format (str, optional): one of export.ARCHIVE_FORMATS. Defaults to "zip".
+        videos (bool, optional): include the videos of the topics. Defaults to False.
+
+    Returns:
+        str | None: path of the written archive, None if the mission doesn't exist
+    """
+    try:
+        mission = Mission.objects.get(id=mission_id)
+    except Mission.DoesNotExist:
+        logging.error(f"Mission with ID {mission_id} not found")
+        return None
+
+    if output is None:
+        output = f"{export.mission_folder(mission)}.{archive_format}"
+    entries = export.mission_entries(mission, videos)
+    with open(output, "wb") as file:
+        for chunk in export.stream_archive(entries, archive_format):
+            file.write(chunk)
+    logging.info(
+        f"Exported {len(entries)} files of mission '{mission.name}' to {os.path.abspath(output)}"
+    )
+    return output
@@ -1,14 +1,31 @@
+from collections import deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from dataclasses import dataclass, field
+from multiprocessing import get_context
 from pathlib import Path
+from typing import Iterable, Iterator
 import cv2
+import django
 from rosbags.highlevel import AnyReader
 from rosbags.typesys import Stores, get_typestore
 import numpy as np
 import os
 from .Command import Command
 from django.core.files.storage import FileSystemStorage, Storage
-from restapi.models import File, Topic
+from django.db import connections
+from restapi.models import VIDEO_EXTENSIONS, File, Topic
 from django.conf import settings
 import logging
+import queue
+import threading
+import time
+from backend import image_encodings, preview, s3
 from mcap.reader import make_reader
 
 
@@ -23,12 +40,52 @@ class GenerateVideosCommand(Command):
         parser.add_argument(
             "--path",
             required=True,
-            help="Path to a mcap file",
+            nargs="+",
+            help="Paths to mcap files",
             choices=File.objects.values_list("file", flat=True),
         )
+        add_video_arguments(parser)
+        parser.add_argument(
+            "--overwrite",
+            action="store_true",
+            help="Generate the videos again even if they exist",
+        )
 
     def command(self, args):
-        generate_videos(args.path)
+        generate_videos_parallel(
+            args.path,
+            args.workers,
+            get_max_memory(args),
+            args.passthrough,
+            args.overwrite,
+        )
+
+
+def add_video_arguments(parser):
+    """Options of the video generation, shared with the sync command"""
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Number of files whose videos are generated in parallel (default VIDEO_WORKERS)",
+    )
+    parser.add_argument(
+        "--max-memory",
+        type=int,
+        help="Memory budget of all workers in MiB, 0 for no limit (default VIDEO_MAX_MEMORY)",
+    )
+    parser.add_argument(
+        "--passthrough",
+        action="store_true",
+        default=None,
+        help="Mux JPEG images of compressed topics as MJPEG without decoding them, "
+        "the .avi videos can't be played in the web UI (default VIDEO_JPEG_PASSTHROUGH)",
+    )
+
+
+def get_max_memory(args) -> int | None:
+    if args.max_memory is None:
+        return None
+    return args.max_memory * 1024 * 1024
 
 
 logger = logging.getLogger()
@@ -52,8 +109,11 @@ def extract_topics_from_mcap(mcap_path, file_storage: Storage = None):
         reader = make_reader(f)
         summary = reader.get_summary()
         schema_map = {schema.id: schema.name for schema in summary.schemas.values()}
-        channel_message_counts = summary.statistics.channel_message_counts
-        duration = get_duration(mcap_path)
+        statistics = summary.statistics
+        channel_message_counts = statistics.channel_message_counts
+        duration = (
+            statistics.message_end_time - statistics.message_start_time
+        ) * 10**-9
         topic_info = {
             channel.topic: {
                 "name": channel.topic,
@@ -68,7 +128,9 @@ def extract_topics_from_mcap(mcap_path, file_storage: Storage = None):
         return topic_info
 
 
-def generate_videos(path: str):
+def generate_videos(
+    path: str, passthrough: bool | None = None, overwrite: bool = False
+):
     """wrapper for generating videos and use django storages\\
     If the files are stored in the local filesystem, videos are directly generated there.\\
     If the files are in a remote storage (like S3) the files are copied to the TEMP_FOLDER,
@@ -78,39 +140,56 @@ def generate_videos(path: str):
 
     Args:
         path (str): path to the mcap file
+        passthrough (bool | None, optional): mux JPEG images of compressed topics without
+            decoding them. Defaults to VIDEO_JPEG_PASSTHROUGH.
+        overwrite (bool, optional): generate existing videos again. Defaults to False.
     """
-    try:
-        file = File.objects.get(file=path).file
-    except File.DoesNotExist:
+    if not File.objects.filter(file=path).exists():
         logger.error(f"File not found: '{path}'")
         return []
 
+    return _generate_videos(path, passthrough, overwrite)
+
+
+def _generate_videos(
+    path: str, passthrough: bool | None = None, overwrite: bool = False
+) -> list[str]:
+    """generate_videos without database queries, so it can run in worker processes"""
+    if passthrough is None:
+        passthrough = settings.VIDEO_JPEG_PASSTHROUGH
     storage = File.file.field.storage
 
-    local_storage, local_path = _get_file_from_external(storage, file)
+    local_storage, local_path = _get_file_from_external(storage, path)
 
     video_paths: list[str] = []
 
     try:
         # generate videos
-        topics = get_video_topics(local_path)
         topic_data = extract_topics_from_mcap(path, local_storage)
-        for topic in topics:
-            filename = create_video_filename(topic, local_path)
-            # skip existing videos
-            if settings.STORE_VIDEO_LOCALLY:
-                if local_storage.exists(filename):
-                    continue
-            else:
-                if storage.exists(filename):
-                    continue
-
-            logger.info(f"Generating video for topic '{topic}'")
-            data = get_video_data(local_path, topic)
-            video_path = create_video(
-                data, topic, local_path, topic_data[topic]["frequency"]
+        topics = []
+        for topic, info in topic_data.items():
+            if info["type"] not in VIDEO_TYPES:
+                continue
+            # skip existing videos, passthrough videos of compressed topics are avi
+            video_storage = local_storage if settings.STORE_VIDEO_LOCALLY else storage
+            extensions = VIDEO_EXTENSIONS if passthrough else VIDEO_EXTENSIONS[:1]
+            if not overwrite and any(
+                video_storage.exists(
+                    create_video_filename(topic, local_path, extension)
+                )
+                for extension in extensions
+            ):
+                continue
+            topics.append(topic)
+
+        if topics:
+            logger.info(f"Generating videos for topics {', '.join(topics)}")
+            # one pass over the file for all topics
+            video_paths += create_videos(
+                get_videos_data(local_path, topics, passthrough),
+                local_path,
+                {topic: topic_data[topic]["frequency"] for topic in topics},
             )
-            video_paths.append(video_path)
 
     except (FileNotFoundError, IsADirectoryError):
         logger.error(f"File not found: '{path}'")
@@ -121,21 +200,180 @@ def generate_videos(path: str):
     return video_paths
 
 
+@dataclass
+class VideoJob:
+    """Result of generating the videos of one mcap file"""
+
+    path: str
+    video_paths: list[str] = field(default_factory=list)
+    seconds: float = 0
+    error: str | None = None
+
+
+def _run_job(path: str, passthrough: bool | None, overwrite: bool) -> VideoJob:
+    start = time.perf_counter()
+    try:
+        video_paths = _generate_videos(path, passthrough, overwrite)
+    except Exception as e:
+        return VideoJob(path, seconds=time.perf_counter() - start, error=str(e))
+    return VideoJob(path, video_paths, time.perf_counter() - start)
+
+
+def _log_job(job: VideoJob):
+    if job.error:
+        logger.error(f"Error generating videos for '{job.path}': {job.error}")
+    else:
+        logger.info(
+            f"Generated {len(job.video_paths)} videos for '{job.path}' in {job.seconds:.1f}s"
+        )
+
+
+def estimate_memory(path: str) -> int:
+    """Rough peak memory of generating the videos of a mcap file in a worker process:
+    the process itself, one encoder per image topic and the buffered frames.
+    A frame is at most as large as the largest decompressed chunk.
+
+    Args:
+        path (str): path to the mcap file in the storage
+
+    Returns:
+        int: estimated memory in bytes
+    """
+    storage = File.file.field.storage
+    try:
+        if s3.is_s3_storage(storage):
+            with storage.open(path) as file:
+                key, size = file.obj.key, file.size
+            source = s3.open_ranged(storage, key, size)
+        else:
+            source = storage.open(path, "rb")
+        with source:
+            summary = make_reader(source).get_summary()
+    except Exception:
+        # the job reports the error
+        return WORKER_MEMORY
+    if summary is None:
+        return WORKER_MEMORY
+    schemas = {id: schema.name for id, schema in summary.schemas.items()}
+    topics = sum(
+        schemas.get(channel.schema_id) in VIDEO_TYPES
+        for channel in summary.channels.values()
+    )
+    largest_chunk = max(
+        (index.uncompressed_size for index in summary.chunk_indexes), default=0
+    )
+    return (
+        WORKER_MEMORY
+        + topics * ENCODER_MEMORY
+        + (FRAME_BUFFER_SIZE + topics + 1) * largest_chunk
+    )
+
+
+def _init_worker():
+    # the forked worker must not use the database and S3 connections of the parent
+    connections.close_all()
+    s3.reset_connections(File.file.field.storage)
+    s3.reset_connections(Topic.video.field.storage)
+
+
+def generate_videos_parallel(
+    paths: list[str],
+    workers: int | None = None,
+    max_memory: int | None = None,
+    passthrough: bool | None = None,
+    overwrite: bool = False,
+) -> list[VideoJob]:
+    """Generates the videos of several mcap files in parallel worker processes,
+    one job per file. A job is only started if the estimated memory of all
+    running jobs stays within max_memory, at least one job is always running.\\
+    Existing videos are skipped and videos of files in a remote storage are moved
+    back to it like in generate_videos.
+
+    Args:
+        paths (list[str]): paths to the mcap files
+        workers (int | None, optional): number of worker processes, 1 generates the videos
+            in this process. Defaults to VIDEO_WORKERS.
+        max_memory (int | None, optional): memory budget in bytes, 0 for no limit.
+            Defaults to VIDEO_MAX_MEMORY.
+        passthrough (bool | None, optional): mux JPEG images of compressed topics without
+            decoding them. Defaults to VIDEO_JPEG_PASSTHROUGH.
+        overwrite (bool, optional): generate existing videos again. Defaults to False.
+
+    Returns:
+        list[VideoJob]: the result and the duration of every job, in the order of the paths
+    """
+    workers = workers or settings.VIDEO_WORKERS
+    if max_memory is None:
+        max_memory = settings.VIDEO_MAX_MEMORY
+
+    existing = set(File.objects.filter(file__in=paths).values_list("file", flat=True))
+    jobs = {path: VideoJob(path, error="File not found") for path in paths}
+    for path in paths:
+        if path not in existing:
+            logger.error(f"File not found: '{path}'")
+    pending = deque(path for path in paths if path in existing)
+    start = time.perf_counter()
+
+    if workers <= 1 or len(pending) <= 1:
+        for path in pending:
+            jobs[path] = _run_job(path, passthrough, overwrite)
+            _log_job(jobs[path])
+    else:
+        estimates = {path: estimate_memory(path) for path in pending}
+        running: dict[Future, str] = {}
+        # the default start method of the platform, fork isn't available on Windows
+        # and unsafe on macOS. Forked workers inherit the setup of django from
+        # this process, spawned workers set it up again.
+        context = get_context()
+        forked = context.get_start_method() == "fork"
+        # the workers open their own database connections
+        connections.close_all()
+        with ProcessPoolExecutor(
+            workers,
+            mp_context=context,
+            initializer=_init_worker if forked else django.setup,
+        ) as pool:
+            while pending or running:
+                used = sum(estimates[path] for path in running.values())
+                while (
+                    pending
+                    and len(running) < workers
+                    and (
+                        not running
+                        or not max_memory
+                        or used + estimates[pending[0]] <= max_memory
+                    )
+                ):
+                    path = pending.popleft()
+                    used += estimates[path]
+                    running[pool.submit(_run_job, path, passthrough, overwrite)] = path
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path = running.pop(future)
+                    jobs[path] = future.result()
+                    _log_job(jobs[path])
+
+    logger.info(
+        f"Generated videos of {len(existing)} files in {time.perf_counter() - start:.1f}s"
+    )
+    return [jobs[path] for path in paths]
+
+
 def _get_file_from_external(
-    external_storage: Storage, file: File
+    external_storage: Storage, name: str
 ) -> tuple[Storage, Path]:
     """Checks if files are stored in a remote storage and moves them to
     the local Filesystem
 
     Args:
         external_storage (Storage): storage where to look for files
-        file (File): File model object
+        name (str): path of the mcap file in the storage
 
     Returns:
         tuple[Storage, Path]: The storage where the files are accessible locally and the path to the folder
     """
     if isinstance(external_storage, FileSystemStorage):
-        return external_storage, Path(os.path.dirname(file.path))
+        return external_storage, Path(os.path.dirname(external_storage.path(name)))
 
     if settings.STORE_VIDEO_LOCALLY:
         # generate videos directly in local folder
@@ -144,20 +382,23 @@ def _get_file_from_external(
         # generate videos in folder for temporary files
         local_storage = FileSystemStorage(settings.TEMP_FOLDER)
 
-    metadata_path = os.path.dirname(file.name) + "/metadata.yaml"
+    metadata_path = os.path.dirname(name) + "/metadata.yaml"
 
     checksum_logger = logging.getLogger("botocore.httpchecksum")
     checksum_logger.disabled = True  # Disable checksum messages
 
     logger.info("Moving files to local storage")
     # Move files from remote storage to local filesystem
-    with file.open() and external_storage.open(metadata_path) as metadata_file:
-        local_storage.save(file.name, file)
+    with (
+        external_storage.open(name) as file,
+        external_storage.open(metadata_path) as metadata_file,
+    ):
+        local_storage.save(name, file)
         local_storage.save(metadata_path, metadata_file)
 
     checksum_logger.disabled = False
 
-    local_path = Path(os.path.dirname(local_storage.path(file.name)))
+    local_path = Path(os.path.dirname(local_storage.path(name)))
 
     return local_storage, local_path
 
@@ -192,6 +433,9 @@ def _move_file_to_external(
     for video_path in video_paths:
         video_path = video_path[len(str(local_storage.location)) + 1 :]
         with local_storage.open(video_path) as file:
+            # a regenerated video replaces the old one instead of getting a new name
+            if external_storage.exists(video_path):
+                external_storage.delete(video_path)
             external_storage.save(video_path, file)
     _delete_all(local_storage, path)
 
@@ -218,6 +462,20 @@ def _delete_all(storage: Storage, path: Path):
         parent = os.path.dirname(parent)
 
 
+IMAGE_TYPE = "sensor_msgs/msg/Image"
+COMPRESSED_IMAGE_TYPE = "sensor_msgs/msg/CompressedImage"
+VIDEO_TYPES = (IMAGE_TYPE, COMPRESSED_IMAGE_TYPE)
+
+# max number of decoded frames waiting to be encoded
+FRAME_BUFFER_SIZE = 8
+
+# threads decoding compressed images, opencv releases the GIL while decoding
+DECODE_THREADS = min(4, os.cpu_count() or 1)
+
+# estimated memory of a worker process and of one video encoder
+WORKER_MEMORY = 256 * 1024 * 1024
+ENCODER_MEMORY = 64 * 1024 * 1024
+
 # Create a type store to use if the bag has no message definitions.
 typestore = get_typestore(Stores.ROS2_FOXY)
 
@@ -225,74 +483,260 @@ typestore = get_typestore(Stores.ROS2_FOXY)
 def get_video_topics(path):
     # Open the bag file using AnyReader
     with AnyReader([path], default_typestore=typestore) as reader:
-        # Extract topics that have message type "sensor_msgs/msg/Image"
-        connections = [
-            x.topic for x in reader.connections if x.msgtype == "sensor_msgs/msg/Image"
-        ]
+        # Extract topics that have message type "sensor_msgs/msg/Image" or CompressedImage
+        connections = [x.topic for x in reader.connections if x.msgtype in VIDEO_TYPES]
 
         return connections
 
 
-def get_video_data(path, topic):
-    data = []
-    width = 0
-    height = 0
-    step = 0
-    # Open the bag file using AnyReader
-    with AnyReader([path], default_typestore=typestore) as reader:
-        # Filter connections for the specified topic
-        connections = [x for x in reader.connections if x.topic == topic]
-        # Iterate through messages in the filtered connections
-        for connection, timestamp, rawdata in reader.messages(connections=connections):
-            # Deserialize the raw data to get the message
-            msg = reader.deserialize(rawdata, connection.msgtype)
-            width = msg.width
-            height = msg.height
-            step = msg.step
-            if msg.encoding == "mono16":
-                # Convert raw bytes to numpy 16-bit grayscale image
-                tmp = np.frombuffer(msg.data, dtype=np.uint16).reshape(
-                    (height, width, 1)
-                )
+def _frame_from_message(msg) -> np.ndarray:
+    # see backend.image_encodings for the supported encodings
+    frame = image_encodings.to_frame(msg)
+    if frame.ndim == 2:
+        return frame[:, :, np.newaxis]
+    return frame
 
-                # Normalize to 8-bit range (0-255) for visualization
-                normalized = (tmp / 256).astype(np.uint8)
 
-                data.append(normalized)
-            else:
-                # Normal RGB or Mono8 case
-                data.append(
-                    np.frombuffer(msg.data, dtype=np.uint8).reshape(
-                        height, width, int(step / width)
-                    )
-                )
+@dataclass
+class JpegFrame:
+    """A JPEG image muxed into the video without decoding"""
 
-    return data
+    data: np.ndarray
+    width: int
+    height: int
 
 
-def create_video_filename(topic, save_dir):
-    return os.path.join(save_dir, str(topic).replace("/", "-") + ".mp4")
+def _frame_from_compressed(msg) -> np.ndarray:
+    frame = preview.frame_from_compressed(msg)
+    if frame.ndim == 2:
+        return frame[:, :, np.newaxis]
+    return frame
 
 
-def create_video(data, topic, save_dir, fps=30):
-    # Print data and shape of the first frame for debugging
-    height, width, channels = data[0].shape
-    # Create a filename based on the topic name
-    filename = create_video_filename(topic, save_dir)
-    # Initialize the video writer
-    video = cv2.VideoWriter(
-        filename,
-        cv2.VideoWriter_fourcc(*"avc1"),
-        fps,
-        (width, height),
-        isColor=channels == 3,
-    )
+def _jpeg_frame(msg, size: tuple[int, int] | None) -> JpegFrame:
+    """The JPEG of a compressed image, other formats are converted to JPEG.
+    The size is only determined by decoding if it isn't known yet."""
+    if preview.is_jpeg(msg) and size is not None:
+        return JpegFrame(np.frombuffer(msg.data, dtype=np.uint8), *size)
+    frame = preview.frame_from_compressed(msg)
+    height, width = frame.shape[:2]
+    if preview.is_jpeg(msg):
+        return JpegFrame(np.frombuffer(msg.data, dtype=np.uint8), width, height)
+    success, data = cv2.imencode(".jpg", frame)
+    if not success:
+        raise ValueError(f"Could not encode image with format '{msg.format}'")
+    return JpegFrame(data.reshape(-1), width, height)
+
 
-    # Write each frame to the video file
-    for frame in data:
-        video.write(frame)
+def get_videos_data(
+    path, topics: list[str], passthrough: bool = False
+) -> Iterator[tuple[str, np.ndarray | JpegFrame]]:
+    """Decodes the frames of several image topics in one pass over the bag,
+    so every chunk is read and decompressed once, independent of the number of topics.\\
+    Compressed images are decoded by DECODE_THREADS threads, at most FRAME_BUFFER_SIZE
+    frames ahead of the yielded frame.
+
+    Args:
+        path: path to the folder of the rosbag
+        topics (list[str]): image or compressed image topics of the rosbag
+        passthrough (bool, optional): yield JPEG images of compressed topics as JpegFrame
+            without decoding them. Defaults to False.
+
+    Yields:
+        (topic, frame) in the order of the messages, the frames as arrays of shape
+        (height, width, channels) or JpegFrame
+    """
+    executor = ThreadPoolExecutor(DECODE_THREADS)
+    # frames in decoding, in the order of the messages
+    pending: deque[tuple[str, Future]] = deque()
+    # size of the passthrough videos, taken from their first frame
+    sizes: dict[str, tuple[int, int]] = {}
+    try:
+        # Open the bag file using AnyReader
+        with AnyReader([path], default_typestore=typestore) as reader:
+            # Filter connections for the specified topics
+            connections = [x for x in reader.connections if x.topic in topics]
+            # Iterate through messages in the filtered connections
+            for connection, _, rawdata in reader.messages(connections=connections):
+                # Deserialize the raw data to get the message
+                msg = reader.deserialize(rawdata, connection.msgtype)
+                topic = connection.topic
+                if connection.msgtype != COMPRESSED_IMAGE_TYPE:
+                    frame = _frame_from_message(msg)
+                    if not pending:
+                        yield topic, frame
+                        continue
+                    future = Future()
+                    future.set_result(frame)
+                elif passthrough and topic not in sizes:
+                    # the first frame is decoded to get the size of the video
+                    first = _jpeg_frame(msg, None)
+                    sizes[topic] = (first.width, first.height)
+                    future = Future()
+                    future.set_result(first)
+                elif passthrough:
+                    future = executor.submit(_jpeg_frame, msg, sizes[topic])
+                else:
+                    future = executor.submit(_frame_from_compressed, msg)
+                pending.append((topic, future))
+                if len(pending) >= FRAME_BUFFER_SIZE:
+                    topic, future = pending.popleft()
+                    yield topic, future.result()
+        while pending:
+            topic, future = pending.popleft()
+            yield topic, future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
 
-    # Release the video writer
-    video.release()
 
-    return filename
+def get_video_data(path, topic) -> Iterator[np.ndarray]:
+    """Decodes the frames of an image topic one at a time, in the order of the messages
+
+    Args:
+        path: path to the folder of the rosbag
+        topic: an image topic of the rosbag
+
+    Yields:
+        the frames as arrays of shape (height, width, channels)
+    """
+    for _, frame in get_videos_data(path, [topic]):
+        yield frame
+
+
+def buffered(items: Iterable, size: int = FRAME_BUFFER_SIZE) -> Iterator:
+    """Iterates in a background thread at most size items ahead of the consumer,
+    so decoding the next frames overlaps with encoding the current one.
+
+    Args:
+        items (Iterable): e.g. the frames of get_video_data
+        size (int, optional): max number of buffered items. Defaults to FRAME_BUFFER_SIZE.
+
+    Yields:
+        the items in the same order, exceptions of the iteration are raised again
+    """
+    buffer = queue.Queue(maxsize=size)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        # a stopped consumer doesn't take items anymore
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put((True, item)):
+                    return
+        except Exception as e:
+            put((False, e))
+            return
+        put((False, None))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            has_item, item = buffer.get()
+            if not has_item:
+                if item is not None:
+                    raise item
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def create_video_filename(topic, save_dir, extension: str = VIDEO_EXTENSIONS[0]):
+    return os.path.join(save_dir, str(topic).replace("/", "-") + extension)
+
+
+def create_videos(
+    data: Iterable[tuple[str, np.ndarray | JpegFrame]],
+    save_dir,
+    fps: dict[str, float],
+) -> list[str]:
+    """Writes the frames of several topics to one video file per topic while they are
+    decoded, only the frames in the buffer are held in memory.\\
+    Topics starting with a JpegFrame are muxed as MJPEG into an avi file without
+    encoding, because mp4 can't hold MJPEG. Other topics are encoded as H.264 into
+    an mp4 file.
+
+    Args:
+        data (Iterable[tuple[str, np.ndarray | JpegFrame]]): (topic, frame),
+            e.g. from get_videos_data
+        save_dir: folder of the videos
+        fps (dict[str, float]): frames per second of the topics, 30 if missing
+
+    Returns:
+        list[str]: filenames of the videos of the topics with frames
+    """
+    videos: dict[str, cv2.VideoWriter] = {}
+    filenames: list[str] = []
+    frames = buffered(data)
+    try:
+        for topic, frame in frames:
+            video = videos.get(topic)
+            if video is None:
+                # Create a filename based on the topic name
+                filename = create_video_filename(topic, save_dir)
+                # the size of the video is the size of the first frame
+                if isinstance(frame, JpegFrame):
+                    # mux the JPEG images as MJPEG without decoding them
+                    filename = create_video_filename(
+                        topic, save_dir, VIDEO_EXTENSIONS[1]
+                    )
+                    video = cv2.VideoWriter(
+                        filename,
+                        cv2.CAP_FFMPEG,
+                        cv2.VideoWriter_fourcc(*"MJPG"),
+                        fps.get(topic, 30),
+                        (frame.width, frame.height),
+                        [cv2.VIDEOWRITER_PROP_RAW_VIDEO, 1],
+                    )
+                else:
+                    height, width, channels = frame.shape
+                    # Initialize the video writer
+                    video = cv2.VideoWriter(
+                        filename,
+                        cv2.VideoWriter_fourcc(*"avc1"),
+                        fps.get(topic, 30),
+                        (width, height),
+                        isColor=channels == 3,
+                    )
+                videos[topic] = video
+                filenames.append(filename)
+            if isinstance(frame, JpegFrame):
+                video.write(frame.data.reshape(1, -1))
+            else:
+                video.write(frame)
+    finally:
+        frames.close()
+        # Release the video writers
+        for video in videos.values():
+            video.release()
+
+    return filenames
+
+
+def create_video(data: Iterable[np.ndarray], topic, save_dir, fps=30) -> str | None:
+    """Writes the frames of one topic to a mp4 file while they are decoded
+
+    Args:
+        data (Iterable[np.ndarray]): the frames, e.g. from get_video_data
+        topic: topic of the frames, used for the filename
+        save_dir: folder of the video
+        fps (int, optional): frames per second. Defaults to 30.
+
+    Returns:
+        str | None: filename of the video, None if there are no frames
+    """
+    filenames = create_videos(
+        ((topic, frame) for frame in data), save_dir, {topic: fps}
+    )
+    return filenames[0] if filenames else None
@@ -0,0 +1,55 @@
+import logging
+from .Command import Command
+from restapi import search
+from restapi.models import Mission
+from restapi.serializer import MissionSerializer
+from restapi.signals import bulk_changed
+
+
+class SearchCommand(Command):
+    name = "search"
+
+    def parser_setup(self, subparser):
+        self.parser = subparser.add_parser(
+            self.name,
+            help="Full text search over mission name, location, notes, tags and topics",
+        )
+        self.parser.add_argument("query", nargs="*", help="Words to search for")
+        self.parser.add_argument(
+            "--limit", type=int, default=50, help="Max number of results (default 50)"
+        )
+        self.parser.add_argument(
+            "--rebuild-index",
+            action="store_true",
+            help="Recreate the search index of all missions",
+        )
+
+    def command(self, args):
+        if args.rebuild_index:
+            rebuild_index()
+        if args.query:
+            search_missions(" ".join(args.query), args.limit)
+        elif not args.rebuild_index:
+            self.parser.print_help()
+
+
+def search_missions(query: str, limit: int = 50):
+    """
+    Print the missions matching the query as table, best match first
+    ### Parameters
+    query: words to search for\\
+    limit: max number of results
+    """
+    ids = search.search_missions(query, limit)
+    missions = Mission.objects.in_bulk(ids)
+    serializer = MissionSerializer(
+        [missions[id] for id in ids if id in missions], many=True
+    )
+    SearchCommand.print_table(serializer.data)
+
+
+def rebuild_index():
+    """Recreate the search index, needed after changes outside of django"""
+    search.rebuild_index()
+    bulk_changed.send(sender=Mission)
+    logging.info(f"Indexed {Mission.objects.count()} missions")
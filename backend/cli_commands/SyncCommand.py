@@ -1,15 +1,19 @@
 import os
 import logging
 from django.core.files.storage import DefaultStorage
-from restapi.serializer import TagSerializer
+from restapi.export import mission_metadata
 from .Command import Command
-from .GenerateVideoCommand import generate_videos
+from .GenerateVideoCommand import (
+    add_video_arguments,
+    generate_videos_parallel,
+    get_max_memory,
+)
 from .AddFolderCommand import add_mission_from_folder
 from .DeleteFolderCommand import delete_mission_from_folder
-from restapi.models import Mission, Tag, File, Topic
+from restapi.models import VIDEO_EXTENSIONS, Mission, Tag, File, Topic
+from restapi.signals import bulk_changed, coalesce_changes, reindex_missions
 import json
 from mcap.reader import make_reader
-from pathlib import Path
 
 
 # Create a custom logging handler to track if any log message was emitted
@@ -26,124 +30,232 @@ class SyncCommand(Command):
     name = "sync"
 
     def parser_setup(self, subparser):
-        _ = subparser.add_parser(self.name, help="synchronize filesystem and database")
+        parser = subparser.add_parser(
+            self.name, help="synchronize filesystem and database"
+        )
+        add_video_arguments(parser)
 
     def command(self, args):
-        sync_folder()
+        sync_folder(args.workers, get_max_memory(args), args.passthrough)
 
 
 storage = DefaultStorage()
 
 
-def sync_files(mission_path, mission):
+def add_topics(file: File, metadata: dict, subfolder_path: str):
+    """
+    Adds the topics of a new file with their videos.\
+    The topics are validated in memory and created with one query,
+    the signals are sent once for all of them.
+    """
+    # get all video files in this folder
+    videos_in_folder = {
+        video: os.path.join(subfolder_path, video)
+        for video in storage.listdir(subfolder_path)[1]
+        if video.endswith(VIDEO_EXTENSIONS)
+    }
+    video_storage = Topic.video.field.storage
+    existing = set(Topic.objects.filter(file=file).values_list("name", flat=True))
+    topics = []
+    # process each topic in the metadata
+    for topic_name, topic_data in metadata.items():
+        # check if topic already exists
+        if topic_data["name"] in existing:
+            continue
+        # Try to find a corresponding video file, mp4 before avi
+        matching_video = next(
+            (
+                videos_in_folder[name]
+                for name in (
+                    topic_name.replace("/", "-") + extension
+                    for extension in VIDEO_EXTENSIONS
+                )
+                if name in videos_in_folder
+            ),
+            None,
+        )
+
+        try:
+            topic = Topic(
+                file=file,
+                name=topic_data["name"],
+                type=topic_data["type"],
+                message_count=topic_data["message_count"],
+                frequency=topic_data["frequency"],
+            )
+            if matching_video and video_storage.exists(matching_video):
+                topic.video = matching_video
+            # field validators including the denylist, without queries;
+            # the file is known and the names are checked against the existing ones
+            topic.full_clean(
+                exclude=["file"], validate_unique=False, validate_constraints=False
+            )
+            topics.append(topic)
+            existing.add(topic.name)
+        except Exception as e:
+            logging.error(f"Error processing topic {topic_name}: {e}")
+
+    if topics:
+        Topic.objects.bulk_create(topics)
+        bulk_changed.send(sender=Topic)
+        reindex_missions(file.mission_id)
+
+
+NewFile = tuple[File, dict, str]
+"""A file added by a sync with its topic metadata and its folder"""
+
+
+def sync_files(
+    mission_path,
+    mission,
+    workers: int | None = None,
+    max_memory: int | None = None,
+    passthrough: bool | None = None,
+):
     """
     Syncs .mcap and metadata files:
     - Adds new files if they appear in the filesystem.
     - Removes files from the database if they are missing.
+
+    The videos of the new files are generated with `workers` processes in parallel
+    within the memory budget `max_memory`, see generate_videos_parallel.
+    With `passthrough` JPEG images of compressed topics are muxed without decoding.
+    """
+    add_topics_with_videos(
+        sync_file_rows(mission_path, mission), workers, max_memory, passthrough
+    )
+
+
+def sync_file_rows(mission_path, mission) -> list[NewFile]:
+    """
+    Adds the new .mcap files of a mission to the database and removes the missing ones,
+    without their topics and videos.\
+    Files without topics, left by a sync that was interrupted before their topics were
+    added, are returned again with the new files.
+    ### Returns
+    the new files, to be passed to add_topics_with_videos
     """
-    BASE_DIR = Path(__file__).resolve().parent.parent
-    BASE_DIR = Path.joinpath(BASE_DIR, "media")
     existing_files = {file.file.name for file in File.objects.filter(mission=mission)}
+    files_without_topics = {
+        file.file.name: file
+        for file in File.objects.filter(mission=mission, topic=None)
+    }
     current_files = set()
+    new_files: list[NewFile] = []
 
-    # Find all .mcap and metadata files from the mission in the filesystem
-    for folder in storage.listdir(mission_path)[0]:
-        folder_path = os.path.join(mission_path, folder)
-        typ = os.path.basename(folder_path)
-
-        for subfolder in storage.listdir(folder_path)[0]:
-            subfolder_path = os.path.join(folder_path, subfolder)
-            mcap_path = None
-
-            for item in storage.listdir(subfolder_path)[1]:
-                item_path = os.path.join(subfolder_path, item)
-                if item_path.endswith(".mcap"):
-                    mcap_path = item_path
-
-            if not mcap_path:
-                continue
-
-            current_files.add(mcap_path)  # Track found files
-            metadata = extract_topics_from_mcap(mcap_path)
-
-            # Add new found files to the database
-            if mcap_path not in existing_files:
-                try:
-                    size = storage.size(mcap_path)
-                    duration = get_duration_from_mcap(mcap_path)
-                    file = File(
-                        robot=None,
-                        duration=duration,
-                        size=size,
-                        file=mcap_path,
-                        mission_id=mission.id,
-                        type=typ,
-                    )
-                    file.save()
-                    logging.info(
-                        f"Added new file {mcap_path} for mission {mission.name}."
-                    )
-                    # generate videos for the topics
-                    try:
-                        generate_videos(mcap_path)
-                    except Exception as e:
-                        logging.error(f"Error generating videos: {e}")
-
-                    # get all video files in this folder
-                    videos_in_folder = {
-                        video: os.path.join(subfolder_path, video)
-                        for video in storage.listdir(subfolder_path)[1]
-                        if video.endswith(".mp4")
-                    }
-                    # process each topic in the metadata
-                    for topic_name, topic_data in metadata.items():
-                        # Try to find a corresponding video file
-                        matching_video = videos_in_folder.get(
-                            topic_name.replace("/", "-") + ".mp4", None
-                        )
+    # the signals of the changed rows are sent once, see coalesce_changes
+    with coalesce_changes():
+        # Find all .mcap and metadata files from the mission in the filesystem
+        for folder in storage.listdir(mission_path)[0]:
+            folder_path = os.path.join(mission_path, folder)
+            typ = os.path.basename(folder_path)
 
-                        try:
-                            # Create and save the topic
-                            topic = Topic(
-                                file=file,
-                                name=topic_data["name"],
-                                type=topic_data["type"],
-                                message_count=topic_data["message_count"],
-                                frequency=topic_data["frequency"],
-                            )
-                            if matching_video:
-                                video_storage = Topic.video.field.storage
-                                if video_storage.exists(matching_video):
-                                    topic.video = matching_video
-                            # check if topic already exists
-                            if not Topic.objects.filter(
-                                name=topic_data["name"], file=file
-                            ).exists():
-                                topic.full_clean()
-                                topic.save()
-                        except Exception as e:
-                            logging.error(f"Error processing topic {topic_name}: {e}")
-                    logging.info(f"Added topics for {mcap_path}.")
-                except Exception as e:
-                    logging.error(f"Error processing {mcap_path}: {e}")
-
-    # Remove files that are in DB but no longer in filesystem
-    for file_path in existing_files - current_files:
-        try:
-            file = File.objects.get(file=file_path)
-            file.delete()
-            logging.info(f"Deleted missing file {file_path} from database.")
-        except File.DoesNotExist:
-            logging.warning(
-                f"File {file_path} not found in database (already deleted)."
-            )
+            for subfolder in storage.listdir(folder_path)[0]:
+                subfolder_path = os.path.join(folder_path, subfolder)
+                mcap_path = None
+
+                for item in storage.listdir(subfolder_path)[1]:
+                    item_path = os.path.join(subfolder_path, item)
+                    if item_path.endswith(".mcap"):
+                        mcap_path = item_path
 
+                if not mcap_path:
+                    continue
+
+                current_files.add(mcap_path)  # Track found files
+
+                if mcap_path in files_without_topics:
+                    try:
+                        metadata = extract_topics_from_mcap(mcap_path)
+                        new_files.append(
+                            (files_without_topics[mcap_path], metadata, subfolder_path)
+                        )
+                        logging.info(f"Adding the missing topics of {mcap_path}.")
+                    except Exception as e:
+                        logging.error(f"Error processing {mcap_path}: {e}")
 
-def sync_folder():
+                # Add new found files to the database
+                elif mcap_path not in existing_files:
+                    try:
+                        metadata = extract_topics_from_mcap(mcap_path)
+                        size = storage.size(mcap_path)
+                        duration = get_duration_from_mcap(mcap_path)
+                        file = File(
+                            robot=None,
+                            duration=duration,
+                            size=size,
+                            file=mcap_path,
+                            mission_id=mission.id,
+                            type=typ,
+                        )
+                        file.save()
+                        logging.info(
+                            f"Added new file {mcap_path} for mission {mission.name}."
+                        )
+                        new_files.append((file, metadata, subfolder_path))
+                    except Exception as e:
+                        logging.error(f"Error processing {mcap_path}: {e}")
+
+        # Remove files that are in DB but no longer in filesystem
+        for file_path in existing_files - current_files:
+            try:
+                file = File.objects.get(file=file_path)
+                file.delete()
+                logging.info(f"Deleted missing file {file_path} from database.")
+            except File.DoesNotExist:
+                logging.warning(
+                    f"File {file_path} not found in database (already deleted)."
+                )
+
+    return new_files
+
+
+def add_topics_with_videos(
+    new_files: list[NewFile],
+    workers: int | None = None,
+    max_memory: int | None = None,
+    passthrough: bool | None = None,
+):
+    """
+    Generates the videos of new files, of any number of missions, in one worker pool
+    and adds their topics afterwards.
+    See sync_files for workers, max_memory and passthrough.
+    """
+    if not new_files:
+        return
+
+    # generate videos for the topics of all new files, in parallel with workers > 1
+    try:
+        generate_videos_parallel(
+            [file.file.name for file, _, _ in new_files],
+            workers,
+            max_memory,
+            passthrough,
+        )
+    except Exception as e:
+        logging.error(f"Error generating videos: {e}")
+
+    with coalesce_changes():
+        for file, metadata, subfolder_path in new_files:
+            try:
+                add_topics(file, metadata, subfolder_path)
+                logging.info(f"Added topics for {file.file.name}.")
+            except Exception as e:
+                logging.error(f"Error processing {file.file.name}: {e}")
+
+
+def sync_folder(
+    workers: int | None = None,
+    max_memory: int | None = None,
+    passthrough: bool | None = None,
+):
     """
     Syncs all Missions from a folder:
     - Adds missions from folders in the filesystem that are not in the database.
     - Deletes missions from the database that are not in the filesystem.
+
+    workers, max_memory and passthrough configure the generation of the videos,
+    see sync_files.
     """
     # custom logger to track if any log message was emitted
     logger = logging.getLogger()
@@ -173,10 +285,13 @@ def sync_folder():
     # update db_missions after adding and deleting missions
     db_missions = Mission.objects.filter()
 
-    # sync files for each mission
+    # sync files for each mission, the videos of the new files of all missions
+    # are generated in one worker pool afterwards
+    new_files: list[NewFile] = []
     for mission in db_missions:
         mission_path = f"{mission.date.strftime('%Y.%m.%d')}_{mission.name}"
-        sync_files(mission_path, mission)
+        new_files += sync_file_rows(mission_path, mission)
+    add_topics_with_videos(new_files, workers, max_memory, passthrough)
 
     # save metadata for each mission in the filesystem
     for mission in db_missions:
@@ -185,16 +300,8 @@ def sync_folder():
             continue
         # else save metadata
         Mission.objects.filter(id=mission.id).update(was_modified=False)
-        tags = Tag.objects.filter(mission_tags__mission=mission)
-        tag_serializer = TagSerializer(tags, many=True)
-        mission_tags = [
-            {"name": tag["name"], "color": tag["color"]} for tag in tag_serializer.data
-        ]  # remove id field
-        metadata = {
-            "location": mission.location,
-            "notes": mission.notes,
-            "tags": mission_tags,
-        }
+        bulk_changed.send(sender=Mission)
+        metadata = mission_metadata(mission)
         # save metadata to file inside mission folder
         metadata_file = f"{mission.date.strftime('%Y.%m.%d')}_{mission.name}/{mission.name}_metadata.json"
         with storage.open(metadata_file, "w") as f:
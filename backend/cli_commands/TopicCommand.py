@@ -1,5 +1,7 @@
 from .Command import Command
+from restapi.denylist import purge_denied_topics
 from restapi.models import Denied_topics, Topic
+from restapi.serializer import TopicCatalogSerializer
 import logging
 
 
@@ -7,9 +9,22 @@ class TopicCommand(Command):
     name = "topic"
 
     def parser_setup(self, subparser):
-        self.topic_parser = subparser.add_parser(self.name, help="Modify denied topics")
+        self.topic_parser = subparser.add_parser(
+            self.name, help="Modify denied topics and list all topics"
+        )
         topic_subparser = self.topic_parser.add_subparsers(dest=self.name)
 
+        # catalog command
+        catalog_parser = topic_subparser.add_parser(
+            "catalog", help="List all topics of all files with statistics"
+        )
+        catalog_parser.add_argument(
+            "--name", required=False, help="Only topics containing this in the name"
+        )
+        catalog_parser.add_argument(
+            "--type", required=False, help="Only topics of this message type"
+        )
+
         # list-denied command
         topic_subparser.add_parser("list-denied", help="List denied topic names")
 
@@ -23,16 +38,33 @@ class TopicCommand(Command):
         deny_parser = topic_subparser.add_parser(
             "deny", help="Add topic name to denied names"
         )
-        deny_parser.add_argument("name", help="topic name")
+        deny_parser.add_argument("name", help="topic name or pattern")
+        kind_group = deny_parser.add_mutually_exclusive_group()
+        kind_group.add_argument(
+            "--glob",
+            action="store_const",
+            const="glob",
+            dest="kind",
+            help="name is a glob pattern, e.g. /debug/**",
+        )
+        kind_group.add_argument(
+            "--regex",
+            action="store_const",
+            const="regex",
+            dest="kind",
+            help="name is a regular expression matching the whole topic name",
+        )
 
     def command(self, args):
         match args.topic:
             case "allow":
                 remove_denied_topic(args.name)
             case "deny":
-                add_denied_topic(args.name)
+                add_denied_topic(args.name, args.kind or "exact")
             case "list-denied":
                 self.print_table(Denied_topics.objects.values())
+            case "catalog":
+                print_catalog(args.name, args.type)
             case _:
                 self.topic_parser.print_help()
 
@@ -53,25 +85,42 @@ def remove_denied_topic(name: str):
     logging.info(f"Removed '{name}' from denied topic names")
 
 
-def add_denied_topic(name: str):
-    """add a topic to the Denied_topics table and remove all topics with that name
+def add_denied_topic(name: str, kind: str = "exact"):
+    """add a rule to the Denied_topics table and remove all topics matching it
 
     Args:
-        name (str): topic name
+        name (str): topic name or pattern
+        kind (str, optional): "exact", "glob" or "regex". Defaults to "exact".
     """
     try:
-        denied_topic = Denied_topics.objects.create(name=name)
+        denied_topic = Denied_topics(name=name, kind=kind)
         denied_topic.full_clean()
+        denied_topic.save()
     except Exception as e:
         logging.error(e)
         return
 
-    # remove all topics that have this name
-    topics = Topic.objects.filter(name=name)
-
-    if topics.exists():
-        try:
-            topics.delete()
-        except Exception as e:
-            logging.error(e)
+    # remove all topics and their videos that are denied now
+    try:
+        count = purge_denied_topics()
+    except Exception as e:
+        logging.error(e)
+    else:
+        if count:
+            logging.info(f"Removed {count} topics matching '{name}'")
     logging.info(f"Topic name '{name}' will be denied from now on")
+
+
+def print_catalog(name: str = None, type: str = None):
+    """print every distinct topic name and type with statistics over all files
+
+    Args:
+        name (str, optional): only topics containing this in the name
+        type (str, optional): only topics of this message type
+    """
+    topics = Topic.objects.all()
+    if name:
+        topics = topics.filter(name__icontains=name)
+    if type:
+        topics = topics.filter(type=type)
+    TopicCommand.print_table(TopicCatalogSerializer(topics.catalog(), many=True).data)
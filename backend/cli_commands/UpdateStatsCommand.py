@@ -0,0 +1,28 @@
+import logging
+from .Command import Command
+from restapi.models import Mission
+from restapi.signals import bulk_changed
+
+
+class UpdateStatsCommand(Command):
+    name = "update-stats"
+
+    def parser_setup(self, subparser):
+        _ = subparser.add_parser(
+            self.name,
+            help="Recompute total duration, total size, file count and robots of all missions",
+        )
+
+    def command(self, args):
+        update_stats()
+
+
+def update_stats():
+    """
+    Recompute the file statistics stored in the Mission table from the File table.\\
+    They are kept up to date automatically, this is only needed after the files were
+    changed outside of django (e.g. directly in the database) or to initialize them.
+    """
+    Mission.objects.all().update_stats()
+    bulk_changed.send(sender=Mission)
+    logging.info(f"Updated statistics of {Mission.objects.count()} missions")
@@ -0,0 +1,35 @@
+from django.test import TestCase
+from unittest.mock import patch
+from backend.image_encodings import CONVERTERS, benchmark
+import cli_commands.BenchmarkEncodingsCommand as BenchmarkEncodingsCommand
+
+
+class BenchmarkEncodingsTests(TestCase):
+    def test_benchmark(self):
+        for encoding in CONVERTERS:
+            self.assertGreater(benchmark(encoding, width=64, height=48, repeat=2), 0)
+
+    @patch("cli_commands.BenchmarkEncodingsCommand.Command.print_table")
+    def test_benchmark_encodings(self, print_table):
+        BenchmarkEncodingsCommand.benchmark_encodings(width=64, height=48, repeat=2)
+        rows = print_table.call_args.args[0]
+        self.assertEqual([row["encoding"] for row in rows], sorted(CONVERTERS))
+        for row in rows:
+            for column in ("µs per frame", "frames per second"):
+                self.assertTrue(
+                    isinstance(row[column], int) or row[column] == "-", row[column]
+                )
+
+        BenchmarkEncodingsCommand.benchmark_encodings(
+            ["rgb8", "mono16"], width=64, height=48, repeat=1
+        )
+        rows = print_table.call_args.args[0]
+        self.assertEqual([row["encoding"] for row in rows], ["rgb8", "mono16"])
+
+    @patch("cli_commands.BenchmarkEncodingsCommand.benchmark", return_value=0.0)
+    @patch("cli_commands.BenchmarkEncodingsCommand.Command.print_table")
+    def test_benchmark_encodings_too_fast(self, print_table, benchmark):
+        BenchmarkEncodingsCommand.benchmark_encodings(["rgb8"])
+        row = print_table.call_args.args[0][0]
+        self.assertEqual(row["µs per frame"], "-")
+        self.assertEqual(row["frames per second"], "-")
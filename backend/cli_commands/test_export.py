@@ -0,0 +1,64 @@
+import logging
+import os
+import tempfile
+import zipfile
+from django.test import TestCase
+from django.core.files.base import ContentFile
+from django.core.files.storage.memory import InMemoryStorage
+from restapi.models import File, Mission
+import cli_commands.ExportCommand as ExportCommand
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger()
+        self.logger.disabled = True
+
+        self._default_storage = File.file.field.storage
+        File.file.field.storage = InMemoryStorage()
+        File.file.field.storage.save(
+            "2025.03.01_export/train/bag/bag.mcap", ContentFile(b"mcap")
+        )
+
+        self.mission = Mission.objects.create(name="export", date="2025-03-01")
+        File.objects.create(
+            mission=self.mission,
+            file="2025.03.01_export/train/bag/bag.mcap",
+            duration=1,
+            size=4,
+            type="train",
+        )
+        self.tempdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        File.file.field.storage = self._default_storage
+        self.logger.disabled = False
+        self.tempdir.cleanup()
+
+    def test_export(self):
+        output = os.path.join(self.tempdir.name, "mission.zip")
+        self.assertEqual(ExportCommand.export_mission(self.mission.id, output), output)
+        with zipfile.ZipFile(output) as archive:
+            self.assertEqual(
+                archive.namelist(),
+                [
+                    "2025.03.01_export/export_metadata.json",
+                    "2025.03.01_export/train/bag/bag.mcap",
+                ],
+            )
+            self.assertEqual(
+                archive.read("2025.03.01_export/train/bag/bag.mcap"), b"mcap"
+            )
+
+    def test_default_output(self):
+        cwd = os.getcwd()
+        os.chdir(self.tempdir.name)
+        try:
+            output = ExportCommand.export_mission(self.mission.id, archive_format="tar")
+        finally:
+            os.chdir(cwd)
+        self.assertEqual(output, "2025.03.01_export.tar")
+        self.assertTrue(os.path.isfile(os.path.join(self.tempdir.name, output)))
+
+    def test_unknown_mission(self):
+        self.assertIsNone(ExportCommand.export_mission(0))
@@ -0,0 +1,448 @@
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+import tracemalloc
+from pathlib import Path
+import threading
+from multiprocessing import get_all_start_methods, get_context
+from unittest import skipUnless
+from unittest.mock import patch
+import cv2
+import numpy as np
+from django.core.files.storage import FileSystemStorage
+from django.test import TestCase, TransactionTestCase
+from rosbags.rosbag2 import StoragePlugin, Writer
+from restapi.models import File, Mission
+import cli_commands.GenerateVideoCommand as GenerateVideoCommand
+
+WIDTH = 320
+HEIGHT = 240
+FRAME_SIZE = WIDTH * HEIGHT * 3
+
+
+def create_bag(
+    path: Path, frames: int, cameras: int = 1, compressed: tuple[str, ...] = ()
+):
+    """rosbag2 with the image topics /camera (and /camera1, ...), the blue channel
+    of a frame is its index, the green channel the number of the camera.
+    compressed adds a CompressedImage topic per format (jpeg or png) named /<format>."""
+    typestore = GenerateVideoCommand.typestore
+    Image = typestore.types["sensor_msgs/msg/Image"]
+    CompressedImage = typestore.types["sensor_msgs/msg/CompressedImage"]
+    Header = typestore.types["std_msgs/msg/Header"]
+    Time = typestore.types["builtin_interfaces/msg/Time"]
+    with Writer(path, version=8, storage_plugin=StoragePlugin.MCAP) as writer:
+        connections = [
+            writer.add_connection(
+                f"/camera{camera or ''}", "sensor_msgs/msg/Image", typestore=typestore
+            )
+            for camera in range(cameras)
+        ]
+        compressed_connections = {
+            image_format: writer.add_connection(
+                f"/{image_format}",
+                "sensor_msgs/msg/CompressedImage",
+                typestore=typestore,
+            )
+            for image_format in compressed
+        }
+        writer.add_connection("/empty", "sensor_msgs/msg/Image", typestore=typestore)
+        for i in range(frames):
+            for image_format, connection in compressed_connections.items():
+                pixels = np.full((HEIGHT, WIDTH, 3), i * 10 % 256, dtype=np.uint8)
+                _, data = cv2.imencode(f".{image_format}", pixels)
+                msg = CompressedImage(
+                    header=Header(stamp=Time(sec=i, nanosec=0), frame_id="camera"),
+                    format=image_format,
+                    data=data.reshape(-1),
+                )
+                writer.write(
+                    connection,
+                    i * 10**9,
+                    typestore.serialize_cdr(msg, "sensor_msgs/msg/CompressedImage"),
+                )
+        for i, (camera, connection) in product(range(frames), enumerate(connections)):
+            pixels = np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+            pixels[:, :, 0] = i
+            pixels[:, :, 1] = camera
+            msg = Image(
+                header=Header(stamp=Time(sec=i, nanosec=0), frame_id="camera"),
+                height=HEIGHT,
+                width=WIDTH,
+                encoding="bgr8",
+                is_bigendian=0,
+                step=WIDTH * 3,
+                data=pixels.reshape(-1),
+            )
+            writer.write(
+                connection,
+                i * 10**9,
+                typestore.serialize_cdr(msg, "sensor_msgs/msg/Image"),
+            )
+
+
+class FakeVideoWriter:
+    """Keeps only the first pixel of every frame, so it doesn't hold the frames"""
+
+    instances = []
+
+    def __init__(self, filename, fourcc, fps, size, isColor):
+        self.filename = filename
+        self.size = size
+        self.is_color = isColor
+        self.pixels = []
+        self.released = False
+        FakeVideoWriter.instances.append(self)
+
+    def write(self, frame):
+        self.pixels.append(int(frame[0, 0, 0]))
+        self.camera = int(frame[0, 0, 1])
+
+    def release(self):
+        self.released = True
+
+
+@patch("cli_commands.GenerateVideoCommand.cv2.VideoWriter", FakeVideoWriter)
+class GenerateVideoTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.bag = Path(cls.directory.name) / "bag"
+        cls.frames = 200
+        create_bag(cls.bag, cls.frames)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        FakeVideoWriter.instances.clear()
+
+    def create_video(self, topic: str):
+        return GenerateVideoCommand.create_video(
+            GenerateVideoCommand.get_video_data(self.bag, topic),
+            topic,
+            self.directory.name,
+        )
+
+    def test_frames_are_written_in_order(self):
+        filename = self.create_video("/camera")
+        self.assertEqual(filename, str(Path(self.directory.name) / "-camera.mp4"))
+        video = FakeVideoWriter.instances[0]
+        self.assertEqual(video.size, (WIDTH, HEIGHT))
+        self.assertTrue(video.is_color)
+        self.assertEqual(video.pixels, [i % 256 for i in range(self.frames)])
+        self.assertTrue(video.released)
+
+    def test_no_frames(self):
+        self.assertIsNone(self.create_video("/empty"))
+        self.assertEqual(FakeVideoWriter.instances, [])
+
+    def test_peak_memory_does_not_depend_on_length(self):
+        tracemalloc.start()
+        try:
+            self.create_video("/camera")
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(len(FakeVideoWriter.instances[0].pixels), self.frames)
+        # the frames in the buffer and the chunks of the reader, not all frames
+        self.assertLess(
+            peak, (2 * GenerateVideoCommand.FRAME_BUFFER_SIZE + 16) * FRAME_SIZE
+        )
+        self.assertLess(peak, self.frames * FRAME_SIZE / 4)
+
+    def test_errors_are_raised(self):
+        def frames():
+            yield np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+            raise ValueError("broken message")
+
+        with self.assertRaises(ValueError):
+            GenerateVideoCommand.create_video(frames(), "/camera", self.directory.name)
+        self.assertTrue(FakeVideoWriter.instances[0].released)
+
+    def test_buffer_is_bounded(self):
+        produced = []
+
+        def items():
+            for i in range(100):
+                produced.append(i)
+                yield i
+
+        buffer = GenerateVideoCommand.buffered(items(), size=4)
+        self.assertEqual(next(buffer), 0)
+        # the item taken, the full buffer and the item waiting to be put
+        self.assertLessEqual(len(produced), 6)
+        buffer.close()
+        self.assertLess(len(produced), 100)
+
+
+@patch("cli_commands.GenerateVideoCommand.cv2.VideoWriter", FakeVideoWriter)
+class GenerateMultipleVideosTests(TestCase):
+    def setUp(self):
+        FakeVideoWriter.instances.clear()
+        self.directory = tempfile.TemporaryDirectory()
+        self.frames = 20
+        create_bag(Path(self.directory.name) / "bag", self.frames, cameras=3)
+
+        self._default_storage = File.file.field.storage
+        File.file.field.storage = FileSystemStorage(self.directory.name)
+        mission = Mission.objects.create(name="cameras", date="2025-03-01")
+        File.objects.create(
+            mission=mission, file="bag/bag.mcap", duration=20, size=1, type="train"
+        )
+
+    def tearDown(self):
+        File.file.field.storage = self._default_storage
+        self.directory.cleanup()
+
+    def test_one_pass_for_all_topics(self):
+        with patch(
+            "cli_commands.GenerateVideoCommand.AnyReader",
+            wraps=GenerateVideoCommand.AnyReader,
+        ) as reader:
+            video_paths = GenerateVideoCommand.generate_videos("bag/bag.mcap")
+        reader.assert_called_once()
+
+        folder = Path(self.directory.name) / "bag"
+        self.assertEqual(
+            sorted(video_paths),
+            [str(folder / f"-camera{name}.mp4") for name in ["", "1", "2"]],
+        )
+        self.assertEqual(len(FakeVideoWriter.instances), 3)
+        for video in FakeVideoWriter.instances:
+            self.assertEqual(video.pixels, list(range(self.frames)))
+            self.assertTrue(video.released)
+        self.assertEqual(
+            sorted(video.camera for video in FakeVideoWriter.instances), [0, 1, 2]
+        )
+
+    def test_existing_videos_are_skipped(self):
+        (Path(self.directory.name) / "bag" / "-camera1.mp4").touch()
+        video_paths = GenerateVideoCommand.generate_videos("bag/bag.mcap")
+        self.assertEqual(len(video_paths), 2)
+        self.assertNotIn("-camera1.mp4", [Path(path).name for path in video_paths])
+
+    def test_existing_videos_are_overwritten(self):
+        (Path(self.directory.name) / "bag" / "-camera1.mp4").touch()
+        video_paths = GenerateVideoCommand.generate_videos(
+            "bag/bag.mcap", overwrite=True
+        )
+        self.assertIn("-camera1.mp4", [Path(path).name for path in video_paths])
+
+
+class FileVideoWriter:
+    """Writes the number of frames on release, so the videos of worker processes
+    are visible. Marks the folder while it is open to detect parallel jobs of other files."""
+
+    def __init__(self, filename, fourcc, fps, size, isColor):
+        self.filename = Path(filename)
+        self.frames = 0
+        folder = self.filename.parent.parent
+        if any(
+            marker.parent != self.filename.parent
+            for marker in folder.glob("*/*.running")
+        ):
+            (folder / "overlap").touch()
+        self.marker = self.filename.with_suffix(".running")
+        self.marker.touch()
+
+    def write(self, frame):
+        self.frames += 1
+
+    def release(self):
+        self.filename.write_text(str(self.frames))
+        self.marker.unlink()
+
+
+# the patches and the test database only reach forked workers,
+# which use their own connections and see committed rows only
+@skipUnless("fork" in get_all_start_methods(), "fork is not available")
+@patch("cli_commands.GenerateVideoCommand.get_context", lambda: get_context("fork"))
+@patch("cli_commands.GenerateVideoCommand.cv2.VideoWriter", FileVideoWriter)
+class ParallelVideoTests(TransactionTestCase):
+    def setUp(self):
+        self.logger = logging.getLogger()
+        self.logger.disabled = True
+        self.directory = tempfile.TemporaryDirectory()
+        self.folder = Path(self.directory.name)
+        self._default_storage = File.file.field.storage
+        File.file.field.storage = FileSystemStorage(self.directory.name)
+        mission = Mission.objects.create(name="parallel", date="2025-03-01")
+        self.paths = []
+        for i in range(3):
+            create_bag(self.folder / f"bag{i}", frames=10 + i, cameras=2)
+            self.paths.append(f"bag{i}/bag{i}.mcap")
+            File.objects.create(
+                mission=mission, file=self.paths[-1], duration=10, size=1, type="train"
+            )
+
+    def tearDown(self):
+        File.file.field.storage = self._default_storage
+        self.directory.cleanup()
+        self.logger.disabled = False
+
+    def test_files_in_parallel(self):
+        jobs = GenerateVideoCommand.generate_videos_parallel(
+            self.paths + ["missing.mcap"], workers=2
+        )
+        self.assertEqual([job.path for job in jobs], self.paths + ["missing.mcap"])
+        for i, job in enumerate(jobs[:3]):
+            self.assertIsNone(job.error)
+            self.assertGreater(job.seconds, 0)
+            self.assertEqual(len(job.video_paths), 2)
+            for video_path in job.video_paths:
+                self.assertEqual(Path(video_path).read_text(), str(10 + i))
+        self.assertEqual(jobs[3].error, "File not found")
+
+        # existing videos are skipped
+        jobs = GenerateVideoCommand.generate_videos_parallel(self.paths, workers=2)
+        self.assertEqual([job.video_paths for job in jobs], [[], [], []])
+
+    def test_memory_budget(self):
+        with patch(
+            "cli_commands.GenerateVideoCommand.estimate_memory", return_value=100
+        ):
+            jobs = GenerateVideoCommand.generate_videos_parallel(
+                self.paths, workers=3, max_memory=150
+            )
+        self.assertEqual([len(job.video_paths) for job in jobs], [2, 2, 2])
+        # only one job fits into the budget at a time
+        self.assertFalse((self.folder / "overlap").exists())
+
+    def test_spawned_workers_set_up_django(self):
+        pools = []
+
+        def thread_pool(workers, mp_context, initializer):
+            pools.append((mp_context.get_start_method(), initializer))
+            return ThreadPoolExecutor(workers)
+
+        with (
+            patch(
+                "cli_commands.GenerateVideoCommand.get_context",
+                lambda: get_context("spawn"),
+            ),
+            patch("cli_commands.GenerateVideoCommand.ProcessPoolExecutor", thread_pool),
+        ):
+            jobs = GenerateVideoCommand.generate_videos_parallel(self.paths, workers=2)
+        self.assertEqual(pools, [("spawn", GenerateVideoCommand.django.setup)])
+        self.assertEqual([len(job.video_paths) for job in jobs], [2, 2, 2])
+
+    def test_estimate_memory(self):
+        estimate = GenerateVideoCommand.estimate_memory(self.paths[0])
+        base = (
+            GenerateVideoCommand.WORKER_MEMORY + 2 * GenerateVideoCommand.ENCODER_MEMORY
+        )
+        # at least the buffered frames
+        self.assertGreater(
+            estimate, base + GenerateVideoCommand.FRAME_BUFFER_SIZE * FRAME_SIZE
+        )
+        self.assertEqual(
+            GenerateVideoCommand.estimate_memory("missing.mcap"),
+            GenerateVideoCommand.WORKER_MEMORY,
+        )
+
+
+class CompressedVideoTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.bag = Path(cls.directory.name) / "bag"
+        cls.frames = 20
+        create_bag(cls.bag, cls.frames, compressed=["jpeg", "png"])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        FakeVideoWriter.instances.clear()
+
+    def test_compressed_topics_are_video_topics(self):
+        self.assertEqual(
+            sorted(GenerateVideoCommand.get_video_topics(self.bag)),
+            ["/camera", "/empty", "/jpeg", "/png"],
+        )
+
+    @patch("cli_commands.GenerateVideoCommand.cv2.VideoWriter", FakeVideoWriter)
+    def test_decoded_in_threads(self):
+        threads = set()
+        decode = GenerateVideoCommand.preview.frame_from_compressed
+
+        def frame_from_compressed(msg):
+            threads.add(threading.current_thread())
+            return decode(msg)
+
+        with patch(
+            "cli_commands.GenerateVideoCommand.preview.frame_from_compressed",
+            frame_from_compressed,
+        ):
+            filenames = GenerateVideoCommand.create_videos(
+                GenerateVideoCommand.get_videos_data(
+                    self.bag, ["/camera", "/jpeg", "/png"]
+                ),
+                self.directory.name,
+                {},
+            )
+        self.assertEqual(len(filenames), 3)
+        self.assertNotIn(threading.main_thread(), threads)
+
+        videos = {
+            Path(video.filename).name: video for video in FakeVideoWriter.instances
+        }
+        self.assertEqual(videos["-camera.mp4"].pixels, list(range(self.frames)))
+        self.assertEqual(
+            videos["-png.mp4"].pixels, [i * 10 % 256 for i in range(self.frames)]
+        )
+        for expected, pixel in zip(range(0, 200, 10), videos["-jpeg.mp4"].pixels):
+            self.assertAlmostEqual(pixel, expected, delta=2)
+        self.assertEqual(videos["-jpeg.mp4"].size, (WIDTH, HEIGHT))
+
+    def test_passthrough(self):
+        calls = []
+        decode = GenerateVideoCommand.preview.frame_from_compressed
+
+        def frame_from_compressed(msg):
+            calls.append(msg.format)
+            return decode(msg)
+
+        with patch(
+            "cli_commands.GenerateVideoCommand.preview.frame_from_compressed",
+            frame_from_compressed,
+        ):
+            filenames = GenerateVideoCommand.create_videos(
+                GenerateVideoCommand.get_videos_data(
+                    self.bag, ["/jpeg", "/png"], passthrough=True
+                ),
+                self.directory.name,
+                {},
+            )
+        # only the first jpeg is decoded for the size, png images are converted
+        self.assertEqual(calls.count("jpeg"), 1)
+        self.assertEqual(calls.count("png"), self.frames)
+
+        # mp4 can't hold MJPEG
+        self.assertEqual(
+            sorted(Path(filename).name for filename in filenames),
+            ["-jpeg.avi", "-png.avi"],
+        )
+        for filename in filenames:
+            video = cv2.VideoCapture(filename)
+            fourcc = int(video.get(cv2.CAP_PROP_FOURCC))
+            self.assertEqual(fourcc.to_bytes(4, "little"), b"MJPG")
+            pixels = []
+            while True:
+                success, frame = video.read()
+                if not success:
+                    break
+                self.assertEqual(frame.shape, (HEIGHT, WIDTH, 3))
+                pixels.append(int(frame[0, 0, 0]))
+            video.release()
+            self.assertEqual(len(pixels), self.frames)
+            for expected, pixel in zip(range(0, 200, 10), pixels):
+                self.assertAlmostEqual(pixel, expected, delta=3)
@@ -0,0 +1,37 @@
+import io
+import logging
+from contextlib import redirect_stdout
+from django.test import TestCase
+from restapi.models import Mission
+import cli_commands.SearchCommand as SearchCommand
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger()
+        self.logger.disabled = True
+
+        Mission.objects.create(name="harvest", date="2025-03-01", notes="wet leaves")
+        Mission.objects.create(name="mapping", date="2025-03-02")
+
+    def tearDown(self):
+        self.logger.disabled = False
+
+    def search(self, query: str) -> str:
+        output = io.StringIO()
+        with redirect_stdout(output):
+            SearchCommand.search_missions(query)
+        return output.getvalue()
+
+    def test_search(self):
+        output = self.search("leaves")
+        self.assertIn("harvest", output)
+        self.assertNotIn("mapping", output)
+
+    def test_no_results(self):
+        self.assertIn("Empty list", self.search("nothing"))
+
+    def test_rebuild_index(self):
+        Mission.objects.update(notes="dry")
+        SearchCommand.rebuild_index()
+        self.assertIn("mapping", self.search("dry"))
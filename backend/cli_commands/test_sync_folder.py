@@ -7,7 +7,10 @@ from django.core.files.base import ContentFile
 from django.core.files.storage.memory import InMemoryStorage
 import io
 from mcap.writer import Writer
-from restapi.models import File, Mission
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from restapi import denylist
+from restapi.models import Denied_topics, File, Mission, Topic
 
 
 class SyncFolderArgumentTests(TestCase):
@@ -180,3 +183,138 @@ class SyncFilesTests(TestCase):
             SyncCommand.sync_files("2024.12.02_mission1", self.mission)
             files = File.objects.filter(mission_id=self.mission.id)
             self.assertEqual(files.count(), 0)
+
+    def test_sync_files_generates_videos_with_workers(self):
+        """
+        Test sync_files to ensure the videos of all new files are generated in one pool.
+        """
+        with patch(
+            "cli_commands.SyncCommand.generate_videos_parallel"
+        ) as generate_videos_parallel:
+            SyncCommand.sync_files(
+                "2024.12.02_mission1", self.mission, workers=4, max_memory=1024
+            )
+        generate_videos_parallel.assert_called_once_with(
+            [os.path.normpath("2024.12.02_mission1/test/bag/bag.mcap")], 4, 1024, None
+        )
+        self.assertEqual(File.objects.filter(mission_id=self.mission.id).count(), 1)
+
+        # no new files
+        with patch(
+            "cli_commands.SyncCommand.generate_videos_parallel"
+        ) as generate_videos_parallel:
+            SyncCommand.sync_files("2024.12.02_mission1", self.mission, workers=4)
+        generate_videos_parallel.assert_not_called()
+
+    def test_sync_files_repairs_interrupted_sync(self):
+        """
+        Test sync_files to ensure the next sync adds the topics of files
+        added by a sync that was interrupted while generating the videos.
+        """
+        with (
+            patch(
+                "cli_commands.SyncCommand.generate_videos_parallel",
+                side_effect=KeyboardInterrupt,
+            ),
+            self.assertRaises(KeyboardInterrupt),
+        ):
+            SyncCommand.sync_files("2024.12.02_mission1", self.mission)
+        file = File.objects.get(mission_id=self.mission.id)
+        self.assertFalse(Topic.objects.filter(file=file).exists())
+
+        with patch(
+            "cli_commands.SyncCommand.generate_videos_parallel"
+        ) as generate_videos_parallel:
+            SyncCommand.sync_files("2024.12.02_mission1", self.mission)
+        generate_videos_parallel.assert_called_once_with(
+            [file.file.name], None, None, None
+        )
+        self.assertEqual(File.objects.get(mission_id=self.mission.id), file)
+        self.assertEqual(
+            list(Topic.objects.filter(file=file).values_list("name", flat=True)),
+            ["/sensor/temperature"],
+        )
+
+    def test_sync_folder_generates_videos_in_one_pool(self):
+        """
+        Test sync_folder to ensure the new files of all missions share one pool.
+        """
+        self.test_storage.save(
+            "2024.12.03_mission2/test/bag/bag.mcap",
+            ContentFile(self.create_dummy_mcap()),
+        )
+        Mission.objects.create(name="mission2", date="2024-12-03")
+        with patch(
+            "cli_commands.SyncCommand.generate_videos_parallel"
+        ) as generate_videos_parallel:
+            SyncCommand.sync_folder(workers=4)
+        generate_videos_parallel.assert_called_once()
+        self.assertCountEqual(
+            generate_videos_parallel.call_args.args[0],
+            [
+                os.path.normpath("2024.12.02_mission1/test/bag/bag.mcap"),
+                os.path.normpath("2024.12.03_mission2/test/bag/bag.mcap"),
+            ],
+        )
+        self.assertEqual(Topic.objects.filter(name="/sensor/temperature").count(), 2)
+
+    def test_add_topics(self):
+        """
+        Test add_topics to ensure the topics are created with a constant number of queries.
+        """
+        file = File.objects.create(
+            file="2024.12.02_mission1/test/bag/bag.mcap",
+            mission=self.mission,
+            type="test",
+            duration=5,
+            size=1,
+        )
+        Topic.objects.create(
+            file=file, name="/existing", type="t", message_count=1, frequency=1
+        )
+        Denied_topics.objects.create(name="/denied/*", kind="glob")
+
+        def metadata(count):
+            names = [f"/topic{i}" for i in range(count)] + ["/existing", "/denied/a"]
+            return {
+                name: {"name": name, "type": "t", "message_count": 2, "frequency": 0.4}
+                for name in names
+            }
+
+        denylist.get_denylist()
+        with CaptureQueriesContext(connection) as few:
+            SyncCommand.add_topics(file, metadata(2), "2024.12.02_mission1/test/bag")
+        Topic.objects.filter(name__startswith="/topic").delete()
+        with CaptureQueriesContext(connection) as many:
+            SyncCommand.add_topics(file, metadata(50), "2024.12.02_mission1/test/bag")
+
+        self.assertEqual(len(few.captured_queries), len(many.captured_queries))
+        names = set(Topic.objects.filter(file=file).values_list("name", flat=True))
+        self.assertEqual(len(names), 51)
+        self.assertIn("/topic49", names)
+        self.assertNotIn("/denied/a", names)
+
+    def test_add_topics_links_videos(self):
+        """
+        Test add_topics to ensure mp4 videos are preferred over passthrough avi videos.
+        """
+        folder = "2024.12.02_mission1/test/bag"
+        file = File.objects.create(
+            file=f"{folder}/bag.mcap",
+            mission=self.mission,
+            type="test",
+            duration=5,
+            size=1,
+        )
+        for name in ["-both.mp4", "-both.avi", "-passthrough.avi"]:
+            self.test_storage.save(f"{folder}/{name}", ContentFile(b"video"))
+        metadata = {
+            name: {"name": name, "type": "t", "message_count": 1, "frequency": 1}
+            for name in ["/both", "/passthrough", "/none"]
+        }
+        with patch.object(Topic.video.field, "storage", self.test_storage):
+            SyncCommand.add_topics(file, metadata, folder)
+        videos = dict(Topic.objects.filter(file=file).values_list("name", "video"))
+        self.assertEqual(videos["/both"], f"{folder}/-both.mp4")
+        self.assertEqual(videos["/passthrough"], f"{folder}/-passthrough.avi")
+        self.assertIn(videos["/none"], ("", None))
@@ -1,11 +1,15 @@
+import io
 import os
 from django.test import TestCase
-from restapi.models import Denied_topics, Topic, File, Mission
+from restapi.models import Denied_topics, Topic, File, Mission, ModelVersion
 from django.core.files.storage.memory import InMemoryStorage
 from django.core.files.base import ContentFile
 from django.core.exceptions import ValidationError
 import cli_commands.TopicCommand as TopicCommand
+from restapi import denylist, search
 import logging
+from contextlib import redirect_stdout
+from unittest.mock import patch
 
 
 class TestDenyTopic(TestCase):
@@ -44,6 +48,8 @@ class TestDenyTopic(TestCase):
     def tearDown(self):
         self._delete_recursive("")
         self.logger.disabled = False
+        # the loaded denylist is not rolled back with the database
+        denylist.invalidate()
 
     def test_add_denied_topic(self):
         TopicCommand.add_denied_topic("test2")
@@ -65,6 +71,101 @@ class TestDenyTopic(TestCase):
         except ValidationError as e:
             self.assertIn("name", e.error_dict)
 
+    def create_topic(self, name: str, video: str = None) -> Topic:
+        return Topic.objects.create(
+            file=self.file,
+            name=name,
+            type="example",
+            message_count=1,
+            frequency=1,
+            video=video,
+        )
+
+    def test_deny_glob_purges_topics_and_videos(self):
+        video_field = Topic.video.field
+        default_video_storage = video_field.storage
+        video_field.storage = self.test_storage
+        try:
+            self.test_storage.save("videos/debug-image.mp4", ContentFile(""))
+            self.create_topic("/debug/image", video="videos/debug-image.mp4")
+            self.create_topic("/debug/deep/status")
+            self.create_topic("/debugging")
+            self.create_topic("/camera")
+
+            TopicCommand.add_denied_topic("/debug/**", "glob")
+
+            self.assertEqual(
+                sorted(Topic.objects.values_list("name", flat=True)),
+                ["/camera", "/debugging"],
+            )
+            self.assertFalse(self.test_storage.exists("videos/debug-image.mp4"))
+        finally:
+            video_field.storage = default_video_storage
+
+        self.assertRaises(ValidationError, self.create_topic("/debug/new").full_clean)
+        self.create_topic("/debugging2").full_clean()
+
+    def test_deny_regex(self):
+        self.create_topic("/imu0")
+        self.create_topic("/imu_raw")
+        TopicCommand.add_denied_topic(r"/imu\d+", "regex")
+        self.assertEqual(
+            list(Topic.objects.values_list("name", flat=True)), ["/imu_raw"]
+        )
+
+    def test_purge_bumps_once(self):
+        for i in range(10):
+            self.create_topic(f"/noise{i}")
+        self.create_topic("/camera")
+        self.assertEqual(search.search_missions("noise5"), [self.file.mission_id])
+        version = ModelVersion.get_versions(Topic)[0]
+        Denied_topics.objects.create(name="/noise*", kind="glob")
+
+        self.assertEqual(denylist.purge_denied_topics(), 10)
+        self.assertEqual(ModelVersion.get_versions(Topic), [version + 1])
+        self.assertEqual(search.search_missions("noise5"), [])
+        self.assertEqual(search.search_missions("camera"), [self.file.mission_id])
+
+    def test_invalid_regex(self):
+        TopicCommand.add_denied_topic("/imu(", "regex")
+        self.assertFalse(Denied_topics.objects.filter(name="/imu(").exists())
+
+    def test_denylist_loaded_once(self):
+        topic = self.create_topic("/camera")
+        topic.full_clean()
+        with self.assertNumQueries(0):
+            for _ in range(10):
+                denylist.get_denylist().is_denied("/camera")
+        # changes are picked up immediately
+        Denied_topics.objects.create(name="/camera")
+        self.assertRaises(ValidationError, topic.full_clean)
+
+    def test_denylist_changed_in_other_process(self):
+        topic = self.create_topic("/camera")
+        topic.full_clean()
+        # a rule added by another process, which drops only its own denylist
+        Denied_topics.objects.bulk_create([Denied_topics(name="/camera")])
+        ModelVersion.bump(Denied_topics)
+        topic.full_clean()
+        with patch("restapi.denylist.time.monotonic") as monotonic:
+            monotonic.return_value = denylist._checked + denylist.RECHECK_SECONDS + 1
+            self.assertRaises(ValidationError, topic.full_clean)
+
+    def test_glob_to_regex(self):
+        matcher = denylist.TopicDenylist(
+            [
+                Denied_topics(name="/a/*/c", kind="glob"),
+                Denied_topics(name="/b?", kind="glob"),
+                Denied_topics(name="/exact.name", kind="exact"),
+            ]
+        )
+        self.assertTrue(matcher.is_denied("/a/b/c"))
+        self.assertFalse(matcher.is_denied("/a/b/b/c"))
+        self.assertTrue(matcher.is_denied("/b1"))
+        self.assertFalse(matcher.is_denied("/b/"))
+        self.assertTrue(matcher.is_denied("/exact.name"))
+        self.assertFalse(matcher.is_denied("/exactXname"))
+
 
 class TestAllowTopic(TestCase):
     def setUp(self):
@@ -79,3 +180,36 @@ class TestAllowTopic(TestCase):
 
             TopicCommand.remove_denied_topic("test")
             self.assertIn("not found", log.output[1])
+
+
+class TestTopicCatalog(TestCase):
+    def setUp(self):
+        File.file.field.storage = InMemoryStorage()
+        mission = Mission.objects.create(name="test", date="2025-02-17")
+        for i in range(2):
+            file = File.objects.create(
+                file=f"catalog/bag{i}.mcap",
+                mission=mission,
+                duration=1,
+                size=1,
+                type="test",
+            )
+            Topic.objects.create(
+                file=file,
+                name="/imu",
+                type="sensor_msgs/msg/Imu",
+                message_count=10,
+                frequency=100 + i,
+            )
+
+    def test_print_catalog(self):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            TopicCommand.print_catalog(name="imu")
+        self.assertIn("/imu", output.getvalue())
+        self.assertIn("sensor_msgs/msg/Imu", output.getvalue())
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            TopicCommand.print_catalog(type="other")
+        self.assertIn("Empty list", output.getvalue())
@@ -0,0 +1,69 @@
+import logging
+from django.test import TestCase
+from django.core.files.storage.memory import InMemoryStorage
+from restapi.models import File, Mission
+import cli_commands.UpdateStatsCommand as UpdateStatsCommand
+
+
+class UpdateStatsTests(TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger()
+        self.logger.disabled = True
+
+        self._default_storage = File.file.field.storage
+        File.file.field.storage = InMemoryStorage()
+
+        self.mission = Mission.objects.create(name="stats", date="2025-03-01")
+        self.empty_mission = Mission.objects.create(name="empty", date="2025-03-01")
+        for i, robot in enumerate(["robotB", None, "robotA", "robotB"]):
+            File.objects.create(
+                mission=self.mission,
+                file=f"stats/file{i}.mcap",
+                robot=robot,
+                duration=10 * (i + 1),
+                size=100,
+                type="train",
+            )
+
+    def tearDown(self):
+        File.file.field.storage = self._default_storage
+        self.logger.disabled = False
+
+    def assert_stats(self):
+        mission = Mission.objects.get(id=self.mission.id)
+        self.assertEqual(mission.total_duration, 100)
+        self.assertEqual(mission.total_size, 400)
+        self.assertEqual(mission.file_count, 4)
+        self.assertEqual(mission.robots, "robotB, robotA")
+
+    def test_stats_maintained_on_file_changes(self):
+        self.assert_stats()
+
+        file = File.objects.get(file="stats/file0.mcap")
+        file.robot = "robotC"
+        file.save()
+        self.assertEqual(
+            Mission.objects.get(id=self.mission.id).robots, "robotC, robotA, robotB"
+        )
+
+        file.delete()
+        mission = Mission.objects.get(id=self.mission.id)
+        self.assertEqual(mission.file_count, 3)
+        self.assertEqual(mission.total_duration, 90)
+        self.assertEqual(mission.robots, "robotA, robotB")
+
+    def test_update_stats_recomputes_everything(self):
+        # simulate changes outside of django
+        Mission.objects.update(
+            total_duration=1, total_size=1, file_count=1, robots="wrong"
+        )
+        UpdateStatsCommand.update_stats()
+        self.assert_stats()
+        empty = Mission.objects.get(id=self.empty_mission.id)
+        self.assertEqual(empty.file_count, 0)
+        self.assertEqual(empty.total_size, 0)
+        self.assertEqual(empty.robots, "")
+
+    def test_mission_delete(self):
+        self.mission.delete()
+        self.assertFalse(File.objects.exists())
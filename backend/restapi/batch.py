@@ -0,0 +1,237 @@
+"""
+Batch mutations of the REST API.\\
+Every function takes a list of already validated items, applies all of them in one
+transaction with bulk queries and returns one result dict per item in the same order.
+Items that can't be applied are reported in their result and don't abort the others.
+The signals of the bulk queries are sent once per batch, see coalesce_changes.
+"""
+
+from collections import Counter
+from django.db import transaction
+from django.db.models import Q
+from .models import File, Mission, Mission_tags, Tag
+from .signals import (
+    bulk_changed,
+    coalesce_changes,
+    reindex_missions,
+    update_missions_of_files,
+)
+
+
+def _mark_modified(mission_ids):
+    """Set was_modified, so the sync writes the metadata to the mission folder"""
+    if mission_ids:
+        Mission.objects.filter(id__in=mission_ids).update(was_modified=True)
+        bulk_changed.send(sender=Mission)
+
+
+@transaction.atomic
+@coalesce_changes()
+def add_tags_to_missions(items: list[dict]) -> list[dict]:
+    """
+    Assign tags to missions, creates tags that don't exist yet
+
+    Args:
+        items (list[dict]): dicts with mission_id and tag_name
+
+    Returns:
+        list[dict]: results with status "created", "exists" or "not_found"
+            and whether the tag was created
+    """
+    mission_ids = set(
+        Mission.objects.filter(
+            id__in={item["mission_id"] for item in items}
+        ).values_list("id", flat=True)
+    )
+    names = {item["tag_name"] for item in items if item["mission_id"] in mission_ids}
+
+    tags = {tag.name: tag for tag in Tag.objects.filter(name__in=names)}
+    new_names = names - tags.keys()
+    if new_names:
+        # a tag created by a concurrent request in between is used as well
+        Tag.objects.bulk_create(
+            [Tag(name=name) for name in new_names], ignore_conflicts=True
+        )
+        tags = {tag.name: tag for tag in Tag.objects.filter(name__in=names)}
+        bulk_changed.send(sender=Tag)
+
+    existing = set(
+        Mission_tags.objects.filter(
+            mission_id__in=mission_ids, tag__name__in=names
+        ).values_list("mission_id", "tag_id")
+    )
+
+    results = []
+    new_relations = []
+    for item in items:
+        result = {"mission_id": item["mission_id"], "tag_name": item["tag_name"]}
+        results.append(result)
+        if item["mission_id"] not in mission_ids:
+            result["status"] = "not_found"
+            continue
+        tag = tags[item["tag_name"]]
+        result["tag_created"] = tag.name in new_names
+        key = (item["mission_id"], tag.id)
+        if key in existing:
+            result["status"] = "exists"
+            continue
+        existing.add(key)
+        new_relations.append(Mission_tags(mission_id=key[0], tag_id=key[1]))
+        result["status"] = "created"
+
+    if new_relations:
+        Mission_tags.objects.bulk_create(new_relations, ignore_conflicts=True)
+        bulk_changed.send(sender=Mission_tags)
+        mission_ids = {relation.mission_id for relation in new_relations}
+        reindex_missions(*mission_ids)
+        _mark_modified(mission_ids)
+    return results
+
+
+@transaction.atomic
+@coalesce_changes()
+def remove_tags_from_missions(items: list[dict]) -> list[dict]:
+    """
+    Remove tags from missions. The tags themselves are not deleted.
+
+    Args:
+        items (list[dict]): dicts with mission_id and tag_name
+
+    Returns:
+        list[dict]: results with status "deleted" or "not_found"
+    """
+    relations = {
+        (mission_id, tag_name): id
+        for id, mission_id, tag_name in Mission_tags.objects.filter(
+            mission_id__in={item["mission_id"] for item in items},
+            tag__name__in={item["tag_name"] for item in items},
+        ).values_list("id", "mission_id", "tag__name")
+    }
+
+    results = []
+    delete_ids = set()
+    for item in items:
+        key = (item["mission_id"], item["tag_name"])
+        result = {"mission_id": item["mission_id"], "tag_name": item["tag_name"]}
+        if key in relations:
+            delete_ids.add(relations[key])
+            result["status"] = "deleted"
+        else:
+            result["status"] = "not_found"
+        results.append(result)
+
+    if delete_ids:
+        mission_ids = {
+            mission_id for (mission_id, _), id in relations.items() if id in delete_ids
+        }
+        Mission_tags.objects.filter(id__in=delete_ids).delete()
+        _mark_modified(mission_ids)
+    return results
+
+
+@transaction.atomic
+@coalesce_changes()
+def update_robots(items: list[dict]) -> list[dict]:
+    """
+    Set the robot of files
+
+    Args:
+        items (list[dict]): dicts with file_path and robot (can be None)
+
+    Returns:
+        list[dict]: results with status "updated" or "not_found"
+    """
+    files = {
+        file.file.name: file
+        for file in File.objects.filter(file__in={item["file_path"] for item in items})
+    }
+
+    results = []
+    for item in items:
+        result = {"file_path": item["file_path"], "robot": item["robot"]}
+        file = files.get(item["file_path"])
+        if file:
+            file.robot = item["robot"]
+            result["status"] = "updated"
+        else:
+            result["status"] = "not_found"
+        results.append(result)
+
+    if files:
+        File.objects.bulk_update(files.values(), ["robot"])
+        bulk_changed.send(sender=File)
+        update_missions_of_files(*{file.mission_id for file in files.values()})
+    return results
+
+
+MISSION_BATCH_FIELDS = ["name", "date", "location", "notes"]
+
+
+@transaction.atomic
+@coalesce_changes()
+def update_missions(items: list[dict]) -> list[dict]:
+    """
+    Change fields of missions. Only the given fields are changed.
+
+    Args:
+        items (list[dict]): dicts with id and optionally name, date, location and notes
+
+    Returns:
+        list[dict]: results with status "updated", "not_found" or "invalid"
+            and the errors of invalid items
+    """
+    missions = Mission.objects.in_bulk({item["id"] for item in items})
+
+    # apply the changes in memory
+    changed: dict[int, Mission] = {}
+    results = []
+    for item in items:
+        result = {"id": item["id"]}
+        results.append(result)
+        mission = missions.get(item["id"])
+        if not mission:
+            result["status"] = "not_found"
+            continue
+        for field in MISSION_BATCH_FIELDS:
+            if field in item:
+                setattr(mission, field, item[field])
+        changed[mission.id] = mission
+        result["status"] = "updated"
+
+    # (name, date) is unique, check the new values against the batch and the database.
+    # The current values of other missions in the batch count as conflict as well,
+    # because the rows are updated one after another.
+    keys = Counter((m.name, m.date) for m in changed.values())
+    query = Q()
+    for name, date in keys:
+        query |= Q(name=name, date=date)
+    owners = {}
+    if query:
+        for id, name, date in Mission.objects.filter(query).values_list(
+            "id", "name", "date"
+        ):
+            owners[(name, date)] = id
+    invalid_ids = {
+        mission.id
+        for mission in changed.values()
+        if keys[(mission.name, mission.date)] > 1
+        or owners.get((mission.name, mission.date), mission.id) != mission.id
+    }
+    for result in results:
+        if result["id"] in invalid_ids:
+            result["status"] = "invalid"
+            result["errors"] = {
+                "non_field_errors": ["The fields name, date must make a unique set."]
+            }
+    for id in invalid_ids:
+        del changed[id]
+
+    if changed:
+        for mission in changed.values():
+            mission.was_modified = True
+        Mission.objects.bulk_update(
+            changed.values(), MISSION_BATCH_FIELDS + ["was_modified"]
+        )
+        bulk_changed.send(sender=Mission)
+        reindex_missions(*changed)
+    return results
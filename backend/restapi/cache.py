@@ -0,0 +1,110 @@
+import hashlib
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, transaction
+from rest_framework.response import Response
+from . import download_tokens
+from .models import ModelVersion
+
+KEY_PREFIX = "restapi"
+STATS = ("hits", "misses", "invalidations")
+
+
+def _stats_key(name: str) -> str:
+    return f"{KEY_PREFIX}:stats:{name}"
+
+
+def _increment(key: str):
+    """Increment a counter in the cache, creating it if necessary"""
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            # evicted between add and incr
+            cache.set(key, 1, timeout=None)
+
+
+def get_versions(request, *models: type[models.Model]) -> list[int]:
+    """
+    Version stamps (ModelVersion) of the given models.\\
+    The stamps are queried once per request and shared by the ETag and the cache key,
+    so a cached body is always stored and found under the versions of its ETag.
+    """
+    versions = request.__dict__.setdefault("_model_versions", {})
+    missing = [model for model in models if model._meta.label not in versions]
+    if missing:
+        for model, version in zip(missing, ModelVersion.get_versions(*missing)):
+            versions[model._meta.label] = version
+    return [versions[model._meta.label] for model in models]
+
+
+def invalidate(*models: type[models.Model]):
+    """
+    Count the invalidation of the cached responses depending on the given models
+    once the transaction of the write is committed.\\
+    The old entries are not hit anymore, because the version stamps in their keys
+    are increased in the same transaction.
+    """
+
+    def count():
+        for _ in models:
+            _increment(_stats_key("invalidations"))
+
+    transaction.on_commit(count)
+
+
+def get_stats() -> dict[str, int]:
+    """Hit, miss and invalidation counters of the response cache"""
+    values = cache.get_many([_stats_key(name) for name in STATS])
+    return {name: values.get(_stats_key(name), 0) for name in STATS}
+
+
+def reset_stats():
+    cache.delete_many([_stats_key(name) for name in STATS])
+
+
+def cached_response(*models: type[models.Model], signed_urls: bool = False):
+    """
+    Decorator caching the data of successful GET responses of a view.\\
+    The key consists of the view name, the requested url and the version stamps
+    (ModelVersion) of the models the response depends on. The versions are increased
+    by the model signals (see restapi.signals) in the transaction of the write, so
+    every process sees new keys once the write is committed.
+
+    Args:
+        models: models the response depends on
+        signed_urls (bool, optional): include the expiry step of the download tokens
+            in the key, for responses containing signed download urls.
+            Defaults to False.
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def inner(request, *args, **kwargs):
+            if request.method != "GET":
+                return func(request, *args, **kwargs)
+
+            url = request.get_full_path()
+            if signed_urls:
+                url += f"|{download_tokens.current_step()}"
+            versions = ".".join(str(v) for v in get_versions(request, *models))
+            key = (
+                f"{KEY_PREFIX}:response:{func.__name__}:{versions}:"
+                f"{hashlib.sha256(url.encode()).hexdigest()}"
+            )
+
+            data = cache.get(key)
+            if data is not None:
+                _increment(_stats_key("hits"))
+                return Response(data)
+
+            _increment(_stats_key("misses"))
+            response = func(request, *args, **kwargs)
+            if response.status_code == 200 and isinstance(response, Response):
+                cache.set(key, response.data, timeout=settings.RESTAPI_CACHE_TIMEOUT)
+            return response
+
+        return inner
+
+    return decorator
@@ -0,0 +1,99 @@
+"""
+In-memory matcher for the rules of the Denied_topics table.\\
+The rules are loaded once per process and compiled. The matcher is dropped by the
+Denied_topics signals (see restapi.signals) and reloaded when the version stamp
+(ModelVersion) of Denied_topics changed in another process or a transaction was
+rolled back, which is checked every few seconds.
+"""
+
+import logging
+import re
+import time
+from django.db import transaction
+from .models import Denied_topics, ModelVersion, Topic
+
+RECHECK_SECONDS = 5
+
+
+class TopicDenylist:
+    """Exact names in a set, glob and regex rules as compiled regular expressions"""
+
+    def __init__(self, rules: list[Denied_topics]):
+        self.names = frozenset(rule.name for rule in rules if rule.kind == "exact")
+        self.patterns = [
+            re.compile(rule.regex()) for rule in rules if rule.kind != "exact"
+        ]
+
+    def is_denied(self, name: str) -> bool:
+        return name in self.names or any(
+            pattern.fullmatch(name) for pattern in self.patterns
+        )
+
+
+_denylist: TopicDenylist | None = None
+_version = None
+_checked = 0.0
+
+
+def get_denylist() -> TopicDenylist:
+    """The current denylist, loaded from the database only if it changed"""
+    global _denylist, _version, _checked
+    now = time.monotonic()
+    if _denylist is None or now - _checked > RECHECK_SECONDS:
+        version = ModelVersion.get_versions(Denied_topics)[0]
+        if _denylist is None or version != _version:
+            _denylist = TopicDenylist(list(Denied_topics.objects.all()))
+            _version = version
+        _checked = now
+    return _denylist
+
+
+def _drop():
+    global _denylist
+    _denylist = None
+
+
+def invalidate(**kwargs):
+    """
+    Drop the loaded denylist, connected to the signals of Denied_topics.\\
+    It is dropped right away for the writing transaction and again after the commit,
+    in case another thread reloaded the old rules in between.
+    """
+    _drop()
+    transaction.on_commit(_drop)
+
+
+def purge_denied_topics() -> int:
+    """
+    Delete all topics denied by the current rules and their videos.\\
+    The denied names are found in the distinct topic names. The signals of the
+    deleted topics are coalesced into one version bump and one update of the
+    affected search documents.
+    ### Returns
+    number of deleted topics
+    """
+    from .signals import coalesce_changes  # signals imports this module
+
+    denylist = get_denylist()
+    names = [
+        name
+        for name in Topic.objects.order_by().values_list("name", flat=True).distinct()
+        if denylist.is_denied(name)
+    ]
+    if not names:
+        return 0
+
+    topics = Topic.objects.filter(name__in=names)
+    videos = list(
+        topics.exclude(video=None).exclude(video="").values_list("video", flat=True)
+    )
+    with coalesce_changes():
+        count = topics.delete()[0]
+
+    storage = Topic.video.field.storage
+    for video in videos:
+        try:
+            storage.delete(video)
+        except OSError as e:
+            logging.warning(f"Could not delete video {video}: {e}")
+    return count
@@ -0,0 +1,54 @@
+"""
+Signed, expiring tokens for the download and stream urls.\\
+A token is valid for one file path until it expires and is checked without the
+database, so the range requests of a video player don't load the session and the
+user for every chunk. The expiry is rounded up to steps of half the max age,
+so all urls of a file created within one step are equal and can be cached.
+"""
+
+import time
+from django.conf import settings
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+SALT = "restapi.download_tokens"
+
+
+def _step() -> int:
+    return max(settings.DOWNLOAD_TOKEN_MAX_AGE // 2, 1)
+
+
+def current_step() -> int:
+    """Number of the current expiry step, changes whenever new tokens are issued"""
+    return int(time.time()) // _step()
+
+
+def _signature(path: str, expires: int) -> str:
+    return salted_hmac(SALT, f"{path}|{expires}", algorithm="sha256").hexdigest()
+
+
+def create_token(path: str) -> str:
+    """
+    Creates a token for a file path, valid for at least half of
+    DOWNLOAD_TOKEN_MAX_AGE and at most DOWNLOAD_TOKEN_MAX_AGE seconds
+    """
+    expires = (current_step() + 2) * _step()
+    return f"{expires}.{_signature(path, expires)}"
+
+
+def check_token(token: str, path: str) -> int | None:
+    """
+    Checks the signature and expiry of a token for a file path
+    ### Returns
+    seconds until the token expires\\
+    None if the token is invalid, expired or for another path
+    """
+    expires, _, signature = token.partition(".")
+    try:
+        remaining = int(expires) - int(time.time())
+    except ValueError:
+        return None
+    if remaining <= 0 or not constant_time_compare(
+        signature, _signature(path, int(expires))
+    ):
+        return None
+    return remaining
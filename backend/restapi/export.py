@@ -0,0 +1,212 @@
+"""
+Streaming archives of whole missions.\\
+The archive contains the mission folder `{date}_{name}` with the mcap files, their
+`metadata.yaml`, the `{name}_metadata.json` with the current metadata of the database
+and optionally the videos. The archive is built while it is sent, with constant memory
+and without temporary files. The entries are stored without compression, because the
+mcap files and videos are compressed already.
+"""
+
+import json
+import os
+import tarfile
+import time
+import zipfile
+from dataclasses import dataclass
+from functools import partial
+from typing import Callable, Iterable, Iterator
+from django.core.files.storage import Storage
+from backend import s3
+from .models import File, Mission, Tag, Topic
+
+ARCHIVE_FORMATS = ["zip", "tar"]
+CONTENT_TYPES = {"zip": "application/zip", "tar": "application/x-tar"}
+
+# earliest date a zip file can store
+_ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+
+
+@dataclass
+class Entry:
+    """One file of the archive, the content is only read when it is written"""
+
+    name: str
+    size: int
+    modified: float
+    chunks: Callable[[], Iterable[bytes]]
+
+
+def mission_folder(mission: Mission) -> str:
+    """Name of the folder of a mission in the storage"""
+    return f"{mission.date.strftime('%Y.%m.%d')}_{mission.name}"
+
+
+def mission_metadata(mission: Mission) -> dict:
+    """Content of the `{name}_metadata.json` in the mission folder"""
+    return {
+        "location": mission.location,
+        "notes": mission.notes,
+        "tags": [
+            {"name": tag.name, "color": tag.color}
+            for tag in Tag.objects.filter(mission_tags__mission=mission)
+        ],
+    }
+
+
+def _read_file(storage: Storage, name: str) -> Iterator[bytes]:
+    with storage.open(name, "rb") as file:
+        yield from file.chunks()
+
+
+def _storage_entry(storage: Storage, name: str, archive_name: str) -> Entry | None:
+    """Entry of a file in a storage, None if the file doesn't exist"""
+    try:
+        if s3.is_s3_storage(storage):
+            # opening only sends a HEAD request, the content is read with a ranged GET
+            file = storage.open(name)
+            key, size, modified = file.obj.key, file.size, file.obj.last_modified
+            file.close()
+            chunks = (
+                partial(s3.iter_range, storage, key, range(0, size)) if size else list
+            )
+        else:
+            size = storage.size(name)
+            modified = storage.get_modified_time(name)
+            chunks = partial(_read_file, storage, name)
+    except (FileNotFoundError, IsADirectoryError):
+        return None
+    return Entry(archive_name, size, modified.timestamp(), chunks)
+
+
+def mission_entries(mission: Mission, videos: bool = False) -> list[Entry]:
+    """
+    Collects the files of a mission for an archive
+
+    Args:
+        mission (Mission): the mission to export
+        videos (bool, optional): include the videos of the topics. Defaults to False.
+
+    Returns:
+        list[Entry]: the metadata json, then the mcap files with their metadata.yaml
+            and the videos, sorted by path
+    """
+    folder = mission_folder(mission)
+
+    def archive_name(name: str) -> str:
+        return name if name.startswith(f"{folder}/") else f"{folder}/{name}"
+
+    metadata = json.dumps(mission_metadata(mission), indent=4).encode()
+    entries = [
+        Entry(
+            f"{folder}/{mission.name}_metadata.json",
+            len(metadata),
+            time.time(),
+            lambda: [metadata],
+        )
+    ]
+
+    paths = []
+    file_storage = File.file.field.storage
+    for name in (
+        File.objects.filter(mission=mission)
+        .order_by("file")
+        .values_list("file", flat=True)
+    ):
+        paths.append((file_storage, name))
+        paths.append((file_storage, f"{os.path.dirname(name)}/metadata.yaml"))
+    if videos:
+        video_storage = Topic.video.field.storage
+        for name in (
+            Topic.objects.filter(file__mission=mission)
+            .exclude(video="")
+            .exclude(video__isnull=True)
+            .order_by("video")
+            .values_list("video", flat=True)
+        ):
+            paths.append((video_storage, name))
+
+    seen = set()
+    for storage, name in paths:
+        if name in seen:
+            # several files in one folder share the metadata.yaml
+            continue
+        seen.add(name)
+        entry = _storage_entry(storage, name, archive_name(name))
+        if entry:
+            entries.append(entry)
+    return entries
+
+
+class _Output:
+    """Write only stream collecting the written bytes until they are sent"""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, data: bytes) -> int:
+        self.data += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = bytes(self.data)
+        self.data.clear()
+        return data
+
+
+def stream_zip(entries: Iterable[Entry]) -> Iterator[bytes]:
+    """Zip file of the entries without compression, yielded while it is written"""
+    output = _Output()
+    # the output is not seekable, so zipfile writes the sizes after the data
+    with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_STORED) as archive:
+        for entry in entries:
+            date_time = max(time.localtime(entry.modified)[:6], _ZIP_EPOCH)
+            info = zipfile.ZipInfo(entry.name, date_time)
+            info.file_size = entry.size
+            with archive.open(info, "w") as destination:
+                for chunk in entry.chunks():
+                    destination.write(chunk)
+                    if output.data:
+                        yield output.take()
+            yield output.take()
+    yield output.take()
+
+
+def stream_tar(entries: Iterable[Entry]) -> Iterator[bytes]:
+    """Tar file of the entries in pax format, yielded while it is written"""
+    written = 0
+    for entry in entries:
+        info = tarfile.TarInfo(entry.name)
+        info.size = entry.size
+        info.mtime = int(entry.modified)
+        info.mode = 0o644
+        header = info.tobuf(tarfile.PAX_FORMAT)
+        yield header
+        for chunk in entry.chunks():
+            yield chunk
+        padding = -entry.size % tarfile.BLOCKSIZE
+        if padding:
+            yield bytes(padding)
+        written += len(header) + entry.size + padding
+    # two empty blocks mark the end, then fill up the last record
+    end = 2 * tarfile.BLOCKSIZE
+    end += -(written + end) % tarfile.RECORDSIZE
+    yield bytes(end)
+
+
+def stream_archive(entries: Iterable[Entry], archive_format: str) -> Iterator[bytes]:
+    """
+    Archive of the entries, built while it is sent
+
+    Args:
+        entries (Iterable[Entry]): the files of the archive
+        archive_format (str): one of ARCHIVE_FORMATS
+
+    Returns:
+        Iterator[bytes]: the archive in parts
+    """
+    if archive_format == "tar":
+        return stream_tar(entries)
+    return stream_zip(entries)
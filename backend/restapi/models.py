@@ -1,10 +1,199 @@
-from django.db import models
+import re
+from django.db import IntegrityError, models, transaction
+from django.db.models import (
+    Avg,
+    Count,
+    Exists,
+    F,
+    Max,
+    Min,
+    OuterRef,
+    Prefetch,
+    Q,
+    Subquery,
+    Sum,
+)
+from django.db.models.functions import Coalesce
 from django.core.exceptions import ValidationError
 from colorfield.fields import ColorField
 from django.core.files.storage import FileSystemStorage, default_storage
 from django.conf import settings
 
 
+class MissionQuerySet(models.QuerySet):
+    def update_stats(self):
+        """
+        Recompute the file statistics (total_duration, total_size, file_count and robots)
+        of the missions in this queryset from the File table.\
+        The sums are computed with one UPDATE, the robot names with one SELECT.
+        """
+        files = File.objects.filter(mission=OuterRef("pk")).order_by().values("mission")
+        self.update(
+            total_duration=Coalesce(
+                Subquery(files.annotate(total=Sum("duration")).values("total")), 0
+            ),
+            total_size=Coalesce(
+                Subquery(files.annotate(total=Sum("size")).values("total")), 0
+            ),
+            file_count=Coalesce(
+                Subquery(files.annotate(count=Count("id")).values("count")), 0
+            ),
+        )
+
+        # robot names in order of their first file, like the REST API always showed them
+        robots: dict[int, dict[str, None]] = {}
+        for mission_id, robot in (
+            File.objects.filter(mission__in=self.values("id"))
+            .exclude(robot=None)
+            .order_by("mission_id", "id")
+            .values_list("mission_id", "robot")
+        ):
+            robots.setdefault(mission_id, {})[robot] = None
+        changed = []
+        for mission in self.only("id", "robots"):
+            value = ", ".join(robots.get(mission.id, {}))
+            if mission.robots != value:
+                mission.robots = value
+                changed.append(mission)
+        Mission.objects.bulk_update(changed, ["robots"], batch_size=1000)
+
+    def bundle(self):
+        """
+        Prefetch the tags, files and topics of the files,
+        so a mission tree is loaded with a fixed number of queries
+        """
+        return self.prefetch_related(
+            Prefetch(
+                "mission_tags_set",
+                queryset=Mission_tags.objects.select_related("tag").order_by("tag_id"),
+            ),
+            Prefetch(
+                "file_set",
+                queryset=File.objects.order_by("id").prefetch_related(
+                    Prefetch("topic_set", queryset=Topic.objects.order_by("id"))
+                ),
+            ),
+        )
+
+    def apply_filters(
+        self,
+        date_from=None,
+        date_to=None,
+        min_size: int = None,
+        max_size: int = None,
+        min_duration: int = None,
+        max_duration: int = None,
+        min_files: int = None,
+        max_files: int = None,
+        tags: list[str] = None,
+        tag_mode: str = "and",
+        robot: str = None,
+        type: str = None,
+        location: str = None,
+        notes: str = None,
+    ):
+        """
+        Filter missions. Conditions on tags and files are added as EXISTS subqueries,
+        so the whole filter is a single SQL query.
+        ### Parameters
+        date_from, date_to: inclusive date range\
+        min_size, max_size: inclusive range of the total size in bytes\
+        min_duration, max_duration: inclusive range of the total duration in seconds\
+        min_files, max_files: inclusive range of the number of files\
+        tags: tag names, combined with AND or OR depending on tag_mode\
+        tag_mode: "and" (all tags required) or "or" (any of the tags)\
+        robot: robot name of at least one file\
+        type: type ('train' or 'test') of at least one file\
+        location, notes: case insensitive substring
+        """
+        queryset = self
+        if date_from:
+            queryset = queryset.filter(date__gte=date_from)
+        if date_to:
+            queryset = queryset.filter(date__lte=date_to)
+        for field, low, high in [
+            ("total_size", min_size, max_size),
+            ("total_duration", min_duration, max_duration),
+            ("file_count", min_files, max_files),
+        ]:
+            if low is not None:
+                queryset = queryset.filter(**{f"{field}__gte": low})
+            if high is not None:
+                queryset = queryset.filter(**{f"{field}__lte": high})
+        if tags:
+            mission_tags = Mission_tags.objects.filter(mission=OuterRef("pk"))
+            if tag_mode == "or":
+                queryset = queryset.filter(
+                    Exists(mission_tags.filter(tag__name__in=tags))
+                )
+            else:
+                for tag in set(tags):
+                    queryset = queryset.filter(
+                        Exists(mission_tags.filter(tag__name=tag))
+                    )
+        if robot or type:
+            files = File.objects.filter(mission=OuterRef("pk"))
+            if robot:
+                files = files.filter(robot=robot)
+            if type:
+                files = files.filter(type=type)
+            queryset = queryset.filter(Exists(files))
+        if location:
+            queryset = queryset.filter(location__icontains=location)
+        if notes:
+            queryset = queryset.filter(notes__icontains=notes)
+        return queryset
+
+    def with_topics(self, query: dict):
+        """
+        Missions with at least one file matching each topic predicate of the query,
+        see topic_query_condition
+        """
+        return self.filter(topic_query_condition(query, "file__mission"))
+
+
+class FileQuerySet(models.QuerySet):
+    def with_topics(self, query: dict):
+        """Files containing topics matching the query, see topic_query_condition"""
+        return self.filter(topic_query_condition(query, "file"))
+
+
+def topic_query_condition(query: dict, outer: str) -> Q:
+    """
+    Translates a tree of topic predicates into one condition with an EXISTS
+    subquery per predicate, so the whole query is evaluated as a single SQL query.
+    ### Parameters
+    query: either {"and": [queries]}, {"or": [queries]} or a predicate with any of
+    the keys name, type, min_frequency, max_frequency and min_message_count,
+    e.g. {"name": "/camera/front", "type": "sensor_msgs/msg/Image", "min_frequency": 15}\
+    outer: lookup from Topic to the model of the outer query ("file" or "file__mission")
+    ### Returns
+    Q object for a queryset of the outer model
+    """
+    if "and" in query:
+        condition = Q()
+        for child in query["and"]:
+            condition &= topic_query_condition(child, outer)
+        return condition
+    if "or" in query:
+        condition = Q()
+        for child in query["or"]:
+            condition |= topic_query_condition(child, outer)
+        return condition
+    topics = Topic.objects.filter(**{outer: OuterRef("pk")})
+    lookups = {
+        "name": "name",
+        "type": "type",
+        "min_frequency": "frequency__gte",
+        "max_frequency": "frequency__lte",
+        "min_message_count": "message_count__gte",
+    }
+    for key, lookup in lookups.items():
+        if query.get(key) is not None:
+            topics = topics.filter(**{lookup: query[key]})
+    return Q(Exists(topics))
+
+
 # Create your models here.
 class Mission(models.Model):
     # our datastructure is defined here
@@ -15,8 +204,26 @@ class Mission(models.Model):
     notes = models.CharField(max_length=65536, null=True, blank=True)
     was_modified = models.BooleanField(default=False)
 
+    # statistics of the files of the mission, maintained by MissionQuerySet.update_stats
+    total_duration = models.BigIntegerField(default=0)  # unit: seconds
+    total_size = models.BigIntegerField(default=0)  # unit: bytes
+    file_count = models.IntegerField(default=0)
+    robots = models.CharField(max_length=65536, default="", blank=True)
+
+    objects = MissionQuerySet.as_manager()
+
     class Meta:
         unique_together = ["name", "date"]
+        indexes = [
+            # keyset pagination of mission lists
+            models.Index(fields=["date", "id"], name="mission_date_id_idx"),
+            models.Index(fields=["name", "id"], name="mission_name_id_idx"),
+            models.Index(fields=["total_size", "id"], name="mission_size_id_idx"),
+            models.Index(
+                fields=["total_duration", "id"], name="mission_duration_id_idx"
+            ),
+            models.Index(fields=["file_count", "id"], name="mission_file_count_id_idx"),
+        ]
 
     # this function defines, what the value of print(mission) would be
     def __str__(self):
@@ -34,6 +241,17 @@ class File(models.Model):
     size = models.BigIntegerField()  # unit: bytes
     type = models.CharField(max_length=65536)  # either 'train' or 'test'
 
+    objects = FileQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # keyset pagination of the files of a mission
+            models.Index(fields=["mission", "id"], name="file_mission_id_idx"),
+            # mission filters by robot and type
+            models.Index(fields=["robot", "mission"], name="file_robot_mission_idx"),
+            models.Index(fields=["type", "mission"], name="file_type_mission_idx"),
+        ]
+
 
 class Tag(models.Model):
     """The tags table"""
@@ -54,20 +272,107 @@ class Mission_tags(models.Model):
 
     class Meta:
         unique_together = ["mission", "tag"]
+        indexes = [
+            # mission filters by tag
+            models.Index(
+                fields=["tag", "mission"], name="mission_tags_tag_mission_idx"
+            ),
+        ]
+
+
+def glob_to_regex(pattern: str) -> str:
+    """
+    Translates a glob pattern for topic names into a regular expression.\
+    `**` matches anything, `*` matches within one name segment (no `/`)
+    and `?` matches one character except `/`.
+    """
+    parts = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**", i):
+            parts.append(".*")
+            i += 2
+            continue
+        match pattern[i]:
+            case "*":
+                parts.append("[^/]*")
+            case "?":
+                parts.append("[^/]")
+            case char:
+                parts.append(re.escape(char))
+        i += 1
+    return "".join(parts)
 
 
 class Denied_topics(models.Model):
-    """A table to limit the allowed topics"""
+    """
+    A table to limit the allowed topics.\
+    The name is either an exact topic name, a glob pattern (see glob_to_regex)
+    or a regular expression, which has to match the whole topic name.
+    """
+
+    KINDS = ["exact", "glob", "regex"]
 
     name = models.CharField(unique=True)
+    kind = models.CharField(
+        max_length=5, choices=[(kind, kind) for kind in KINDS], default="exact"
+    )
+
+    def regex(self) -> str | None:
+        """The rule as regular expression, None for exact names"""
+        match self.kind:
+            case "glob":
+                return glob_to_regex(self.name)
+            case "regex":
+                return self.name
+        return None
+
+    def clean(self):
+        if self.kind == "regex":
+            try:
+                re.compile(self.name)
+            except re.error as e:
+                raise ValidationError({"name": f"Invalid regular expression: {e}"})
 
 
 def validate_topic_allowed(name: str):
-    """A topic is allowed if the name is not in the Denied_topics table"""
-    if Denied_topics.objects.filter(name=name).exists():
+    """A topic is allowed if the name matches no rule of the Denied_topics table"""
+    from .denylist import get_denylist  # the denylist module imports the models
+
+    if get_denylist().is_denied(name):
         raise ValidationError(f"topic name '{name}' not allowed by Denied_topics table")
 
 
+class TopicQuerySet(models.QuerySet):
+    def catalog(self):
+        """
+        One row per distinct topic name and type with statistics over all files
+        containing it, computed with one GROUP BY query.
+        ### Returns
+        queryset of dicts with name, type, file_count, mission_count, message_count,
+        min_frequency, max_frequency, avg_frequency and video_count
+        """
+        return (
+            self.order_by()
+            .values("name", "type")
+            .annotate(
+                file_count=Count("file", distinct=True),
+                mission_count=Count("file__mission", distinct=True),
+                message_count=Sum("message_count"),
+                min_frequency=Min("frequency"),
+                max_frequency=Max("frequency"),
+                avg_frequency=Avg("frequency"),
+                video_count=Count("id", filter=Q(video__isnull=False) & ~Q(video="")),
+            )
+            .order_by("name", "type")
+        )
+
+
+# extensions of the generated videos, H.264 in mp4 and the MJPEG of the JPEG passthrough
+# in avi, because mp4 can't hold MJPEG
+VIDEO_EXTENSIONS = (".mp4", ".avi")
+
+
 class Topic(models.Model):
     """The topic table"""
 
@@ -86,8 +391,49 @@ class Topic(models.Model):
         else default_storage,
     )
 
+    objects = TopicQuerySet.as_manager()
+
     class Meta:
         unique_together = ["file", "type", "name"]
+        indexes = [
+            # topic queries and the topic catalog
+            models.Index(fields=["name"], name="topic_name_idx"),
+            models.Index(fields=["type"], name="topic_type_idx"),
+            models.Index(fields=["file", "name"], name="topic_file_name_idx"),
+        ]
+
+
+class ModelVersion(models.Model):
+    """
+    Version stamp per model, increased on every write.\
+    Used to build ETags of the REST API without serializing the data.
+    """
+
+    name = models.CharField(max_length=100, unique=True)
+    version = models.BigIntegerField(default=0)
+
+    @classmethod
+    def bump(cls, *models: type[models.Model]):
+        """Increase the version of the given models"""
+        for model in models:
+            name = model._meta.label
+            if not cls.objects.filter(name=name).update(version=F("version") + 1):
+                try:
+                    # savepoint, so the failed insert doesn't abort an outer transaction
+                    with transaction.atomic():
+                        cls.objects.create(name=name, version=1)
+                except IntegrityError:
+                    # created concurrently
+                    cls.objects.filter(name=name).update(version=F("version") + 1)
+
+    @classmethod
+    def get_versions(cls, *models: type[models.Model]) -> list[int]:
+        """Current versions of the given models in the same order, 0 if never written"""
+        names = [model._meta.label for model in models]
+        versions = dict(
+            cls.objects.filter(name__in=names).values_list("name", "version")
+        )
+        return [versions.get(name, 0) for name in names]
 
 
 """
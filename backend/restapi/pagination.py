@@ -0,0 +1,201 @@
+import base64
+import json
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Model, Q, QuerySet
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Opt-in cursor pagination that seeks with a WHERE clause on the ordering columns
+    instead of an OFFSET, so every page costs the same as the first one.\\
+    Pagination is only used if the request contains `page_size` or `cursor`,
+    otherwise the whole ordered list is returned as before.\\
+    The ordering can be selected with `?ordering=` as a comma separated list of
+    fields from `ordering_fields`, prefixed with `-` for descending order.
+    `id` is always appended as tiebreaker, so the ordering is unique.
+
+    Without `ordering` the paginated list is ordered by `default_ordering`,
+    the whole list by `unpaginated_ordering`, the order it had before pagination.
+
+    Subclasses set `ordering_fields` and `default_ordering`.
+    """
+
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    ordering_query_param = "ordering"
+    default_page_size = 100
+    max_page_size = 1000
+
+    ordering_fields: list[str] = ["id"]
+    default_ordering: list[str] = ["id"]
+    unpaginated_ordering: list[str] = ["id"]
+
+    # set by order_queryset
+    ordering: list[str] | None = None
+
+    def get_ordering(self, request: Request) -> list[str]:
+        """
+        Parses the ordering query parameter
+        ### Returns
+        list of field names, prefixed with `-` for descending order, ending with id
+        ### Raises
+        ValidationError if an unknown field is requested
+        """
+        param = request.query_params.get(self.ordering_query_param)
+        if not param and self.is_requested(request):
+            ordering = list(self.default_ordering)
+        elif not param:
+            ordering = list(self.unpaginated_ordering)
+        else:
+            ordering = [field.strip() for field in param.split(",") if field.strip()]
+            for field in ordering:
+                if field.lstrip("-") not in self.ordering_fields:
+                    raise ValidationError(
+                        {
+                            self.ordering_query_param: f"Invalid field '{field}'. "
+                            f"Allowed: {', '.join(self.ordering_fields)}"
+                        }
+                    )
+        if not any(field.lstrip("-") == "id" for field in ordering):
+            ordering.append("-id" if ordering[-1].startswith("-") else "id")
+        return ordering
+
+    def order_queryset(self, queryset: QuerySet, request: Request) -> QuerySet:
+        """Orders the queryset as requested with the ordering query parameter"""
+        self.ordering = self.get_ordering(request)
+        return queryset.order_by(*self.ordering)
+
+    def is_requested(self, request: Request) -> bool:
+        return (
+            self.cursor_query_param in request.query_params
+            or self.page_size_query_param in request.query_params
+        )
+
+    def get_page_size(self, request: Request) -> int:
+        try:
+            page_size = int(
+                request.query_params.get(
+                    self.page_size_query_param, self.default_page_size
+                )
+            )
+        except ValueError:
+            raise ValidationError({self.page_size_query_param: "Must be an integer"})
+        if page_size < 1:
+            raise ValidationError({self.page_size_query_param: "Must be positive"})
+        return min(page_size, self.max_page_size)
+
+    def paginate_queryset(self, queryset: QuerySet, request: Request, view=None):
+        """
+        Returns one page of the ordered queryset
+        ### Returns
+        list of objects of the page\\
+        None if pagination was not requested
+        ### Raises
+        NotFound if the cursor is invalid
+        """
+        if not self.is_requested(request):
+            return None
+
+        self.request = request
+        if self.ordering is None:
+            queryset = self.order_queryset(queryset, request)
+        page_size = self.get_page_size(request)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            values = self._decode_cursor(cursor, queryset.model)
+            queryset = queryset.filter(self._seek_filter(values))
+
+        # fetch one extra row to know if there is a next page
+        page = list(queryset[: page_size + 1])
+        self.has_next = len(page) > page_size
+        self.page = page[:page_size]
+        return self.page
+
+    def get_next_link(self) -> str | None:
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        values = [getattr(last, field.lstrip("-")) for field in self.ordering]
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, self._encode_cursor(values)
+        )
+
+    def get_paginated_response(self, data) -> Response:
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def _seek_filter(self, values: list) -> Q:
+        """
+        Builds the keyset condition "row comes after values" for the current ordering.\\
+        For ordering (a, b) this is: a > va OR (a = va AND b > vb)
+        """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            condition |= equal & Q(**{f"{name}__{lookup}": value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def _encode_cursor(self, values: list) -> str:
+        data = json.dumps({"o": self.ordering, "v": values}, default=str)
+        return base64.urlsafe_b64encode(data.encode()).decode()
+
+    def _decode_cursor(self, cursor: str, model: type[Model]) -> list:
+        """
+        Decodes a cursor and converts its values to the types of the ordering fields
+        ### Raises
+        NotFound if the cursor can't be decoded, was created with another ordering
+        or contains values that don't fit the fields
+        """
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            values = data["v"]
+            ordering = data["o"]
+        except (ValueError, TypeError, KeyError):
+            raise NotFound("Invalid cursor")
+        if (
+            ordering != self.ordering
+            or not isinstance(values, list)
+            or len(values) != len(self.ordering)
+        ):
+            raise NotFound("Invalid cursor")
+        try:
+            values = [
+                model._meta.get_field(field.lstrip("-")).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except (DjangoValidationError, ValueError, TypeError):
+            raise NotFound("Invalid cursor")
+        if None in values:
+            raise NotFound("Invalid cursor")
+        return values
+
+
+class MissionPagination(KeysetPagination):
+    ordering_fields = [
+        "date",
+        "name",
+        "total_size",
+        "total_duration",
+        "file_count",
+        "id",
+    ]
+    default_ordering = ["date", "id"]
+
+
+class TagPagination(KeysetPagination):
+    ordering_fields = ["name", "id"]
+    default_ordering = ["id"]
+
+
+class FilePagination(KeysetPagination):
+    ordering_fields = ["size", "duration", "id"]
+    default_ordering = ["id"]
@@ -0,0 +1,233 @@
+"""
+Full text search over missions.\\
+Every mission has one search document with its name, location, notes, tag names and
+topic names. With PostgreSQL the documents are stored as weighted `tsvector` with a GIN
+index, with SQLite in an FTS5 virtual table. Other databases fall back to a
+case insensitive substring search without index.\\
+The index is created by the migrations of the search_index app and kept up to date
+by the signals in restapi.signals. `rebuild_index()` recreates all documents.\
+Every function works on the database `using`, the default database if not given.
+"""
+
+import re
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Q
+from .models import Mission, Mission_tags, Topic
+
+TABLE = "restapi_mission_search"
+CHUNK_SIZE = 1000
+
+
+def _normalize(text: str | None) -> str:
+    """
+    Replaces everything but letters and digits with spaces,
+    so topic names like `/camera/rear/image_raw` are indexed as separate words
+    """
+    return re.sub(r"[\W_]+", " ", text or "").strip()
+
+
+def _build_documents(mission_ids, using: str) -> list[tuple]:
+    """
+    Collects the searchable text of missions with 3 queries
+    ### Returns
+    list of tuples (id, name, tags, topics, location, notes)
+    """
+    tags = {}
+    for mission_id, name in (
+        Mission_tags.objects.using(using)
+        .filter(mission_id__in=mission_ids)
+        .values_list("mission_id", "tag__name")
+    ):
+        tags.setdefault(mission_id, []).append(name)
+
+    topics = {}
+    for mission_id, name in (
+        Topic.objects.using(using)
+        .filter(file__mission_id__in=mission_ids)
+        .values_list("file__mission_id", "name")
+        .distinct()
+    ):
+        topics.setdefault(mission_id, []).append(name)
+
+    return [
+        (
+            id,
+            _normalize(name),
+            _normalize(" ".join(tags.get(id, []))),
+            _normalize(" ".join(topics.get(id, []))),
+            _normalize(location),
+            _normalize(notes),
+        )
+        for id, name, location, notes in Mission.objects.using(using)
+        .filter(id__in=mission_ids)
+        .values_list("id", "name", "location", "notes")
+    ]
+
+
+class PostgresBackend:
+    """
+    One row per mission with a weighted tsvector:
+    A name, B tags, C topics, D location and notes
+    """
+
+    def update(self, cursor, documents: list[tuple]):
+        cursor.executemany(
+            f"INSERT INTO {TABLE} (mission_id, document) VALUES (%s, "
+            "setweight(to_tsvector('english', %s), 'A') || "
+            "setweight(to_tsvector('english', %s), 'B') || "
+            "setweight(to_tsvector('english', %s), 'C') || "
+            "setweight(to_tsvector('english', %s || ' ' || %s), 'D')) "
+            "ON CONFLICT (mission_id) DO UPDATE SET document = EXCLUDED.document",
+            documents,
+        )
+
+    def delete(self, cursor, mission_ids):
+        cursor.execute(
+            f"DELETE FROM {TABLE} WHERE mission_id = ANY(%s)", [list(mission_ids)]
+        )
+
+    def clear(self, cursor):
+        cursor.execute(f"TRUNCATE {TABLE}")
+
+    def search(self, cursor, query: str, limit: int) -> list[int]:
+        cursor.execute(
+            "SELECT mission_id FROM "
+            f"{TABLE}, plainto_tsquery('english', %s) query "
+            "WHERE document @@ query "
+            "ORDER BY ts_rank(document, query) DESC, mission_id LIMIT %s",
+            [query, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+class SQLiteBackend:
+    """FTS5 table with the mission id as rowid, ranked with bm25"""
+
+    # bm25 weights of the columns name, tags, topics, location, notes
+    weights = "10.0, 5.0, 2.0, 1.0, 1.0"
+
+    def update(self, cursor, documents: list[tuple]):
+        self.delete(cursor, [document[0] for document in documents])
+        cursor.executemany(
+            f"INSERT INTO {TABLE} (rowid, name, tags, topics, location, notes) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            documents,
+        )
+
+    def delete(self, cursor, mission_ids):
+        mission_ids = list(mission_ids)
+        for i in range(0, len(mission_ids), CHUNK_SIZE):
+            chunk = mission_ids[i : i + CHUNK_SIZE]
+            cursor.execute(
+                f"DELETE FROM {TABLE} WHERE rowid IN ({', '.join(['%s'] * len(chunk))})",
+                chunk,
+            )
+
+    def clear(self, cursor):
+        cursor.execute(f"DELETE FROM {TABLE}")
+
+    def search(self, cursor, query: str, limit: int) -> list[int]:
+        # every word as quoted string, so the query can't contain FTS5 syntax
+        match = " ".join(f'"{word}"' for word in query.split())
+        cursor.execute(
+            f"SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s "
+            f"ORDER BY bm25({TABLE}, {self.weights}), rowid LIMIT %s",
+            [match, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+class FallbackBackend:
+    """Substring search on the mission table for databases without full text index"""
+
+    def update(self, cursor, documents: list[tuple]):
+        pass
+
+    def delete(self, cursor, mission_ids):
+        pass
+
+    def clear(self, cursor):
+        pass
+
+    def search(self, cursor, query: str, limit: int) -> list[int]:
+        condition = Q()
+        for word in query.split():
+            condition &= (
+                Q(name__icontains=word)
+                | Q(location__icontains=word)
+                | Q(notes__icontains=word)
+                | Q(mission_tags__tag__name__icontains=word)
+                | Q(file__topic__name__icontains=word)
+            )
+        return list(
+            Mission.objects.using(cursor.db.alias)
+            .filter(condition)
+            .distinct()
+            .order_by("id")
+            .values_list("id", flat=True)[:limit]
+        )
+
+
+def get_backend(vendor: str):
+    """Backend for the vendor of a database connection"""
+    match vendor:
+        case "postgresql":
+            return PostgresBackend()
+        case "sqlite":
+            return SQLiteBackend()
+        case _:
+            return FallbackBackend()
+
+
+def rebuild_index(using: str = DEFAULT_DB_ALIAS):
+    """Recreates the search documents of all missions"""
+    db = connections[using]
+    with db.cursor() as cursor:
+        get_backend(db.vendor).clear(cursor)
+    mission_ids = list(
+        Mission.objects.using(using).order_by("id").values_list("id", flat=True)
+    )
+    for i in range(0, len(mission_ids), CHUNK_SIZE):
+        index_missions(*mission_ids[i : i + CHUNK_SIZE], using=using)
+
+
+def index_missions(*mission_ids: int, using: str = DEFAULT_DB_ALIAS):
+    """Creates or updates the search documents of missions"""
+    documents = _build_documents(mission_ids, using)
+    missing = set(mission_ids) - {document[0] for document in documents}
+    db = connections[using]
+    with db.cursor() as cursor:
+        backend = get_backend(db.vendor)
+        if documents:
+            backend.update(cursor, documents)
+        if missing:
+            backend.delete(cursor, missing)
+
+
+def remove_missions(*mission_ids: int, using: str = DEFAULT_DB_ALIAS):
+    """Deletes the search documents of deleted missions"""
+    if mission_ids:
+        db = connections[using]
+        with db.cursor() as cursor:
+            get_backend(db.vendor).delete(cursor, mission_ids)
+
+
+def search_missions(
+    query: str, limit: int = 50, using: str = DEFAULT_DB_ALIAS
+) -> list[int]:
+    """
+    Full text search over mission name, location, notes, tag names and topic names.\\
+    All words of the query have to match. English words are stemmed.
+    ### Parameters
+    query: words to search for\\
+    limit: max number of results\\
+    using: alias of the database
+    ### Returns
+    ids of the matching missions, best match first
+    """
+    query = _normalize(query)
+    if not query:
+        return []
+    db = connections[using]
+    with db.cursor() as cursor:
+        return get_backend(db.vendor).search(cursor, query, limit)
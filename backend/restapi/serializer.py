@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from rest_framework.exceptions import NotFound
-from django.db.models import Sum
+from .download_tokens import create_token
+from .export import ARCHIVE_FORMATS
 from .models import Denied_topics, Mission, Topic
 from .models import File
 from .models import Tag
@@ -8,33 +9,126 @@ from .models import Mission_tags
 
 
 class MissionSerializer(serializers.ModelSerializer):
-    total_duration = serializers.SerializerMethodField()
-    total_size = serializers.SerializerMethodField()
-    robots = serializers.SerializerMethodField()
-
     class Meta:  # definition of which data to serialize
         model = Mission
-        fields = "__all__"
+        fields = [
+            "id",
+            "total_duration",
+            "total_size",
+            "robots",
+            "name",
+            "date",
+            "location",
+            "notes",
+            "was_modified",
+        ]
+        # maintained from the files of the mission
+        read_only_fields = ["total_duration", "total_size", "robots"]
+
+
+class MissionFilterSerializer(serializers.Serializer):
+    """Validates the query parameters used to filter missions"""
+
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    min_size = serializers.IntegerField(required=False, min_value=0)
+    max_size = serializers.IntegerField(required=False, min_value=0)
+    min_duration = serializers.IntegerField(required=False, min_value=0)
+    max_duration = serializers.IntegerField(required=False, min_value=0)
+    min_files = serializers.IntegerField(required=False, min_value=0)
+    max_files = serializers.IntegerField(required=False, min_value=0)
+    tag = serializers.ListField(child=serializers.CharField(), required=False)
+    tag_mode = serializers.ChoiceField(choices=["and", "or"], default="and")
+    robot = serializers.CharField(required=False)
+    type = serializers.CharField(required=False)
+    location = serializers.CharField(required=False)
+    notes = serializers.CharField(required=False)
+
+    def validate(self, data):
+        if (
+            data.get("date_from")
+            and data.get("date_to")
+            and data["date_from"] > data["date_to"]
+        ):
+            raise serializers.ValidationError("date_from must not be after date_to")
+        if "tag" in data:
+            data["tags"] = data.pop("tag")
+        return data
+
+
+class MissionSearchSerializer(serializers.Serializer):
+    """Validates the query parameters of the mission search"""
+
+    q = serializers.CharField()
+    limit = serializers.IntegerField(default=50, min_value=1, max_value=1000)
+
+
+class MissionExportSerializer(serializers.Serializer):
+    """Validates the query parameters of the mission export"""
+
+    archive = serializers.ChoiceField(choices=ARCHIVE_FORMATS, default="zip")
+    videos = serializers.BooleanField(default=False)
+
+
+class TopicPredicateSerializer(serializers.Serializer):
+    """One condition on the topics of a file, all given fields have to match"""
+
+    name = serializers.CharField(required=False)
+    type = serializers.CharField(required=False)
+    min_frequency = serializers.FloatField(required=False, min_value=0)
+    max_frequency = serializers.FloatField(required=False, min_value=0)
+    min_message_count = serializers.IntegerField(required=False, min_value=0)
+
+    def validate(self, data):
+        unknown = set(self.initial_data) - set(self.fields)
+        if unknown:
+            raise serializers.ValidationError(
+                f"Unknown fields: {', '.join(sorted(unknown))}"
+            )
+        if not data:
+            raise serializers.ValidationError("Empty topic predicate")
+        return data
+
 
-    def get_total_duration(self, obj):
-        # calculate the total duration of all files in the mission
-        result = File.objects.filter(mission=obj).aggregate(Sum("duration"))
-        return result["duration__sum"] or 0
+class TopicQuerySerializer(serializers.Serializer):
+    """
+    Validates a tree of topic predicates combined with "and" and "or", e.g.
+    `{"and": [{"name": "/camera/front", "min_frequency": 15}, {"type": "sensor_msgs/msg/Imu"}]}`
+    """
 
-    def get_total_size(self, obj):
-        # calculate the total size of all files in the mission
-        result = File.objects.filter(mission=obj).aggregate(Sum("size"))
-        return result["size__sum"] or 0
+    max_depth = 5
+    max_predicates = 50
 
-    def get_robots(self, obj):
-        # get all robot names in the mission
-        result = list(
-            File.objects.filter(mission=obj).values_list("robot", flat=True).distinct()
-        )
-        if None in result:
-            result.remove(None)
-        result = ", ".join(result)
-        return result
+    def to_internal_value(self, data):
+        self._predicates = 0
+        try:
+            return self._validate_node(data, 0)
+        except serializers.ValidationError as e:
+            raise serializers.ValidationError(serializers.as_serializer_error(e))
+
+    def _validate_node(self, data, depth: int):
+        if not isinstance(data, dict):
+            raise serializers.ValidationError("Expected an object")
+        operators = [op for op in ("and", "or") if op in data]
+        if not operators:
+            self._predicates += 1
+            if self._predicates > self.max_predicates:
+                raise serializers.ValidationError(
+                    f"More than {self.max_predicates} predicates"
+                )
+            predicate = TopicPredicateSerializer(data=data)
+            predicate.is_valid(raise_exception=True)
+            return dict(predicate.validated_data)
+        if len(data) != 1:
+            raise serializers.ValidationError(
+                "'and' and 'or' can't be combined with other fields in one object"
+            )
+        if depth >= self.max_depth:
+            raise serializers.ValidationError(f"Nested deeper than {self.max_depth}")
+        op = operators[0]
+        if not isinstance(data[op], list) or not data[op]:
+            raise serializers.ValidationError(f"'{op}' must be a non empty list")
+        return {op: [self._validate_node(child, depth + 1) for child in data[op]]}
 
 
 class MissionWasModifiedSerializer(serializers.ModelSerializer):
@@ -60,11 +154,9 @@ class FileSerializer(serializers.ModelSerializer):
         ]
 
     def get_file_url(self, obj):
-        request = self.context.get("request")
         url = obj.file.url
-        if request and hasattr(request, "session"):
-            sessionid = request.session.session_key
-            url += f"?sessionid={sessionid}"
+        if self.context.get("request"):
+            url += f"?token={create_token(obj.file.name)}"
         return url
 
 
@@ -107,6 +199,28 @@ class MissionTagSerializer(serializers.ModelSerializer):
         return mission_tag
 
 
+class MissionTagBatchItemSerializer(serializers.Serializer):
+    mission_id = serializers.IntegerField()
+    tag_name = serializers.CharField(max_length=42)
+
+
+class RobotBatchItemSerializer(serializers.Serializer):
+    file_path = serializers.CharField()
+    robot = serializers.CharField(max_length=65536, allow_null=True, allow_blank=True)
+
+
+class MissionBatchItemSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField(max_length=65536, required=False)
+    date = serializers.DateField(required=False)
+    location = serializers.CharField(
+        max_length=65536, allow_null=True, allow_blank=True, required=False
+    )
+    notes = serializers.CharField(
+        max_length=65536, allow_null=True, allow_blank=True, required=False
+    )
+
+
 class TopicSerializer(serializers.ModelSerializer):
     video_path = serializers.SerializerMethodField()
     video_url = serializers.SerializerMethodField()
@@ -126,11 +240,9 @@ class TopicSerializer(serializers.ModelSerializer):
         if not obj.video:
             return None
 
-        request = self.context.get("request")
         url = obj.video.url.replace("/download/", "/stream/")
-        if request and hasattr(request, "session"):
-            sessionid = request.session.session_key
-            url += f"?sessionid={sessionid}"
+        if self.context.get("request"):
+            url += f"?token={create_token(obj.video.name)}"
         return url
 
     def get_video_path(self, obj):
@@ -139,7 +251,52 @@ class TopicSerializer(serializers.ModelSerializer):
         return None
 
 
+class TopicCatalogSerializer(serializers.Serializer):
+    """Serializes the rows of Topic.objects.catalog()"""
+
+    name = serializers.CharField()
+    type = serializers.CharField()
+    file_count = serializers.IntegerField()
+    mission_count = serializers.IntegerField()
+    message_count = serializers.IntegerField()
+    min_frequency = serializers.FloatField()
+    max_frequency = serializers.FloatField()
+    avg_frequency = serializers.FloatField()
+    has_video = serializers.SerializerMethodField()
+
+    def get_has_video(self, obj) -> bool:
+        return obj["video_count"] > 0
+
+
 class DeniedTopicNameSerializer(serializers.ModelSerializer):
     class Meta:
         model = Denied_topics
-        fields = ["name"]
+        fields = ["name", "kind"]
+
+    def validate(self, data):
+        Denied_topics(**data).clean()
+        return data
+
+
+class FileBundleSerializer(FileSerializer):
+    topics = TopicSerializer(many=True, read_only=True, source="topic_set")
+
+    class Meta(FileSerializer.Meta):
+        fields = FileSerializer.Meta.fields + ["topics"]
+
+
+class MissionBundleSerializer(MissionSerializer):
+    """
+    A mission with its tags, files and the topics of the files.\
+    Expects a mission from Mission.objects.bundle() to avoid queries per file.
+    """
+
+    tags = serializers.SerializerMethodField()
+    files = FileBundleSerializer(many=True, read_only=True, source="file_set")
+
+    class Meta(MissionSerializer.Meta):
+        fields = MissionSerializer.Meta.fields + ["tags", "files"]
+
+    def get_tags(self, obj):
+        tags = [mission_tag.tag for mission_tag in obj.mission_tags_set.all()]
+        return TagSerializer(tags, many=True).data
@@ -0,0 +1,195 @@
+import threading
+from contextlib import contextmanager
+from django.db import transaction
+from django.db.models import Model, QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal
+from . import cache, denylist, search
+from .models import (
+    Denied_topics,
+    File,
+    Mission,
+    Mission_tags,
+    ModelVersion,
+    Tag,
+    Topic,
+)
+
+VERSIONED_MODELS = (Mission, File, Tag, Mission_tags, Topic, Denied_topics)
+
+# QuerySet.update() and bulk operations send no post_save or post_delete signals.
+# Code using them sends this signal with the changed model as sender instead:
+# bulk_changed.send(sender=Mission)
+# If they change searchable text, they call reindex_missions() as well.
+bulk_changed = Signal()
+
+_local = threading.local()
+
+
+class _Changes:
+    """Effects of the model signals collected in a coalesce_changes() block"""
+
+    def __init__(self):
+        self.models: dict[type[Model], None] = {}
+        # missions whose search document has to be updated or removed
+        self.index: set[int] = set()
+        self.unindex: set[int] = set()
+        # files of changed topics, their missions are looked up with one query
+        self.index_files: set[int] = set()
+
+    def send(self):
+        if self.index_files:
+            self.index.update(
+                File.objects.filter(id__in=self.index_files).values_list(
+                    "mission_id", flat=True
+                )
+            )
+        if self.index - self.unindex:
+            search.index_missions(*(self.index - self.unindex))
+        if self.unindex:
+            search.remove_missions(*self.unindex)
+        if self.models:
+            ModelVersion.bump(*self.models)
+            cache.invalidate(*self.models)
+
+
+def _collecting() -> _Changes | None:
+    return getattr(_local, "changes", None)
+
+
+@contextmanager
+def coalesce_changes():
+    """
+    Collect the effects of the model signals sent in the block and apply each of them
+    once at its end, instead of once per saved or deleted row.\
+    Used around imports and batch writes. A nested block joins the outer one.
+    """
+    if _collecting() is not None:
+        yield
+        return
+    changes = _local.changes = _Changes()
+    try:
+        yield
+    except BaseException:
+        _local.changes = None
+        # writes in a transaction are rolled back, others are already committed
+        if not transaction.get_connection().in_atomic_block:
+            changes.send()
+        raise
+    _local.changes = None
+    changes.send()
+
+
+def model_changed(sender, **kwargs):
+    """
+    Increase the version stamp of a model and invalidate the cached responses
+    depending on it whenever an instance is saved or deleted,
+    no matter if the write comes from the REST API, the CLI or a sync.\
+    In a coalesce_changes() block both happen once at its end.
+    """
+    changes = _collecting()
+    if changes is None:
+        ModelVersion.bump(sender)
+        cache.invalidate(sender)
+    else:
+        changes.models[sender] = None
+
+
+for model in VERSIONED_MODELS:
+    post_save.connect(model_changed, sender=model)
+    post_delete.connect(model_changed, sender=model)
+    bulk_changed.connect(model_changed, sender=model)
+
+
+def _deleted_with(origin, *models: type[Model]) -> bool:
+    """True if the deletion was started on an instance or queryset of one of the models"""
+    if isinstance(origin, QuerySet):
+        return origin.model in models
+    return isinstance(origin, models)
+
+
+for signal in (post_save, post_delete, bulk_changed):
+    signal.connect(denylist.invalidate, sender=Denied_topics)
+
+
+def update_mission_stats(sender, instance: File, origin=None, **kwargs):
+    """
+    Recompute the file statistics of the mission of a saved or deleted file.\
+    Skipped when the file is deleted, because its mission is deleted.
+    """
+    if _deleted_with(origin, Mission):
+        return
+    update_missions_of_files(instance.mission_id)
+
+
+def update_missions_of_files(*mission_ids: int):
+    """
+    Recompute the file statistics of missions after their files changed.\
+    Has to be called after bulk operations on files, which send no signals.
+    """
+    Mission.objects.filter(id__in=mission_ids).update_stats()
+    bulk_changed.send(sender=Mission)
+
+
+post_save.connect(update_mission_stats, sender=File)
+post_delete.connect(update_mission_stats, sender=File)
+
+
+def reindex_missions(*mission_ids: int):
+    """
+    Update the search documents of missions,
+    in a coalesce_changes() block once per mission at its end.
+    """
+    changes = _collecting()
+    if changes is None:
+        search.index_missions(*mission_ids)
+    else:
+        changes.index.update(mission_ids)
+
+
+def index_mission(sender, instance: Mission, **kwargs):
+    reindex_missions(instance.id)
+
+
+def unindex_mission(sender, instance: Mission, **kwargs):
+    changes = _collecting()
+    if changes is None:
+        search.remove_missions(instance.id)
+    else:
+        changes.unindex.add(instance.id)
+
+
+def index_mission_of_relation(sender, instance, origin=None, **kwargs):
+    """
+    Update the search document of the mission of a saved or deleted
+    Mission_tags, File or Topic.\
+    Skipped when the mission or file is deleted, which updates the document itself.
+    """
+    if isinstance(instance, Topic):
+        if not _deleted_with(origin, Mission, File):
+            changes = _collecting()
+            if changes is None:
+                reindex_missions(instance.file.mission_id)
+            else:
+                changes.index_files.add(instance.file_id)
+    elif not _deleted_with(origin, Mission):
+        reindex_missions(instance.mission_id)
+
+
+def index_missions_of_tag(sender, instance: Tag, created=False, **kwargs):
+    """Update the search documents of all missions with a renamed tag"""
+    if not created:
+        reindex_missions(
+            *Mission_tags.objects.filter(tag=instance).values_list(
+                "mission_id", flat=True
+            )
+        )
+
+
+post_save.connect(index_mission, sender=Mission)
+post_delete.connect(unindex_mission, sender=Mission)
+post_save.connect(index_missions_of_tag, sender=Tag)
+for model in (Mission_tags, Topic):
+    post_save.connect(index_mission_of_relation, sender=model)
+    post_delete.connect(index_mission_of_relation, sender=model)
+post_delete.connect(index_mission_of_relation, sender=File)
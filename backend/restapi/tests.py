@@ -2,10 +2,14 @@ from django.test import TestCase
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.urls import reverse
+from django.db import connection, transaction
+from django.db.models import QuerySet
 from django.db.utils import IntegrityError
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from django.contrib.auth.models import User
 from django.core.files.storage.memory import InMemoryStorage
+from django.core.cache import cache
 from django.core.files.base import ContentFile
 from .models import (
     Denied_topics,
@@ -13,10 +17,21 @@ from .models import (
     Mission,
     Mission_tags,
     File,
+    ModelVersion,
     Topic,
 )
+from . import cache as restapi_cache
+from . import denylist, download_tokens, search
+from .serializer import TopicQuerySerializer
+from .signals import bulk_changed, coalesce_changes
+import base64
+import io
+import json
 import logging
+import tarfile
 import urllib.parse
+import zipfile
+from unittest.mock import patch
 
 # user without password for tests
 user: User = User(username="test")
@@ -31,6 +46,11 @@ class APIAuthTestCase(APITestCase):
         # login the user even without password (faster, because skips hashing)
         self.client.force_login(user=user)
 
+        # the cache and the loaded denylist are not rolled back with the database
+        # between tests
+        cache.clear()
+        denylist.invalidate()
+
     def tearDown(self):
         self.client.logout()
 
@@ -604,6 +624,16 @@ class MissionFilesTestCase(APIAuthTestCase):
         )
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data["id"], self.file1.id)
+
+    def test_file_url_is_signed(self):
+        response = self.client.get(
+            reverse("get_file_by_path", kwargs={"file_path": self.file1.file.name})
+        )
+        url = urllib.parse.urlparse(response.data["file_url"])
+        self.assertNotIn("sessionid", url.query)
+        token = urllib.parse.parse_qs(url.query)["token"][0]
+        self.assertIsNotNone(download_tokens.check_token(token, "path/to/file1"))
+        self.assertIsNone(download_tokens.check_token(token, "path/to/file2"))
         self.assertIn(self.file1.file.name, response.data["file_path"])
 
 
@@ -682,6 +712,23 @@ class RestAPIDeniedTopicNamesTestCases(APIAuthTestCase):
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         self.assertFalse(Denied_topics.objects.filter(name="Car1").exists())
 
+    def test_create_denied_topic_pattern(self):
+        response = self.client.post(
+            reverse("Denied_topics_create"),
+            {"name": "/debug/**", "kind": "glob"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["kind"], "glob")
+
+        response = self.client.post(
+            reverse("Denied_topics_create"),
+            {"name": "/debug/(", "kind": "regex"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("name", response.data)
+
 
 class RestAPITopicsByFile(APIAuthTestCase):
     def setUp(self):
@@ -823,3 +870,1327 @@ class SetWasModifiedTestCase(APIAuthTestCase):
         self.assertEqual(
             self.mission.notes, old_notes
         )  # make sure notes are not changed
+
+
+class MissionQueryCountTestCase(APIAuthTestCase):
+    def setUp(self):
+        super().setUp()
+        # fake storage
+        self._field = File.file.field
+        self._default_storage = self._field.storage
+        self._field.storage = InMemoryStorage()
+
+        self.tag = Tag.objects.create(name="QueryCountTag")
+        self.mission_count = 0
+
+    def tearDown(self):
+        super().tearDown()
+        self._field.storage = self._default_storage
+
+    def add_missions(self, count: int):
+        """Create missions with two files from different robots and one tag each"""
+        for _ in range(count):
+            i = self.mission_count
+            self.mission_count += 1
+            mission = Mission.objects.create(name=f"Mission{i}", date="2025-01-01")
+            Mission_tags.objects.create(mission=mission, tag=self.tag)
+            for j, robot in enumerate(["robotA", "robotB"]):
+                File.objects.create(
+                    mission=mission,
+                    file=f"mission{i}/file{j}.mcap",
+                    robot=robot,
+                    duration=10,
+                    size=100,
+                    type="train",
+                )
+
+    def count_queries(self, url: str) -> int:
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(context.captured_queries)
+
+    def test_get_missions_query_count_is_constant(self):
+        url = reverse("get_missions")
+        self.add_missions(2)
+        few = self.count_queries(url)
+        self.add_missions(20)
+        many = self.count_queries(url)
+        self.assertEqual(few, many)
+
+    def test_get_missions_by_tag_query_count_is_constant(self):
+        url = reverse("get_missions_by_tag", kwargs={"name": self.tag.name})
+        self.add_missions(2)
+        few = self.count_queries(url)
+        self.add_missions(20)
+        many = self.count_queries(url)
+        self.assertEqual(few, many)
+
+    def test_annotated_values(self):
+        self.add_missions(2)
+        File.objects.create(
+            mission=Mission.objects.get(name="Mission0"),
+            file="mission0/file2.mcap",
+            robot=None,
+            duration=5,
+            size=50,
+            type="test",
+        )
+        response = self.client.get(reverse("get_missions"))
+        self.assertEqual(response.data[0]["total_duration"], 25)
+        self.assertEqual(response.data[0]["total_size"], 250)
+        self.assertEqual(response.data[0]["robots"], "robotA, robotB")
+        self.assertEqual(response.data[1]["total_duration"], 20)
+
+        mission = Mission.objects.get(name="Mission1")
+        response = self.client.get(reverse("mission_detail", kwargs={"pk": mission.id}))
+        self.assertEqual(response.data["total_size"], 200)
+        self.assertEqual(response.data["robots"], "robotA, robotB")
+
+
+class KeysetPaginationTestCase(APIAuthTestCase):
+    def setUp(self):
+        super().setUp()
+        # create missions with dates in reverse order of creation
+        self.missions = [
+            Mission.objects.create(name=f"Mission{i}", date=f"2025-01-{10 - i // 2:02}")
+            for i in range(7)
+        ]
+        self.expected = sorted(self.missions, key=lambda m: (m.date, m.id))
+
+        # raise logging level to ERROR
+        self.logger = logging.getLogger("django.request")
+        self.previous_logging_level = self.logger.getEffectiveLevel()
+        self.logger.setLevel(logging.ERROR)
+
+    def tearDown(self):
+        super().tearDown()
+        self.logger.setLevel(self.previous_logging_level)
+
+    def collect_pages(self, url: str) -> list[dict]:
+        results = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data["results"]), 3)
+            results += response.data["results"]
+            url = response.data["next"]
+        return results
+
+    def test_unpaginated_by_default(self):
+        # the whole list keeps the order by id it had before pagination
+        response = self.client.get(reverse("get_missions"))
+        self.assertEqual(len(response.data), 7)
+        self.assertEqual(
+            [m["id"] for m in response.data], [m.id for m in self.missions]
+        )
+        response = self.client.get(reverse("get_missions") + "?ordering=date")
+        self.assertEqual(
+            [m["id"] for m in response.data], [m.id for m in self.expected]
+        )
+
+    def test_pages_cover_all_missions(self):
+        results = self.collect_pages(reverse("get_missions") + "?page_size=3")
+        self.assertEqual([m["id"] for m in results], [m.id for m in self.expected])
+
+    def test_descending_ordering(self):
+        results = self.collect_pages(
+            reverse("get_missions") + "?page_size=3&ordering=-date"
+        )
+        self.assertEqual(
+            [m["id"] for m in results], [m.id for m in reversed(self.expected)]
+        )
+
+    def test_ordering_by_name(self):
+        response = self.client.get(reverse("get_missions") + "?ordering=-name")
+        self.assertEqual(response.data[0]["name"], "Mission6")
+
+    def test_invalid_ordering(self):
+        response = self.client.get(reverse("get_missions") + "?ordering=notes")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse("get_missions") + "?cursor=invalid")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cursor_with_invalid_values(self):
+        for values in [
+            ["not a date", 1],
+            [None, 1],
+            [{"a": 1}, 1],
+            ["2025-01-01", "x"],
+        ]:
+            data = json.dumps({"o": ["date", "id"], "v": values})
+            cursor = base64.urlsafe_b64encode(data.encode()).decode()
+            response = self.client.get(reverse("get_missions") + f"?cursor={cursor}")
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND, values)
+
+    def test_cursor_of_other_ordering(self):
+        response = self.client.get(reverse("get_missions") + "?page_size=3")
+        response = self.client.get(response.data["next"] + "&ordering=name")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_tags_pages(self):
+        for i in range(5):
+            Tag.objects.create(name=f"PageTag{i}")
+        results = self.collect_pages(reverse("get_tags") + "?page_size=2")
+        self.assertEqual(
+            [t["id"] for t in results],
+            list(Tag.objects.order_by("id").values_list("id", flat=True)),
+        )
+
+
+class MissionFilterTestCase(APIAuthTestCase):
+    def setUp(self):
+        super().setUp()
+        # fake storage
+        self._field = File.file.field
+        self._default_storage = self._field.storage
+        self._field.storage = InMemoryStorage()
+
+        self.apples = Mission.objects.create(
+            name="apples", date="2025-01-01", location="Tübingen", notes="lidar ok"
+        )
+        self.pears = Mission.objects.create(
+            name="pears", date="2025-02-01", location="Stuttgart", notes="Lidar dropout"
+        )
+        self.plums = Mission.objects.create(name="plums", date="2025-03-01")
+
+        red = Tag.objects.create(name="red")
+        green = Tag.objects.create(name="green")
+        Mission_tags.objects.create(mission=self.apples, tag=red)
+        Mission_tags.objects.create(mission=self.apples, tag=green)
+        Mission_tags.objects.create(mission=self.pears, tag=green)
+
+        File.objects.create(
+            mission=self.apples,
+            file="apples/train.mcap",
+            robot="robotA",
+            duration=10,
+            size=100,
+            type="train",
+        )
+        File.objects.create(
+            mission=self.apples,
+            file="apples/test.mcap",
+            robot="robotB",
+            duration=20,
+            size=200,
+            type="test",
+        )
+        File.objects.create(
+            mission=self.pears,
+            file="pears/test.mcap",
+            robot="robotB",
+            duration=30,
+            size=300,
+            type="test",
+        )
+
+        # raise logging level to ERROR
+        self.logger = logging.getLogger("django.request")
+        self.previous_logging_level = self.logger.getEffectiveLevel()
+        self.logger.setLevel(logging.ERROR)
+
+    def tearDown(self):
+        super().tearDown()
+        self._field.storage = self._default_storage
+        self.logger.setLevel(self.previous_logging_level)
+
+    def get_names(self, query: str) -> list[str]:
+        response = self.client.get(reverse("get_missions") + query)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [mission["name"] for mission in response.data]
+
+    def test_date_range(self):
+        self.assertEqual(self.get_names("?date_from=2025-02-01"), ["pears", "plums"])
+        self.assertEqual(self.get_names("?date_to=2025-02-01"), ["apples", "pears"])
+        self.assertEqual(
+            self.get_names("?date_from=2025-01-15&date_to=2025-02-15"), ["pears"]
+        )
+
+    def test_tags(self):
+        self.assertEqual(self.get_names("?tag=green"), ["apples", "pears"])
+        self.assertEqual(self.get_names("?tag=green&tag=red"), ["apples"])
+        self.assertEqual(
+            self.get_names("?tag=green&tag=red&tag_mode=or"), ["apples", "pears"]
+        )
+
+    def test_robot_and_type(self):
+        self.assertEqual(self.get_names("?robot=robotB"), ["apples", "pears"])
+        self.assertEqual(self.get_names("?type=train"), ["apples"])
+        # both conditions have to match on the same file
+        self.assertEqual(self.get_names("?robot=robotB&type=train"), [])
+
+    def test_text(self):
+        self.assertEqual(self.get_names("?notes=lidar"), ["apples", "pears"])
+        self.assertEqual(self.get_names("?notes=dropout&location=stutt"), ["pears"])
+
+    def test_filter_keeps_aggregates(self):
+        response = self.client.get(reverse("get_missions") + "?type=train")
+        self.assertEqual(response.data[0]["total_size"], 300)
+        self.assertEqual(response.data[0]["robots"], "robotA, robotB")
+
+    def test_invalid_filters(self):
+        response = self.client.get(reverse("get_missions") + "?date_from=yesterday")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(
+            reverse("get_missions") + "?date_from=2025-03-01&date_to=2025-01-01"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse("get_missions") + "?tag_mode=xor")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filter_is_single_query(self):
+        queryset = Mission.objects.apply_filters(
+            tags=["green", "red"], robot="robotB", notes="lidar"
+        )
+        with CaptureQueriesContext(connection) as context:
+            list(queryset)
+        self.assertEqual(len(context.captured_queries), 1)
+
+
+class ETagTestCase(APIAuthTestCase):
+    def setUp(self):
+        super().setUp()
+        # fake storage
+        self._field = File.file.field
+        self._default_storage = self._field.storage
+        self._field.storage = InMemoryStorage()
+
+        self.mission = Mission.objects.create(name="ETagMission", date="2025-01-01")
+        self.tag = Tag.objects.create(name="ETagTag")
+        Mission_tags.objects.create(mission=self.mission, tag=self.tag)
+        self.file = File.objects.create(
+            mission=self.mission,
+            file="etag/file.mcap",
+            duration=10,
+            size=100,
+            type="train",
+        )
+        Topic.objects.create(
+            file=self.file, name="/imu", type="imu", message_count=1, frequency=1
+        )
+
+    def tearDown(self):
+        super().tearDown()
+        self._field.storage = self._default_storage
+
+    def assert_not_modified_until(self, url: str, change):
+        """Checks that url answers with 304 until change is called"""
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response.headers["ETag"]
+
+        response = self.client.get(url, headers={"if-none-match": etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b"")
+
+        change()
+        response = self.client.get(url, headers={"if-none-match": etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    def test_get_missions(self):
+        def change():
+            # bulk update without signals, like in the sync command
+            Mission.objects.filter(id=self.mission.id).update(was_modified=True)
+            bulk_changed.send(sender=Mission)
+
+        self.assert_not_modified_until(reverse("get_missions"), change)
+
+    def test_get_missions_file_change(self):
+        def change():
+            self.file.robot = "robotA"
+            self.file.save()
+
+        self.assert_not_modified_until(reverse("get_missions"), change)
+
+    def test_mission_detail(self):
+        def change():
+            self.client.put(
+                reverse("mission_detail", kwargs={"pk": self.mission.id}),
+                {"name": "renamed", "date": "2025-01-01"},
+                format="json",
+            )
+
+        self.assert_not_modified_until(
+            reverse("mission_detail", kwargs={"pk": self.mission.id}), change
+        )
+
+    def test_get_tags(self):
+        self.assert_not_modified_until(
+            reverse("get_tags"), lambda: Tag.objects.create(name="other")
+        )
+
+    def test_tags_by_mission(self):
+        self.assert_not_modified_until(
+            reverse("get_tags_by_mission_id", kwargs={"id": self.mission.id}),
+            lambda: Mission_tags.objects.filter(mission=self.mission).delete(),
+        )
+
+    def test_topics_from_files(self):
+        self.assert_not_modified_until(
+            reverse("get_topics_from_files", kwargs={"file_path": self.file.file.name}),
+            lambda: Topic.objects.filter(file=self.file).delete(),
+        )
+
+    def test_different_urls_have_different_etags(self):
+        first = self.client.get(reverse("get_missions"))
+        second = self.client.get(reverse("get_missions") + "?ordering=-date")
+        self.assertNotEqual(first.headers["ETag"], second.headers["ETag"])
+
+    def test_version_created_concurrently(self):
+        version = ModelVersion.get_versions(Tag)[0]
+        update = QuerySet.update
+        calls = []
+
+        def update_after_concurrent_create(queryset, **kwargs):
+            # the first update doesn't see the row created by another transaction
+            calls.append(kwargs)
+            return 0 if len(calls) == 1 else update(queryset, **kwargs)
+
+        with patch.object(
+            QuerySet,
+            "update",
+            autospec=True,
+            side_effect=update_after_concurrent_create,
+        ):
+            with transaction.atomic():
+                ModelVersion.bump(Tag)
+                # the failed insert didn't abort the transaction
+                self.assertEqual(Tag.objects.filter(name="ETagTag").count(), 1)
+        self.assertEqual(ModelVersion.get_versions(Tag), [version + 1])
+
+
+class CoalesceChangesTestCase(TestCase):
+    def version_writes(self, context) -> int:
+        return sum(
+            "restapi_modelversion" in q["sql"] and not q["sql"].startswith("SELECT")
+            for q in context.captured_queries
+        )
+
+    def test_version_bumped_once(self):
+        ModelVersion.bump(Tag)
+        version = ModelVersion.get_versions(Tag)[0]
+        with CaptureQueriesContext(connection) as context:
+            with coalesce_changes():
+                for i in range(20):
+                    Tag.objects.create(name=f"coalesced{i}")
+                # nested blocks join the outer one
+                with coalesce_changes():
+                    Tag.objects.filter(name="coalesced0").delete()
+        self.assertEqual(ModelVersion.get_versions(Tag), [version + 1])
+        self.assertEqual(self.version_writes(context), 1)
+
+    def test_rows_bump_without_block(self):
+        version = ModelVersion.get_versions(Tag)[0]
+        for i in range(3):
+            Tag.objects.create(name=f"single{i}")
+        self.assertEqual(ModelVersion.get_versions(Tag), [version + 3])
+
+    def test_rolled_back_block_bumps_nothing(self):
+        versions = ModelVersion.get_versions(Tag, Mission)
+        try:
+            with transaction.atomic(), coalesce_changes():
+                Tag.objects.create(name="rolled back")
+                Mission.objects.create(name="rolled back", date="2025-01-01")
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertEqual(ModelVersion.get_versions(Tag, Mission), versions)
+
+
+class ResponseCacheTestCase(APIAuthTestCase):
+    def setUp(self):
+        super().setUp()
+        self.mission = Mission.objects.create(name="CachedMission", date="2025-01-01")
+        self.url = reverse("get_missions")
+        restapi_cache.reset_stats()
+
+    def test_second_request_is_a_hit(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]["name"], "CachedMission")
+        # no mission query, only session and version lookups
+        self.assertFalse(
+            any("restapi_mission" in q["sql"] for q in context.captured_queries)
+        )
+        stats = self.client.get(reverse("cache_stats")).data
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+
+    def test_keys_scoped_by_parameters(self):
+        self.client.get(self.url)
+        response = self.client.get(self.url + "?name_filter_not_used=1")
+        self.assertEqual(restapi_cache.get_stats()["misses"], 2)
+        self.assertEqual(len(response.data), 1)
+
+    def test_save_invalidates(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.mission.name = "Renamed"
+            self.mission.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.data[0]["name"], "Renamed")
+        stats = restapi_cache.get_stats()
+        self.assertEqual(stats["hits"], 0)
+        self.assertGreaterEqual(stats["invalidations"], 1)
+
+    def test_bulk_update_invalidates(self):
+        self.client.get(self.url)
+        Mission.objects.filter(id=self.mission.id).update(was_modified=True)
+        bulk_changed.send(sender=Mission)
+        response = self.client.get(self.url)
+        self.assertTrue(response.data[0]["was_modified"])
+
+    def test_write_in_other_process(self):
+        response = self.client.get(self.url)
+        etag = response.headers["ETag"]
+        # another process (e.g. the CLI) only bumps the version in the database,
+        # it can't reach the cache of this process
+        Mission.objects.filter(id=self.mission.id).update(name="Renamed")
+        ModelVersion.bump(Mission)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]["name"], "Renamed")
+        self.assertNotEqual(response.headers["ETag"], etag)
+        self.assertEqual(restapi_cache.get_stats()["hits"], 0)
+
+    def test_versions_queried_once(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(self.url)
+        self.assertEqual(
+            sum("restapi_modelversion" in q["sql"] for q in context.captured_queries),
+            1,
+        )
+
+    def test_rolled_back_write_counts_no_invalidation(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    Mission.objects.create(name="RolledBack", date="2025-01-02")
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual(restapi_cache.get_stats()["invalidations"], 0)
+        self.client.get(self.url)
+        self.assertEqual(restapi_cache.get_stats()["hits"], 1)
+
+    def test_coalesced_writes_invalidate_once(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True), coalesce_changes():
+            for i in range(10):
+                Mission.objects.create(name=f"Coalesced{i}", date="2025-01-02")
+        self.assertEqual(restapi_cache.get_stats()["invalidations"], 1)
+        response = self.client.get(self.url)
+        self.assertEqual(len(response.data), 11)
+
+    def test_unrelated_change_keeps_entry(self):
+        self.client.get(reverse("get_tags"))
+        Mission.objects.create(name="Other", date="2025-01-02")
+        self.client.get(reverse("get_tags"))
+        self.assertEqual(restapi_cache.get_stats()["hits"], 1)
+
+
+class MissionBundleTestCase(APIAuthTestCase):
+    def setUp(self):
+        super().setUp()
+        # fake storage
+        self._field = File.file.field
+        self._default_storage = self._field.storage
+        self._field.storage = InMemoryStorage()
+
+        self.mission = Mission.objects.create(name="BundleMission", date="2025-01-01")
+        for name in ["b", "a"]:
+            Mission_tags.objects.create(
+                mission=self.mission, tag=Tag.objects.create(name=name)
+            )
+        self.file_count = 0
+
+        # raise logging level to ERROR
+        self.logger = logging.getLogger("django.request")
+        self.previous_logging_level = self.logger.getEffectiveLevel()
+        self.logger.setLevel(logging.ERROR)
+
+    def tearDown(self):
+        super().tearDown()
+        self._field.storage = self._default_storage
+        self.logger.setLevel(self.previous_logging_level)
+
+    def add_files(self, count: int, topics: int = 3):
+        for _ in range(count):
+            file = File.objects.create(
+                mission=self.mission,
+                file=f"bundle/file{self.file_count}.mcap",
+                robot="robotA",
+                duration=10,
+                size=100,
+                type="train",
+            )
+            self.file_count += 1
+            for t in range(topics):
+                Topic.objects.create(
+                    file=file,
+                    name=f"/topic{t}",
+                    type="imu",
+                    message_count=1,
+                    frequency=1,
+                )
+
+    def get_bundle(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                reverse("mission_bundle", kwargs={"pk": self.mission.id})
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, len(context.captured_queries)
+
+    def test_bundle_content(self):
+        self.add_files(2, topics=2)
+        response, _ = self.get_bundle()
+        self.assertEqual(response.data["name"], "BundleMission")
+        self.assertEqual(response.data["total_size"], 200)
+        self.assertEqual(response.data["robots"], "robotA")
+        self.assertEqual([t["name"] for t in response.data["tags"]], ["b", "a"])
+        self.assertEqual(len(response.data["files"]), 2)
+        self.assertEqual(response.data["files"][0]["file_path"], "bundle/file0.mcap")
+        self.assertEqual(
+            [t["name"] for t in response.data["files"][1]["topics"]],
+            ["/topic0", "/topic1"],
+        )
+
+    def test_bundle_query_count_is_constant(self):
+        self.add_files(1)
+        _, few = self.get_bundle()
+        self.add_files(10, topics=10)
+        _, many = self.get_bundle()
+        self.assertEqual(few, many)
+
+    def test_bundle_not_found(self):
+        response = self.client.get(reverse("mission_bundle", kwargs={"pk": 9999}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class BatchMutationTestCase(APIAuthTestCase):
+    def setUp(self):
+        super().setUp()
+        # fake storage
+        self._field = File.file.field
+        self._default_storage = self._field.storage
+        self._field.storage = InMemoryStorage()
+
+        self.missions = [
+            Mission.objects.create(name=f"BatchMission{i}", date="2025-01-01")
+            for i in range(3)
+        ]
+        self.tag = Tag.objects.create(name="existing")
+        Mission_tags.objects.create(mission=self.missions[0], tag=self.tag)
+        self.files = [
+            File.objects.create(
+                mission=self.missions[0],
+                file=f"batch/file{i}.mcap",
+                duration=10,
+                size=100,
+                type="train",
+            )
+            for i in range(2)
+        ]
+
+    def tearDown(self):
+        super().tearDown()
+        self._field.storage = self._default_storage
+
+    def test_add_tags(self):
+        data = [
+            {"mission_id": self.missions[0].id, "tag_name": "existing"},
+            {"mission_id": self.missions[1].id, "tag_name": "existing"},
+            {"mission_id": self.missions[1].id, "tag_name": "new"},
+            {"mission_id": self.missions[2].id, "tag_name": "new"},
+            {"mission_id": 9999, "tag_name": "new"},
+            {"mission_id": self.missions[2].id},
+        ]
+        response = self.client.post(
+            reverse("batch_add_tags_to_missions"), data, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data["results"]
+        self.assertEqual(
+            [r["status"] for r in results],
+            ["exists", "created", "created", "created", "not_found", "invalid"],
+        )
+        self.assertFalse(results[1]["tag_created"])
+        self.assertTrue(results[2]["tag_created"])
+        self.assertEqual(Tag.objects.filter(name="new").count(), 1)
+        self.assertEqual(
+            Mission_tags.objects.filter(tag__name="new").count(),
+            2,
+        )
+        self.assertTrue(Mission.objects.get(id=self.missions[2].id).was_modified)
+        self.assertFalse(Mission.objects.get(id=self.missions[0].id).was_modified)
+
+    def test_add_tags_query_count_is_constant(self):
+        def count(n):
+            data = [
+                {"mission_id": self.missions[i % 3].id, "tag_name": f"tag{n}-{i}"}
+                for i in range(n)
+            ]
+            with CaptureQueriesContext(connection) as context:
+                self.client.post(
+                    reverse("batch_add_tags_to_missions"), data, format="json"
+                )
+            return len(context.captured_queries)
+
+        self.assertEqual(count(3), count(30))
+
+    def test_remove_tags(self):
+        data = [
+            {"mission_id": self.missions[0].id, "tag_name": "existing"},
+            {"mission_id": self.missions[1].id, "tag_name": "existing"},
+        ]
+        response = self.client.post(
+            reverse("batch_remove_tags_from_missions"), data, format="json"
+        )
+        self.assertEqual(
+            [r["status"] for r in response.data["results"]], ["deleted", "not_found"]
+        )
+        self.assertFalse(Mission_tags.objects.exists())
+        self.assertTrue(Tag.objects.filter(name="existing").exists())
+
+    def test_add_tags_created_concurrently(self):
+        Tag.objects.create(name="race")
+        filter = Tag.objects.filter
+        calls = []
+
+        def first_lookup_misses(*args, **kwargs):
+            # the tag is created by another request after the first lookup
+            calls.append(kwargs)
+            queryset = filter(*args, **kwargs)
+            return queryset.none() if len(calls) == 1 else queryset
+
+        with patch.object(Tag.objects, "filter", side_effect=first_lookup_misses):
+            response = self.client.post(
+                reverse("batch_add_tags_to_missions"),
+                [{"mission_id": self.missions[1].id, "tag_name": "race"}],
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["results"][0]["status"], "created")
+        self.assertEqual(Tag.objects.filter(name="race").count(), 1)
+        self.assertTrue(
+            Mission_tags.objects.filter(
+                mission=self.missions[1], tag__name="race"
+            ).exists()
+        )
+
+    def test_remove_tags_bumps_once(self):
+        for mission in self.missions[1:]:
+            Mission_tags.objects.create(mission=mission, tag=self.tag)
+        version = ModelVersion.get_versions(Mission_tags)[0]
+        data = [
+            {"mission_id": mission.id, "tag_name": "existing"}
+            for mission in self.missions
+        ]
+        with patch.object(
+            search, "index_missions", wraps=search.index_missions
+        ) as index_missions:
+            self.client.post(
+                reverse("batch_remove_tags_from_missions"), data, format="json"
+            )
+        self.assertFalse(Mission_tags.objects.exists())
+        self.assertEqual(ModelVersion.get_versions(Mission_tags), [version + 1])
+        index_missions.assert_called_once()
+        self.assertCountEqual(
+            index_missions.call_args.args, [mission.id for mission in self.missions]
+        )
+
+    def test_update_robots(self):
+        data = [
+            {"file_path": self.files[0].file.name, "robot": "robotA"},
+            {"file_path": self.files[1].file.name, "robot": None},
+            {"file_path": "missing.mcap", "robot": "robotA"},
+        ]
+        response = self.client.put(reverse("batch_update_robots"), data, format="json")
+        self.assertEqual(
+            [r["status"] for r in response.data["results"]],
+            ["updated", "updated", "not_found"],
+        )
+        self.assertEqual(File.objects.get(id=self.files[0].id).robot, "robotA")
+        self.assertIsNone(File.objects.get(id=self.files[1].id).robot)
+
+    def test_update_missions(self):
+        data = [
+            {"id": self.missions[0].id, "notes": "new notes"},
+            {"id": self.missions[1].id, "name": "BatchMission2"},
+            {"id": self.missions[2].id, "date": "2025-02-01", "location": "Tübingen"},
+            {"id": 9999, "notes": "missing"},
+            {"id": self.missions[0].id, "date": "not a date"},
+        ]
+        response = self.client.put(
+            reverse("batch_update_missions"), data, format="json"
+        )
+        self.assertEqual(
+            [r["status"] for r in response.data["results"]],
+            ["updated", "invalid", "updated", "not_found", "invalid"],
+        )
+        first = Mission.objects.get(id=self.missions[0].id)
+        self.assertEqual(first.notes, "new notes")
+        self.assertEqual(first.name, "BatchMission0")
+        self.assertTrue(first.was_modified)
+        self.assertEqual(
+            Mission.objects.get(id=self.missions[1].id).name, "BatchMission1"
+        )
+        third = Mission.objects.get(id=self.missions[2].id)
+        self.assertEqual(str(third.date), "2025-02-01")
+        self.assertEqual(third.location, "Tübingen")
+
+    def test_invalid_body(self):
+        response = self.client.put(
+            reverse("batch_update_missions"), {"id": 1}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class MissionStatsColumnsTestCase(APIAuthTestCase):
+    def setUp(self):
+        super().setUp()
+        # fake storage
+        self._field = File.file.field
+        self._default_storage = self._field.storage
+        self._field.storage = InMemoryStorage()
+
+        self.small = Mission.objects.create(name="small", date="2025-01-01")
+        self.large = Mission.objects.create(name="large", date="2025-01-02")
+        for mission, size, count in [(self.small, 10, 1), (self.large, 1000, 3)]:
+            for i in range(count):
+                File.objects.create(
+                    mission=mission,
+                    file=f"{mission.name}/file{i}.mcap",
+                    duration=size,
+                    size=size,
+                    type="train",
+                )
+
+    def tearDown(self):
+        super().tearDown()
+        self._field.storage = self._default_storage
+
+    def get_names(self, query: str) -> list[str]:
+        response = self.client.get(reverse("get_missions") + query)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [mission["name"] for mission in response.data]
+
+    def test_ordering(self):
+        self.assertEqual(self.get_names("?ordering=-total_size"), ["large", "small"])
+        self.assertEqual(self.get_names("?ordering=file_count"), ["small", "large"])
+
+    def test_filters(self):
+        self.assertEqual(self.get_names("?min_size=100"), ["large"])
+        self.assertEqual(self.get_names("?max_duration=100"), ["small"])
+        self.assertEqual(self.get_names("?min_files=2&max_files=3"), ["large"])
+
+    def test_update_robot_updates_mission(self):
+        file = File.objects.filter(mission=self.small).first()
+        self.client.put(
+            reverse("update_robot", kwargs={"file_path": file.file.name}),
+            {"robot": "robotA"},
+            format="json",
+        )
+        response = self.client.get(
+            reverse("mission_detail", kwargs={"pk": self.small.id})
+        )
+        self.assertEqual(response.data["robots"], "robotA")
+
+    def test_batch_update_robots_updates_mission(self):
+        data = [
+            {"file_path": file.file.name, "robot": f"robot{i}"}
+            for i, file in enumerate(File.objects.filter(mission=self.large))
+        ]
+        self.client.put(reverse("batch_update_robots"), data, format="json")
+        self.assertEqual(
+            Mission.objects.get(id=self.large.id).robots, "robot0, robot1, robot2"
+        )
+
+
+class MissionSearchTestCase(APIAuthTestCase):
+    def setUp(self):
+        super().setUp()
+        # fake storage
+        self._field = File.file.field
+        self._default_storage = self._field.storage
+        self._field.storage = InMemoryStorage()
+
+        self.lidar = Mission.objects.create(
+            name="field_test",
+            date="2025-01-01",
+            location="orchard",
+            notes="the lidar dropped out twice",
+        )
+        self.camera = Mission.objects.create(
+            name="lidar_calibration", date="2025-01-02", location="lab"
+        )
+        file = File.objects.create(
+            mission=self.camera,
+            file="camera/file.mcap",
+            duration=1,
+            size=1,
+            type="train",
+        )
+        Topic.objects.create(
+            file=file,
+            name="/camera/rear/image_raw",
+            type="sensor_msgs/msg/Image",
+            message_count=1,
+            frequency=1,
+        )
+        Mission_tags.objects.create(
+            mission=self.lidar, tag=Tag.objects.create(name="apples")
+        )
+
+        # raise logging level to ERROR
+        self.logger = logging.getLogger("django.request")
+        self.previous_logging_level = self.logger.getEffectiveLevel()
+        self.logger.setLevel(logging.ERROR)
+
+    def tearDown(self):
+        super().tearDown()
+        self._field.storage = self._default_storage
+        self.logger.setLevel(self.previous_logging_level)
+
+    def search(self, query: str) -> list[str]:
+        response = self.client.get(
+            reverse("search_missions") + "?" + urllib.parse.urlencode({"q": query})
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [mission["name"] for mission in response.data]
+
+    def test_fields(self):
+        self.assertEqual(self.search("dropped"), ["field_test"])
+        self.assertEqual(self.search("orchard"), ["field_test"])
+        self.assertEqual(self.search("apples"), ["field_test"])
+        self.assertEqual(self.search("/camera/rear/image_raw"), ["lidar_calibration"])
+        self.assertEqual(self.search("rear camera"), ["lidar_calibration"])
+        self.assertEqual(self.search("lidar orchard"), ["field_test"])
+        self.assertEqual(self.search("nothing"), [])
+
+    def test_ranking(self):
+        # a match in the name ranks above a match in the notes
+        self.assertEqual(self.search("lidar"), ["lidar_calibration", "field_test"])
+
+    def test_stemming(self):
+        self.assertEqual(self.search("drop"), ["field_test"])
+
+    def test_mission_changes(self):
+        self.lidar.notes = "all fine"
+        self.lidar.save()
+        self.assertEqual(self.search("dropped"), [])
+        self.assertEqual(self.search("fine"), ["field_test"])
+
+        self.lidar.delete()
+        self.assertEqual(self.search("fine"), [])
+
+    def test_tag_changes(self):
+        tag = Tag.objects.get(name="apples")
+        tag.name = "pears"
+        tag.save()
+        self.assertEqual(self.search("apples"), [])
+        self.assertEqual(self.search("pears"), ["field_test"])
+
+        Mission_tags.objects.create(mission=self.camera, tag=tag)
+        self.assertCountEqual(self.search("pears"), ["field_test", "lidar_calibration"])
+
+        tag.delete()
+        self.assertEqual(self.search("pears"), [])
+
+    def test_topic_changes(self):
+        File.objects.get(file="camera/file.mcap").delete()
+        self.assertEqual(self.search("image_raw"), [])
+
+    def test_coalesced_changes(self):
+        file = File.objects.get(file="camera/file.mcap")
+        with (
+            patch.object(
+                search, "index_missions", wraps=search.index_missions
+            ) as index_missions,
+            coalesce_changes(),
+        ):
+            for i in range(20):
+                Topic.objects.create(
+                    file=file,
+                    name=f"/thermal{i}",
+                    type="t",
+                    message_count=1,
+                    frequency=1,
+                )
+            self.lidar.notes = "all fine"
+            self.lidar.save()
+            self.lidar.delete()
+            index_missions.assert_not_called()
+        index_missions.assert_called_once_with(self.camera.id)
+        self.assertEqual(self.search("thermal19"), ["lidar_calibration"])
+        self.assertEqual(self.search("fine"), [])
+
+    def test_batch_changes(self):
+        self.client.put(
+            reverse("batch_update_missions"),
+            [{"id": self.camera.id, "notes": "rain"}],
+            format="json",
+        )
+        self.client.post(
+            reverse("batch_add_tags_to_missions"),
+            [{"mission_id": self.camera.id, "tag_name": "sunny"}],
+            format="json",
+        )
+        self.assertEqual(self.search("rain sunny"), ["lidar_calibration"])
+
+    def test_rebuild_index(self):
+        # simulate changes outside of django
+        Mission.objects.filter(id=self.lidar.id).update(notes="snow")
+        self.assertEqual(self.search("snow"), [])
+        search.rebuild_index()
+        cache.clear()
+        self.assertEqual(self.search("snow"), ["field_test"])
+
+    def test_limit_and_validation(self):
+        response = self.client.get(reverse("search_missions") + "?q=lidar&limit=1")
+        self.assertEqual([m["name"] for m in response.data], ["lidar_calibration"])
+        response = self.client.get(reverse("search_missions"))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.search("!!"), [])
+
+
+class TopicCatalogTestCase(APIAuthTestCase):
+    def setUp(self):
+        super().setUp()
+        # fake storage
+        self._field = File.file.field
+        self._default_storage = self._field.storage
+        self._field.storage = InMemoryStorage()
+
+        for m in range(2):
+            mission = Mission.objects.create(name=f"mission{m}", date="2025-01-01")
+            for f in range(2):
+                file = File.objects.create(
+                    mission=mission,
+                    file=f"catalog/{m}/file{f}.mcap",
+                    duration=1,
+                    size=1,
+                    type="train",
+                )
+                Topic.objects.create(
+                    file=file,
+                    name="/camera/front",
+                    type="sensor_msgs/msg/Image",
+                    message_count=100,
+                    frequency=10 + m * 10 + f,
+                    video=f"catalog/{m}/{f}.mp4" if m == 0 and f == 0 else None,
+                )
+                if m == 1:
+                    Topic.objects.create(
+                        file=file,
+                        name="/imu",
+                        type="sensor_msgs/msg/Imu",
+                        message_count=1000,
+                        frequency=100,
+                    )
+
+    def tearDown(self):
+        super().tearDown()
+        self._field.storage = self._default_storage
+
+    def get_catalog(self, query: str = "") -> list[dict]:
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse("topic_catalog") + query)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.catalog_queries = [
+            q for q in context.captured_queries if "restapi_topic" in q["sql"]
+        ]
+        return response.data
+
+    def test_catalog(self):
+        camera, imu = self.get_catalog()
+        self.assertEqual(len(self.catalog_queries), 1)
+
+        self.assertEqual(camera["name"], "/camera/front")
+        self.assertEqual(camera["type"], "sensor_msgs/msg/Image")
+        self.assertEqual(camera["file_count"], 4)
+        self.assertEqual(camera["mission_count"], 2)
+        self.assertEqual(camera["message_count"], 400)
+        self.assertEqual(camera["min_frequency"], 10)
+        self.assertEqual(camera["max_frequency"], 21)
+        self.assertAlmostEqual(camera["avg_frequency"], 15.5)
+        self.assertTrue(camera["has_video"])
+
+        self.assertEqual(imu["name"], "/imu")
+        self.assertEqual(imu["file_count"], 2)
+        self.assertEqual(imu["mission_count"], 1)
+        self.assertEqual(imu["message_count"], 2000)
+        self.assertFalse(imu["has_video"])
+
+    def test_filters(self):
+        self.assertEqual([t["name"] for t in self.get_catalog("?name=IMU")], ["/imu"])
+        self.assertEqual(
+            [t["name"] for t in self.get_catalog("?type=sensor_msgs/msg/Image")],
+            ["/camera/front"],
+        )
+
+    def test_cache_invalidation(self):
+        self.get_catalog()
+        self.assertEqual(len(self.get_catalog()), 2)
+        self.assertEqual(len(self.catalog_queries), 0)
+        Topic.objects.filter(name="/imu").delete()
+        self.assertEqual(len(self.get_catalog()), 1)
+
+
+class TopicQueryTestCase(APIAuthTestCase):
+    def setUp(self):
+        super().setUp()
+        # fake storage
+        self._field = File.file.field
+        self._default_storage = self._field.storage
+        self._field.storage = InMemoryStorage()
+
+        # mission: [files: [(topic name, type, frequency)]]
+        missions = {
+            "front_and_imu": [
+                [("/camera/front", "sensor_msgs/msg/Image", 20)],
+                [("/imu", "sensor_msgs/msg/Imu", 200)],
+            ],
+            "slow_front": [
+                [
+                    ("/camera/front", "sensor_msgs/msg/Image", 5),
+                    ("/imu", "sensor_msgs/msg/Imu", 200),
+                ]
+            ],
+            "rear": [[("/camera/rear", "sensor_msgs/msg/Image", 30)]],
+        }
+        for m, (name, files) in enumerate(missions.items()):
+            mission = Mission.objects.create(name=name, date=f"2025-01-0{m + 1}")
+            for f, topics in enumerate(files):
+                file = File.objects.create(
+                    mission=mission,
+                    file=f"{name}/file{f}.mcap",
+                    duration=1,
+                    size=1,
+                    type="train",
+                )
+                for topic, type, frequency in topics:
+                    Topic.objects.create(
+                        file=file,
+                        name=topic,
+                        type=type,
+                        message_count=frequency * 10,
+                        frequency=frequency,
+                    )
+
+        # raise logging level to ERROR
+        self.logger = logging.getLogger("django.request")
+        self.previous_logging_level = self.logger.getEffectiveLevel()
+        self.logger.setLevel(logging.ERROR)
+
+    def tearDown(self):
+        super().tearDown()
+        self._field.storage = self._default_storage
+        self.logger.setLevel(self.previous_logging_level)
+
+    def query(self, url_name: str, query, status_code=status.HTTP_200_OK):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(reverse(url_name), query, format="json")
+        self.assertEqual(response.status_code, status_code)
+        self.topic_queries = [
+            q for q in context.captured_queries if "restapi_topic" in q["sql"]
+        ]
+        return response
+
+    def mission_names(self, query) -> list[str]:
+        response = self.query("query_missions_by_topics", query)
+        return [mission["name"] for mission in response.data]
+
+    def test_and(self):
+        query = {
+            "and": [
+                {
+                    "name": "/camera/front",
+                    "type": "sensor_msgs/msg/Image",
+                    "min_frequency": 15,
+                },
+                {"type": "sensor_msgs/msg/Imu"},
+            ]
+        }
+        self.assertEqual(self.mission_names(query), ["front_and_imu"])
+        # the predicates are evaluated in the same query as the missions
+        self.assertEqual(len(self.topic_queries), 1)
+
+    def test_or(self):
+        query = {"or": [{"name": "/camera/rear"}, {"max_frequency": 10}]}
+        self.assertEqual(self.mission_names(query), ["slow_front", "rear"])
+
+    def test_nested(self):
+        query = {
+            "and": [
+                {"type": "sensor_msgs/msg/Image"},
+                {"or": [{"name": "/imu", "min_message_count": 1000}, {"name": "x"}]},
+            ]
+        }
+        self.assertEqual(self.mission_names(query), ["front_and_imu", "slow_front"])
+
+    def test_single_predicate(self):
+        self.assertEqual(
+            self.mission_names({"type": "sensor_msgs/msg/Image"}),
+            ["front_and_imu", "slow_front", "rear"],
+        )
+
+    def test_files(self):
+        query = {"and": [{"name": "/camera/front"}, {"name": "/imu"}]}
+        response = self.query("query_files_by_topics", query)
+        self.assertEqual(
+            [file["file_path"] for file in response.data], ["slow_front/file0.mcap"]
+        )
+
+    def test_ordering_and_pagination(self):
+        response = self.client.post(
+            reverse("query_missions_by_topics") + "?ordering=-date&page_size=2",
+            {"type": "sensor_msgs/msg/Image"},
+            format="json",
+        )
+        self.assertEqual(
+            [mission["name"] for mission in response.data["results"]],
+            ["rear", "slow_front"],
+        )
+        self.assertIsNotNone(response.data["next"])
+
+    def test_invalid(self):
+        too_deep = {"name": "/imu"}
+        for _ in range(TopicQuerySerializer.max_depth + 1):
+            too_deep = {"and": [too_deep]}
+        for query in [
+            [],
+            {},
+            {"and": []},
+            {"and": [{"name": "/imu"}], "name": "/imu"},
+            {"or": {"name": "/imu"}},
+            {"frequency": 10},
+            {"min_frequency": "fast"},
+            too_deep,
+            {"or": [{"name": str(i)} for i in range(51)]},
+        ]:
+            with self.subTest(query=query):
+                self.query(
+                    "query_missions_by_topics", query, status.HTTP_400_BAD_REQUEST
+                )
+
+
+class MissionExportTestCase(APIAuthTestCase):
+    def setUp(self):
+        super().setUp()
+        # fake storages
+        self._file_field = File.file.field
+        self._video_field = Topic.video.field
+        self._default_storages = (self._file_field.storage, self._video_field.storage)
+        self.storage = InMemoryStorage()
+        self._file_field.storage = self.storage
+        self._video_field.storage = self.storage
+
+        self.mission = Mission.objects.create(
+            name="Export", date="2025-02-03", location="Field", notes="rainy"
+        )
+        Mission_tags.objects.create(
+            mission=self.mission, tag=Tag.objects.create(name="outdoor")
+        )
+        self.folder = "2025.02.03_Export"
+        self.contents = {
+            f"{self.folder}/train/bag1/bag1.mcap": b"mcap" * 50000,
+            f"{self.folder}/train/bag1/metadata.yaml": b"rosbag2_bagfile_information:",
+            f"{self.folder}/train/bag1/-camera.mp4": b"video",
+            f"{self.folder}/test/bag2/bag2.mcap": b"",
+        }
+        for name, content in self.contents.items():
+            self.storage.save(name, ContentFile(content))
+        for name in [
+            f"{self.folder}/train/bag1/bag1.mcap",
+            f"{self.folder}/test/bag2/bag2.mcap",
+        ]:
+            File.objects.create(
+                mission=self.mission, file=name, size=1, duration=1, type="train"
+            )
+        Topic.objects.create(
+            file=File.objects.get(file=f"{self.folder}/train/bag1/bag1.mcap"),
+            name="/camera",
+            type="sensor_msgs/msg/Image",
+            message_count=1,
+            frequency=1,
+            video=f"{self.folder}/train/bag1/-camera.mp4",
+        )
+
+    def tearDown(self):
+        super().tearDown()
+        self._file_field.storage, self._video_field.storage = self._default_storages
+
+    def export(self, **params) -> bytes:
+        response = self.client.get(
+            reverse("export_mission", kwargs={"pk": self.mission.id}), params
+        )
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_zip(self):
+        response = self.export()
+        self.assertEqual(response["Content-Type"], "application/zip")
+        self.assertIn(f'filename="{self.folder}.zip"', response["Content-Disposition"])
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content)))
+        self.assertEqual(archive.testzip(), None)
+        self.assertEqual(
+            archive.namelist(),
+            [
+                f"{self.folder}/Export_metadata.json",
+                f"{self.folder}/test/bag2/bag2.mcap",
+                f"{self.folder}/train/bag1/bag1.mcap",
+                f"{self.folder}/train/bag1/metadata.yaml",
+            ],
+        )
+        for info in archive.infolist():
+            self.assertEqual(info.compress_type, zipfile.ZIP_STORED)
+            if info.filename in self.contents:
+                self.assertEqual(
+                    archive.read(info), self.contents[info.filename], info.filename
+                )
+        self.assertEqual(
+            json.loads(archive.read(f"{self.folder}/Export_metadata.json")),
+            {
+                "location": "Field",
+                "notes": "rainy",
+                "tags": [{"name": "outdoor", "color": "#FFFFFF"}],
+            },
+        )
+
+    def test_tar_with_videos(self):
+        response = self.export(archive="tar", videos="true")
+        self.assertEqual(response["Content-Type"], "application/x-tar")
+        data = b"".join(response.streaming_content)
+        self.assertEqual(len(data) % tarfile.RECORDSIZE, 0)
+        archive = tarfile.open(fileobj=io.BytesIO(data))
+        names = archive.getnames()
+        self.assertIn(f"{self.folder}/train/bag1/-camera.mp4", names)
+        self.assertEqual(len(names), 5)
+        for name, content in self.contents.items():
+            self.assertEqual(archive.extractfile(name).read(), content)
+
+    def test_streamed_in_chunks(self):
+        # the archive is yielded while the files are read (in chunks of 64 KiB),
+        # not as a whole
+        for archive in ["zip", "tar"]:
+            with self.subTest(archive=archive):
+                chunks = list(self.export(archive=archive).streaming_content)
+                self.assertLessEqual(max(len(chunk) for chunk in chunks), 65 * 1024)
+
+    def test_errors(self):
+        url = reverse("export_mission", kwargs={"pk": self.mission.id})
+        response = self.client.get(url, {"archive": "rar"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse("export_mission", kwargs={"pk": 0}))
+        self.assertEqual(response.status_code, 404)
@@ -1,5 +1,10 @@
 from django.urls import include, path
 from .views import (
+    batch_add_tags_to_missions,
+    batch_remove_tags_from_missions,
+    batch_update_missions,
+    batch_update_robots,
+    cache_stats,
     denied_topics,
     denied_topics_create,
     denied_topics_delete,
@@ -7,6 +12,12 @@ from .views import (
     create_mission,
     get_topics_from_files,
     mission_detail,
+    mission_bundle,
+    export_mission,
+    search_missions,
+    query_files_by_topics,
+    query_missions_by_topics,
+    topic_catalog,
     get_tags,
     create_tag,
     tag_detail,
@@ -23,7 +34,16 @@ from .views import (
 urlpatterns = [
     path("missions/", get_missions, name="get_missions"),
     path("missions/create/", create_mission, name="create_mission"),
+    path("missions/search/", search_missions, name="search_missions"),
+    path(
+        "missions/topic-query/",
+        query_missions_by_topics,
+        name="query_missions_by_topics",
+    ),
+    path("missions/batch/", batch_update_missions, name="batch_update_missions"),
     path("missions/<int:pk>", mission_detail, name="mission_detail"),
+    path("missions/<int:pk>/bundle", mission_bundle, name="mission_bundle"),
+    path("missions/<int:pk>/export", export_mission, name="export_mission"),
     path(
         "missions/tags/<int:id>",
         TagByMissionAPI.as_view(),
@@ -38,6 +58,16 @@ urlpatterns = [
         name="get_missions_by_tag",
     ),
     path("mission-tags/create/", add_tag_to_mission, name="add_tag_to_mission"),
+    path(
+        "mission-tags/batch/create/",
+        batch_add_tags_to_missions,
+        name="batch_add_tags_to_missions",
+    ),
+    path(
+        "mission-tags/batch/delete/",
+        batch_remove_tags_from_missions,
+        name="batch_remove_tags_from_missions",
+    ),
     path(
         "mission-tags/delete/<int:mission_id>/<str:tag_name>",
         delete_mission_tag,
@@ -54,6 +84,7 @@ urlpatterns = [
         get_topics_from_files,
         name="get_topics_from_files",
     ),
+    path("topics-catalog/", topic_catalog, name="topic_catalog"),
     path(
         "topics-names",
         denied_topics,
@@ -74,6 +105,9 @@ urlpatterns = [
         set_was_modified,
         name="set_was_modified",
     ),
+    path("files/topic-query/", query_files_by_topics, name="query_files_by_topics"),
+    path("files/update-robot/", batch_update_robots, name="batch_update_robots"),
     path("file/<path:file_path>/update-robot/", update_robot, name="update_robot"),
     path("file/<path:file_path>", get_file_by_path, name="get_file_by_path"),
+    path("cache-stats/", cache_stats, name="cache_stats"),
 ]
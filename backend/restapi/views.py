@@ -1,3 +1,6 @@
+from django.http import StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from rest_framework.decorators import api_view
 from rest_framework import generics
 from rest_framework.response import Response
@@ -11,25 +14,160 @@ from .models import (
     Mission_tags,
     Topic,
 )
+from . import batch, download_tokens, export, search
+from .cache import cached_response, get_stats, get_versions
+from .pagination import FilePagination, MissionPagination, TagPagination
 from .serializer import (
     DeniedTopicNameSerializer,
     FileSerializer,
     TagSerializer,
+    MissionBatchItemSerializer,
+    MissionBundleSerializer,
+    MissionExportSerializer,
+    MissionFilterSerializer,
+    MissionSearchSerializer,
     MissionSerializer,
     MissionWasModifiedSerializer,
+    MissionTagBatchItemSerializer,
     MissionTagSerializer,
+    RobotBatchItemSerializer,
+    TopicCatalogSerializer,
+    TopicQuerySerializer,
     TopicSerializer,
 )
+import hashlib
 import urllib.parse
 
 
+def versions_etag(*models, signed_urls: bool = False):
+    """
+    Creates an etag function for django's condition decorator.\
+    The ETag is derived from the version stamps of the given models and the
+    requested url, so unchanged data can be answered with 304 without serializing.
+
+    Args:
+        models: models the response depends on
+        signed_urls (bool, optional): include the expiry step of the download tokens
+            in the ETag, for responses containing signed download urls.
+            Defaults to False.
+
+    Returns:
+        function returning the ETag for GET and HEAD requests or None
+    """
+
+    def etag_func(request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD"):
+            return None
+        versions = get_versions(request, *models)
+        key = f"{request.get_full_path()}|{versions}"
+        if signed_urls:
+            key += f"|{download_tokens.current_step()}"
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    return etag_func
+
+
 @api_view(["GET"])
+@condition(etag_func=versions_etag(Mission, File, Tag, Mission_tags))
+@cached_response(Mission, File, Tag, Mission_tags)
 def get_missions(request):
-    missions = Mission.objects.all()
+    """
+    List all missions, optionally filtered
+    ### Parameters
+    request: GET request, optionally with `ordering`, `page_size` and `cursor` parameters
+    and the filter parameters of MissionFilterSerializer
+    ### Returns
+    List of missions in json format\
+    Or a page of missions with the link to the next page if pagination is requested\
+    Or HTTP_400_BAD_REQUEST if a filter is invalid
+    """
+    filters = MissionFilterSerializer(data=request.query_params)
+    filters.is_valid(raise_exception=True)
+    missions = Mission.objects.apply_filters(**filters.validated_data)
+    paginator = MissionPagination()
+    missions = paginator.order_queryset(missions, request)
+    page = paginator.paginate_queryset(missions, request)
+    if page is not None:
+        serializer = MissionSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+    serializer = MissionSerializer(missions, many=True)
+    return Response(serializer.data)
+
+
+@api_view(["GET"])
+@condition(etag_func=versions_etag(Mission, File, Tag, Mission_tags, Topic))
+@cached_response(Mission, File, Tag, Mission_tags, Topic)
+def search_missions(request):
+    """
+    Full text search over mission name, location, notes, tag names and topic names
+    ### Parameters
+    request: GET request with the search words as `q` and optionally `limit`
+    ### Returns
+    List of matching missions in json format, best match first\
+    Or HTTP_400_BAD_REQUEST if `q` is missing
+    """
+    params = MissionSearchSerializer(data=request.query_params)
+    params.is_valid(raise_exception=True)
+    ids = search.search_missions(
+        params.validated_data["q"], params.validated_data["limit"]
+    )
+    missions = Mission.objects.in_bulk(ids)
+    serializer = MissionSerializer(
+        [missions[id] for id in ids if id in missions], many=True
+    )
+    return Response(serializer.data)
+
+
+@api_view(["POST"])
+def query_missions_by_topics(request):
+    """
+    List the missions containing topics that match a query
+    ### Parameters
+    request: POST request with a query of TopicQuerySerializer as data,
+    optionally with `ordering`, `page_size` and `cursor` parameters
+    ### Returns
+    List of missions in json format\
+    Or a page of missions with the link to the next page if pagination is requested\
+    Or HTTP_400_BAD_REQUEST if the query is invalid
+    """
+    query = TopicQuerySerializer(data=request.data)
+    query.is_valid(raise_exception=True)
+    missions = Mission.objects.with_topics(query.validated_data)
+    paginator = MissionPagination()
+    missions = paginator.order_queryset(missions, request)
+    page = paginator.paginate_queryset(missions, request)
+    if page is not None:
+        serializer = MissionSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
     serializer = MissionSerializer(missions, many=True)
     return Response(serializer.data)
 
 
+@api_view(["POST"])
+def query_files_by_topics(request):
+    """
+    List the files containing topics that match a query
+    ### Parameters
+    request: POST request with a query of TopicQuerySerializer as data,
+    optionally with `ordering`, `page_size` and `cursor` parameters
+    ### Returns
+    List of files in json format\
+    Or a page of files with the link to the next page if pagination is requested\
+    Or HTTP_400_BAD_REQUEST if the query is invalid
+    """
+    query = TopicQuerySerializer(data=request.data)
+    query.is_valid(raise_exception=True)
+    files = File.objects.with_topics(query.validated_data)
+    paginator = FilePagination()
+    files = paginator.order_queryset(files, request)
+    page = paginator.paginate_queryset(files, request)
+    if page is not None:
+        serializer = FileSerializer(page, many=True, context={"request": request})
+        return paginator.get_paginated_response(serializer.data)
+    serializer = FileSerializer(files, many=True, context={"request": request})
+    return Response(serializer.data)
+
+
 @api_view(["PUT"])
 def set_was_modified(request, pk):
     try:
@@ -58,6 +196,8 @@ def create_mission(request):
 
 
 @api_view(["GET", "PUT", "DELETE"])
+@condition(etag_func=versions_etag(Mission, File))
+@cached_response(Mission, File)
 def mission_detail(request, pk):
     try:
         mission = Mission.objects.get(pk=pk)
@@ -81,6 +221,58 @@ def mission_detail(request, pk):
 
 
 @api_view(["GET"])
+@condition(
+    etag_func=versions_etag(Mission, File, Tag, Mission_tags, Topic, signed_urls=True)
+)
+@cached_response(Mission, File, Tag, Mission_tags, Topic, signed_urls=True)
+def mission_bundle(request, pk):
+    """
+    Get a mission with its tags, files and the topics of every file in one response
+    ### Returns
+    json of the mission with the additional fields `tags` and `files`,
+    every file contains its `topics`\\
+    Or NotFound exception
+    """
+    try:
+        mission = Mission.objects.bundle().get(pk=pk)
+    except Mission.DoesNotExist:
+        raise NotFound(f"Mission with ID {pk} not found")
+    serializer = MissionBundleSerializer(mission, context={"request": request})
+    return Response(serializer.data)
+
+
+@api_view(["GET"])
+def export_mission(request, pk):
+    """
+    Download a whole mission folder as one archive, built while it is sent
+    ### Parameters
+    request: GET request with optionally `archive` (`zip` or `tar`, default `zip`)
+    and `videos` (`true` to include the videos)
+    ### Returns
+    streamed archive of the mission folder\\
+    Or NotFound exception
+    """
+    params = MissionExportSerializer(data=request.query_params)
+    params.is_valid(raise_exception=True)
+    try:
+        mission = Mission.objects.get(pk=pk)
+    except Mission.DoesNotExist:
+        raise NotFound(f"Mission with ID {pk} not found")
+
+    archive_format = params.validated_data["archive"]
+    entries = export.mission_entries(mission, params.validated_data["videos"])
+    response = StreamingHttpResponse(
+        export.stream_archive(entries, archive_format),
+        content_type=export.CONTENT_TYPES[archive_format],
+    )
+    response["Content-Disposition"] = (
+        f'attachment; filename="{export.mission_folder(mission)}.{archive_format}"'
+    )
+    return response
+
+
+@api_view(["GET"])
+@cached_response(Mission, File, signed_urls=True)
 def get_files_by_mission_id(request, mission_id):
     """
     List all files with type of a mission by ID
@@ -92,12 +284,18 @@ def get_files_by_mission_id(request, mission_id):
         mission = Mission.objects.get(id=mission_id)
     except Mission.DoesNotExist:
         raise NotFound(f"Mission with ID {mission_id} not found")
-    files = File.objects.filter(mission=mission)
+    paginator = FilePagination()
+    files = paginator.order_queryset(File.objects.filter(mission=mission), request)
+    page = paginator.paginate_queryset(files, request)
+    if page is not None:
+        serializer = FileSerializer(page, many=True, context={"request": request})
+        return paginator.get_paginated_response(serializer.data)
     serializer = FileSerializer(files, many=True, context={"request": request})
     return Response(serializer.data, status=status.HTTP_200_OK)
 
 
 @api_view(["GET"])
+@cached_response(File, signed_urls=True)
 def get_file_by_path(request, file_path: str):
     """
     Get info about one file
@@ -115,6 +313,8 @@ def get_file_by_path(request, file_path: str):
 
 
 @api_view(["GET"])
+@condition(etag_func=versions_etag(File, Topic, signed_urls=True))
+@cached_response(File, Topic, signed_urls=True)
 def get_topics_from_files(request, file_path):
     """
     List all topics of a file
@@ -130,6 +330,27 @@ def get_topics_from_files(request, file_path):
     return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+@api_view(["GET"])
+@condition(etag_func=versions_etag(File, Topic))
+@cached_response(File, Topic)
+def topic_catalog(request):
+    """
+    List every distinct topic name and type of all files with statistics
+    ### Parameters
+    request: GET request, optionally with `name` (substring) and `type` parameters
+    ### Returns
+    List of topics with the number of files and missions containing them,
+    the total message count, min, max and average frequency and if a video exists
+    """
+    topics = Topic.objects.all()
+    if name := request.query_params.get("name"):
+        topics = topics.filter(name__icontains=name)
+    if type := request.query_params.get("type"):
+        topics = topics.filter(type=type)
+    serializer = TopicCatalogSerializer(topics.catalog(), many=True)
+    return Response(serializer.data)
+
+
 @api_view(["PUT"])
 def update_robot(request, file_path):
     """
@@ -153,6 +374,7 @@ def update_robot(request, file_path):
 
 
 @api_view(["GET"])
+@cached_response(Denied_topics)
 def denied_topics(request):
     """
     List all denied topic names
@@ -201,13 +423,21 @@ def denied_topics_delete(request, name):
 
 
 @api_view(["GET"])
+@condition(etag_func=versions_etag(Tag))
+@cached_response(Tag)
 def get_tags(request):
     """
     List all tags in database
     ### Returns
-    List of tags in json format as ResponseFileByMissionAPI,
+    List of tags in json format as ResponseFileByMissionAPI,\
+    Or a page of tags with the link to the next page if pagination is requested
     """
-    tags = Tag.objects.all()
+    paginator = TagPagination()
+    tags = paginator.order_queryset(Tag.objects.all(), request)
+    page = paginator.paginate_queryset(tags, request)
+    if page is not None:
+        serializer = TagSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
     serializer = TagSerializer(tags, many=True)
     return Response(serializer.data)
 
@@ -265,6 +495,10 @@ class MissionByTagAPI(generics.ListAPIView):
     serializer_class = MissionSerializer
     name = "Get Missions by Tag"
 
+    @method_decorator(cached_response(Mission, File, Tag, Mission_tags))
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
     def get_queryset(self):
         """
         Lists Missions that have a Tag with a given name
@@ -278,16 +512,18 @@ class MissionByTagAPI(generics.ListAPIView):
             tag = Tag.objects.get(name=name)
         except Tag.DoesNotExist:
             raise NotFound(f"Tag with name {self.kwargs['name']} not found")
-        mission_ids = Mission_tags.objects.filter(tag=tag).values_list(
-            "mission_id", flat=True
-        )
-        return Mission.objects.filter(id__in=mission_ids)
+        return Mission.objects.filter(mission_tags__tag=tag).order_by("id")
 
 
 class TagByMissionAPI(generics.ListAPIView):
     serializer_class = TagSerializer
     name = "Get Tags by Mission id"
 
+    @method_decorator(condition(etag_func=versions_etag(Mission, Tag, Mission_tags)))
+    @method_decorator(cached_response(Mission, Tag, Mission_tags))
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
     def get_queryset(self):
         """
         List Tags of a Mission
@@ -370,3 +606,110 @@ def delete_mission_tag(request, mission_id, tag_name):
     return Response(
         {"success": "Mission_tags entry deleted."}, status=status.HTTP_204_NO_CONTENT
     )
+
+
+MAX_BATCH_SIZE = 1000
+
+
+def _run_batch(request, item_serializer, operation):
+    """
+    Validates every item of a batch request and applies the valid ones with operation
+    ### Parameters
+    request: request containing a json list of items\\
+    item_serializer: serializer class to validate one item\\
+    operation: function of restapi.batch applying a list of validated items
+    ### Returns
+    json with one result per item in the same order\\
+    Or HTTP_400_BAD_REQUEST if the body is not a list or too long
+    """
+    items = request.data
+    if not isinstance(items, list):
+        return Response(
+            {"error": "Expected a list of items"}, status=status.HTTP_400_BAD_REQUEST
+        )
+    if len(items) > MAX_BATCH_SIZE:
+        return Response(
+            {"error": f"At most {MAX_BATCH_SIZE} items per request"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    results = [None] * len(items)
+    valid_items = []
+    valid_indices = []
+    for i, item in enumerate(items):
+        serializer = item_serializer(data=item)
+        if serializer.is_valid():
+            valid_items.append(serializer.validated_data)
+            valid_indices.append(i)
+        else:
+            results[i] = {"status": "invalid", "errors": serializer.errors}
+
+    if valid_items:
+        for i, result in zip(valid_indices, operation(valid_items)):
+            results[i] = result
+    return Response({"results": results}, status=status.HTTP_200_OK)
+
+
+@api_view(["POST"])
+def batch_add_tags_to_missions(request):
+    """
+    Assign many tags to missions in one transaction.
+    Creates tags that don't exist yet.
+    ### Parameters
+    request: POST request containing a list of json objects with mission_id and tag_name
+    ### Returns
+    json with one result per item with the status
+    "created", "exists", "not_found" or "invalid"
+    """
+    return _run_batch(
+        request, MissionTagBatchItemSerializer, batch.add_tags_to_missions
+    )
+
+
+@api_view(["POST"])
+def batch_remove_tags_from_missions(request):
+    """
+    Remove many tags from missions in one transaction
+    ### Parameters
+    request: POST request containing a list of json objects with mission_id and tag_name
+    ### Returns
+    json with one result per item with the status "deleted", "not_found" or "invalid"
+    """
+    return _run_batch(
+        request, MissionTagBatchItemSerializer, batch.remove_tags_from_missions
+    )
+
+
+@api_view(["PUT"])
+def batch_update_robots(request):
+    """
+    Set the robot of many files in one transaction
+    ### Parameters
+    request: PUT request containing a list of json objects with file_path and robot
+    ### Returns
+    json with one result per item with the status "updated", "not_found" or "invalid"
+    """
+    return _run_batch(request, RobotBatchItemSerializer, batch.update_robots)
+
+
+@api_view(["PUT"])
+def batch_update_missions(request):
+    """
+    Change fields of many missions in one transaction
+    ### Parameters
+    request: PUT request containing a list of json objects with the mission id and
+    the fields to change (name, date, location, notes)
+    ### Returns
+    json with one result per item with the status "updated", "not_found" or "invalid"
+    """
+    return _run_batch(request, MissionBatchItemSerializer, batch.update_missions)
+
+
+@api_view(["GET"])
+def cache_stats(request):
+    """
+    Counters of the REST API response cache
+    ### Returns
+    json with the number of cache hits, misses and invalidations
+    """
+    return Response(get_stats())
@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class SearchIndexConfig(AppConfig):
+    """
+    Tables of the full text search over missions, see restapi.search.\\
+    The app has no models, so its hand-written migrations are kept separate from
+    the migrations of restapi, which are generated with makemigrations.
+    """
+
+    name = "search_index"
@@ -0,0 +1,53 @@
+from django.db import migrations
+
+
+class RunSQLOnVendor(migrations.RunSQL):
+    """RunSQL only on databases of one vendor"""
+
+    def __init__(self, vendor: str, *args, **kwargs):
+        self.vendor = vendor
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, args, kwargs = super().deconstruct()
+        return name, args, {"vendor": self.vendor, **kwargs}
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == self.vendor:
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == self.vendor:
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+def index_missions(apps, schema_editor):
+    # missions added before the search index existed
+    from restapi.search import rebuild_index
+
+    rebuild_index(schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+    dependencies = [("restapi", "__first__")]
+
+    # IF NOT EXISTS: databases migrated before this migration already have the tables
+    operations = [
+        RunSQLOnVendor(
+            "postgresql",
+            sql=[
+                "CREATE TABLE IF NOT EXISTS restapi_mission_search ("
+                "mission_id integer PRIMARY KEY, document tsvector NOT NULL)",
+                "CREATE INDEX IF NOT EXISTS restapi_mission_search_document_idx "
+                "ON restapi_mission_search USING GIN (document)",
+            ],
+            reverse_sql="DROP TABLE IF EXISTS restapi_mission_search",
+        ),
+        RunSQLOnVendor(
+            "sqlite",
+            sql="CREATE VIRTUAL TABLE IF NOT EXISTS restapi_mission_search USING fts5("
+            "name, tags, topics, location, notes, tokenize='porter unicode61')",
+            reverse_sql="DROP TABLE IF EXISTS restapi_mission_search",
+        ),
+        migrations.RunPython(index_missions, migrations.RunPython.noop),
+    ]